@@ -0,0 +1,17 @@
+from fairing.architectures.architecture import TrainingArchitecture
+from fairing.backend.local import LocalBackend
+
+
+class LocalProcessArchitecture(TrainingArchitecture):
+    """Runs the training on this machine, one process per run of the strategy"""
+
+    def __init__(self, max_workers=None, pin_cpus=True):
+        self.max_workers = max_workers
+        self.pin_cpus = pin_cpus
+
+    def add_jobs(self, svc, count, repository, image_name, image_tag, volumes, volume_mounts):
+        # Nothing gets deployed, the runs are started by the backend
+        return svc
+
+    def get_associated_backend(self):
+        return LocalBackend(max_workers=self.max_workers, pin_cpus=self.pin_cpus)
@@ -1,11 +1,15 @@
 from fairing.backend.kubeflow import KubeflowBackend
 from fairing.backend.native import NativeBackend
+from fairing.backend.local import LocalBackend
 
 Kubeflow = 'kubeflow'
 Native = 'native'
+Local = 'local'
 
 def get_backend(backend):
     if backend == Kubeflow:
         return KubeflowBackend()
     if backend == Native:
-        return NativeBackend()
\ No newline at end of file
+        return NativeBackend()
+    if backend == Local:
+        return LocalBackend()
\ No newline at end of file
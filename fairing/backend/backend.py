@@ -7,8 +7,8 @@ class Backend:
     def add_tensorboard(self, svc, name, tensorboard_options):
         raise NotImplementedError()
 
-    def compile_serving_ast(self, img, name, port, replicas):
+    def compile_serving_ast(self, img, name, port, replicas, readiness_route=None):
         raise NotImplementedError()
 
-    def stream_logs(self, image_name, image_tag):
+    def stream_logs(self, image_name, image_tag, deployer=None):
         raise NotImplementedError()
\ No newline at end of file
@@ -0,0 +1,143 @@
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+import traceback
+
+from fairing.backend.backend import Backend
+
+logger = logging.getLogger('fairing')
+
+
+class LocalBackend(Backend):
+    """Runs every run of a training strategy in its own process on this machine,
+    no image is built and nothing is deployed.
+
+    At most max_workers runs execute at the same time, each worker slot being
+    pinned to its own share of the CPUs when pin_cpus is set."""
+
+    def __init__(self, max_workers=None, pin_cpus=True):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.pin_cpus = pin_cpus
+
+    def add_tensorboard(self, svc, name, tensorboard_options):
+        # Tensorboard can be started locally on the log directory
+        return svc, None, None
+
+    def stream_logs(self, image_name, image_tag, deployer=None):
+        # Logs of local runs are streamed while they run
+        pass
+
+    def get_cpu_sets(self, workers):
+        """Splits the CPUs available to this process between the worker slots"""
+        if not self.pin_cpus or not hasattr(os, 'sched_getaffinity'):
+            return [None] * workers
+        cpus = sorted(os.sched_getaffinity(0))
+        if len(cpus) < workers:
+            return [None] * workers
+        size = len(cpus) // workers
+        return [set(cpus[i * size:(i + 1) * size]) for i in range(workers)]
+
+    def run_training(self, strategy, user_object, name='fairing-job'):
+        """Runs strategy.exec_user_code once per run, raises if any run failed"""
+        self.check_stores(strategy)
+        # User classes are usually defined in a notebook or a script and can't be pickled,
+        # forked processes inherit them instead. Each run gets a fresh process since
+        # strategies keep the state of their run.
+        ctx = multiprocessing.get_context('fork')
+        workers = min(self.max_workers, strategy.runs)
+        free_slots = list(zip(range(workers), self.get_cpu_sets(workers)))
+        # Notified every time a run exits
+        done = threading.Condition()
+        running = {}
+        exit_codes = {}
+
+        def wait(process, slot, log_thread):
+            process.join()
+            log_thread.join()
+            with done:
+                exit_codes[process.name] = process.exitcode
+                del running[process.name]
+                free_slots.append(slot)
+                done.notify()
+
+        for run_id in range(strategy.runs):
+            with done:
+                while not free_slots:
+                    done.wait()
+                slot = free_slots.pop(0)
+
+            run_name = '{}-{}'.format(name, run_id)
+            read_fd, write_fd = os.pipe()
+            process = ctx.Process(name=run_name, target=_run,
+                                  args=(strategy, user_object, run_name, slot[1], write_fd))
+            process.start()
+            os.close(write_fd)
+            log_thread = threading.Thread(target=_prefix_logs, args=(read_fd, run_name))
+            log_thread.daemon = True
+            log_thread.start()
+            with done:
+                running[run_name] = process
+            threading.Thread(target=wait, args=(process, slot, log_thread)).start()
+
+        with done:
+            while running:
+                done.wait()
+
+        failed = sorted(run for run, code in exit_codes.items() if code != 0)
+        if failed:
+            raise RuntimeError('{} of {} runs failed: {}'.format(
+                len(failed), strategy.runs, ', '.join(
+                    '{} (exit code {})'.format(run, exit_codes[run]) for run in failed)))
+        logger.warn('{} runs completed.'.format(strategy.runs))
+
+    def check_stores(self, strategy):
+        """Raises if the runs of strategy can't share their state, before any is started"""
+        get_stores = getattr(strategy, 'get_stores', None)
+        if not callable(get_stores):
+            return
+        for store in get_stores():
+            # Deployed strategies default to a Redis service, there is none locally
+            if store is None:
+                raise ValueError('{} needs a store shared between its runs to run locally, '
+                                 'i.e. MemoryScoreboard.shared() or MemoryTrialStore.shared().'.format(
+                                     type(strategy).__name__))
+            # Every run is a forked process, they would each get their own copy
+            if not store.is_shared():
+                raise ValueError('{} is only shared between threads, use {}.shared() to share it '
+                                 'between the runs.'.format(type(store).__name__, type(store).__name__))
+
+
+def _run(strategy, user_object, run_name, cpus, log_fd):
+    # Everything the run writes goes through its parent, which prefixes it
+    os.dup2(log_fd, 1)
+    os.dup2(log_fd, 2)
+    os.close(log_fd)
+    sys.stdout = open(1, 'w', buffering=1, closefd=False)
+    sys.stderr = open(2, 'w', buffering=1, closefd=False)
+    os.environ['FAIRING_RUNTIME'] = '1'
+    # Identifies the member of the population, like the pod name does on kubernetes
+    os.environ['HOSTNAME'] = run_name
+    if cpus:
+        os.sched_setaffinity(0, cpus)
+
+    exit_code = 0
+    try:
+        # The run is the training, train must not start it again
+        user_object.is_training_initialized = True
+        strategy.exec_user_code(user_object)
+    except BaseException:
+        traceback.print_exc()
+        exit_code = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+    os._exit(exit_code)
+
+
+def _prefix_logs(fd, run_name):
+    with os.fdopen(fd, 'rb') as logs:
+        for line in logs:
+            sys.stdout.write('[{}] {}'.format(run_name, line.decode('utf8', errors='replace')))
+            sys.stdout.flush()
@@ -42,7 +42,7 @@ class NativeBackend(Backend):
         }
         return svc, volumes, volumeMounts
 
-    def compile_serving_ast(self, img, name, port, replicas):
+    def compile_serving_ast(self, img, name, port, replicas, readiness_route=None):
         svc = {
             "name": name,
             "guid": 456789,
@@ -64,6 +64,11 @@ class NativeBackend(Backend):
                 }],
             }
         ]
+        if readiness_route:
+            # Traffic is only routed to replicas that loaded their model
+            svc["services"][0]["containers"][0]["readinessProbe"] = {
+                "httpGet": {"path": readiness_route, "port": port}
+            }
 
         svc["serve"] = {
             "name": "{}-fairing-serving".format(name),
@@ -71,6 +76,6 @@ class NativeBackend(Backend):
         }
         return svc
     
-    def stream_logs(self, image_name, image_tag):
-        mp_client = MetaparticleClient()
+    def stream_logs(self, image_name, image_tag, deployer=None):
+        mp_client = deployer or MetaparticleClient()
         mp_client.logs("{name}-{tag}".format(name=image_name, tag=image_tag))
@@ -1,5 +1,6 @@
 from enum import Enum
 
+from fairing.builders.container_image_builder import ContainerImageBuilder
 from fairing.builders.docker import DockerBuilder
 from fairing.builders.knative import KnativeBuilder
 from fairing.utils import is_running_in_k8s
@@ -11,7 +12,11 @@ class Builders(Enum):
 def get_container_builder(builder_str=None):
     if builder_str == None:
         return get_default_container_builder()
-    
+
+    # Already configured builder, i.e. DockerBuilder(dependency_layers=True)
+    if isinstance(builder_str, ContainerImageBuilder):
+        return builder_str
+
     try:
         builder = Builders[builder_str.upper()]
     except KeyError:
@@ -5,4 +5,8 @@ class ContainerImageBuilder(object):
     __metaclass__ = metacclass=ABCMeta
 
     @abstractmethod
-    def execute(self, repository, image_name, image_tag, base_image, dockerfile, publish, env): pass
\ No newline at end of file
+    def execute(self, repository, image_name, image_tag, base_image, dockerfile, publish, env): pass
+
+    def image_exists(self, repository, image_name, image_tag, publish):
+        """Returns True if the image was already built (and published if requested)"""
+        return False
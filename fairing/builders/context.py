@@ -0,0 +1,200 @@
+import hashlib
+import json
+import os
+import re
+import tarfile
+import tempfile
+import logging
+
+logger = logging.getLogger('fairing')
+
+# Files and directories fairing never sends as part of the build context,
+# wherever they are in the tree.
+FAIRING_IGNORED = ['.git', '.metaparticle', '__pycache__', '.ipynb_checkpoints']
+
+# Files that are not part of the image content when computing a digest.
+# The Dockerfile is regenerated on every build and its content is hashed separately.
+DIGEST_IGNORED = FAIRING_IGNORED + ['Dockerfile']
+
+# Length of the tags derived from the build context
+TAG_LENGTH = 16
+
+# Build contexts bigger than this are spilled to disk instead of being kept in memory
+MAX_IN_MEMORY_CONTEXT_SIZE = 128 * 1024 * 1024
+
+
+class IgnoreRules(object):
+    """Decides which files are excluded from the build context.
+    Combines fairing's ignore list with the patterns of a .dockerignore file"""
+
+    def __init__(self, names=None, patterns=None):
+        self.names = FAIRING_IGNORED if names is None else names
+        # List of (pattern, negated) tuples, the last matching pattern wins
+        self.patterns = []
+        for pattern in patterns or []:
+            pattern = pattern.strip()
+            if not pattern or pattern.startswith('#'):
+                continue
+            negated = pattern.startswith('!')
+            if negated:
+                pattern = pattern[1:].strip()
+            pattern = os.path.normpath(pattern.lstrip('/'))
+            self.patterns.append((pattern_to_regex(pattern), negated))
+
+    @classmethod
+    def from_context(cls, context_dir='.', names=None):
+        patterns = []
+        dockerignore = os.path.join(context_dir, '.dockerignore')
+        if os.path.isfile(dockerignore):
+            with open(dockerignore, 'r') as f:
+                patterns = f.read().splitlines()
+        return cls(names=names, patterns=patterns)
+
+    def has_negations(self):
+        return any(negated for _, negated in self.patterns)
+
+    def is_ignored(self, rel_path):
+        parts = rel_path.split(os.sep)
+        if any(part in self.names for part in parts):
+            return True
+
+        ignored = False
+        for pattern, negated in self.patterns:
+            # A pattern matching a directory also matches everything below it
+            prefixes = [os.sep.join(parts[:i]) for i in range(1, len(parts) + 1)]
+            if any(pattern.match(p) for p in prefixes):
+                ignored = not negated
+        return ignored
+
+
+def pattern_to_regex(pattern):
+    """Translates a .dockerignore pattern to a regex.
+    Unlike fnmatch, '*' and '?' don't match path separators, '**' matches any number of directories"""
+    sep = re.escape(os.sep)
+    regex = ''
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if pattern.startswith('**' + os.sep, i):
+            # Also matches zero directories
+            regex += '(.*{})?'.format(sep)
+            i += 3
+            continue
+        if pattern.startswith('**', i):
+            regex += '.*'
+            i += 2
+            continue
+        if c == '*':
+            regex += '[^{}]*'.format(sep)
+        elif c == '?':
+            regex += '[^{}]'.format(sep)
+        elif c == '[' and pattern.find(']', i + 1) != -1:
+            end = pattern.find(']', i + 1)
+            body = pattern[i + 1:end]
+            if body.startswith('!'):
+                body = '^' + body[1:]
+            regex += '[{}]'.format(body)
+            i = end
+        else:
+            regex += re.escape(c)
+        i += 1
+    return re.compile(regex + '$')
+
+
+def list_context_files(context_dir='.', rules=None):
+    """Returns the sorted relative paths of all the files in the build context"""
+    rules = rules or IgnoreRules.from_context(context_dir)
+    # With negated patterns, files inside an ignored directory can be re-included
+    can_prune = not rules.has_negations()
+    files = []
+    for root, dirs, file_names in os.walk(context_dir):
+        rel_root = os.path.relpath(root, context_dir)
+        kept_dirs = []
+        for d in dirs:
+            rel_dir = os.path.normpath(os.path.join(rel_root, d))
+            if os.path.islink(os.path.join(root, d)):
+                # Symlinks to directories are sent as links, they are not followed
+                file_names.append(d)
+            elif not (can_prune and rules.is_ignored(rel_dir)):
+                kept_dirs.append(d)
+        dirs[:] = kept_dirs
+        for name in file_names:
+            rel_path = os.path.normpath(os.path.join(rel_root, name))
+            if not rules.is_ignored(rel_path):
+                files.append(rel_path)
+    return sorted(files)
+
+
+def hash_file(path, hasher=None, chunk_size=1024 * 1024):
+    hasher = hasher or hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            hasher.update(chunk)
+    return hasher
+
+
+def get_context_digest(dockerfile_content, env=None, context_dir='.', rules=None):
+    """Returns a digest of everything that goes into the image:
+    the Dockerfile, the environment variables and the build context"""
+    rules = rules or IgnoreRules.from_context(context_dir, names=DIGEST_IGNORED)
+    hasher = hashlib.sha256()
+    hasher.update(dockerfile_content.encode('utf-8'))
+    hasher.update(json.dumps(env or [], sort_keys=True).encode('utf-8'))
+    for rel_path in list_context_files(context_dir, rules):
+        full_path = os.path.join(context_dir, rel_path)
+        hasher.update(rel_path.encode('utf-8'))
+        if os.path.islink(full_path):
+            hasher.update(os.readlink(full_path).encode('utf-8'))
+            continue
+        hasher.update(str(os.path.getsize(full_path)).encode('utf-8'))
+        # Executable bit is preserved by COPY, so it is part of the image content
+        hasher.update(b'x' if os.access(full_path, os.X_OK) else b'-')
+        hash_file(full_path, hasher)
+    return hasher.hexdigest()
+
+
+def get_content_tag(dockerfile_content, env=None, context_dir='.', rules=None):
+    digest = get_context_digest(dockerfile_content, env, context_dir, rules)
+    return digest[:TAG_LENGTH]
+
+
+def _reset_ownership(tarinfo):
+    tarinfo.uid = tarinfo.gid = 0
+    tarinfo.uname = tarinfo.gname = ''
+    return tarinfo
+
+
+def create_context_tar(context_dir='.', dockerfile='Dockerfile', rules=None):
+    """Creates an uncompressed tar of the build context, honouring .dockerignore.
+    Returns the tar file object, positioned at the beginning, and the size in bytes
+    of each top level entry of the context."""
+    files = list_context_files(context_dir, rules)
+    # The Dockerfile is always needed by the daemon, even if it is ignored
+    if dockerfile not in files and os.path.exists(os.path.join(context_dir, dockerfile)):
+        files.append(dockerfile)
+
+    sizes = {}
+    fileobj = tempfile.SpooledTemporaryFile(max_size=MAX_IN_MEMORY_CONTEXT_SIZE)
+    with tarfile.open(fileobj=fileobj, mode='w') as tar:
+        for rel_path in files:
+            full_path = os.path.join(context_dir, rel_path)
+            tar.add(full_path, arcname=rel_path, recursive=False, filter=_reset_ownership)
+            top_level = rel_path.split(os.sep)[0]
+            sizes[top_level] = sizes.get(top_level, 0) + os.lstat(full_path).st_size
+    fileobj.seek(0)
+    return fileobj, sizes
+
+
+def log_context_sizes(sizes, max_entries=10):
+    total = sum(sizes.values())
+    logger.warn('Sending build context of {} to the builder...'.format(format_size(total)))
+    by_size = sorted(sizes.items(), key=lambda x: x[1], reverse=True)
+    for name, size in by_size[:max_entries]:
+        logger.info('Build context: {} {}'.format(format_size(size), name))
+
+
+def format_size(size):
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if size < 1024 or unit == 'GB':
+            return '{:.1f}{}'.format(size, unit)
+        size /= 1024.0
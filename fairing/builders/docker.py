@@ -5,7 +5,9 @@ import logging
 import sys
 
 from docker import APIClient
+from docker.errors import APIError
 
+from fairing.builders.context import create_context_tar, log_context_sizes
 from fairing.builders.dockerfile import DockerFile
 from fairing.builders.container_image_builder import ContainerImageBuilder
 from fairing.utils import get_image_full
@@ -13,9 +15,9 @@ from fairing.utils import get_image_full
 logger = logging.getLogger('fairing')
 
 class DockerBuilder(ContainerImageBuilder):
-    def __init__(self):
+    def __init__(self, dependency_layers=False):
         self.docker_client = None
-        self.dockerfile = DockerFile()
+        self.dockerfile = DockerFile(dependency_layers=dependency_layers)
   
     def execute(self, repository, image_name, image_tag, base_image, dockerfile, publish, env):
         full_image_name = get_image_full(repository, image_name, image_tag)
@@ -24,19 +26,39 @@ class DockerBuilder(ContainerImageBuilder):
         if publish:
             self.publish(full_image_name)
 
+    def image_exists(self, repository, image_name, image_tag, publish):
+        full_image_name = get_image_full(repository, image_name, image_tag)
+        if self.docker_client is None:
+            self.docker_client = APIClient(version='auto')
+        try:
+            if publish:
+                # The image needs to be in the registry, a local copy is not enough
+                self.docker_client.inspect_distribution(full_image_name)
+            else:
+                self.docker_client.inspect_image(full_image_name)
+        except APIError:
+            return False
+        return True
+
     def build(self, img, path='.'):
         logger.warn('Building docker image {}...'.format(img))
         if self.docker_client is None:
             self.docker_client = APIClient(version='auto')
-        
-        bld = self.docker_client.build(
-            path=path,
-            tag=img,
-            encoding='utf-8'
-        )
 
-        for line in bld:
-            self._process_stream(line)
+        # Send a filtered context instead of letting docker-py tar the whole directory
+        context, sizes = create_context_tar(path)
+        log_context_sizes(sizes)
+        try:
+            bld = self.docker_client.build(
+                fileobj=context,
+                custom_context=True,
+                tag=img
+            )
+
+            for line in bld:
+                self._process_stream(line)
+        finally:
+            context.close()
 
     def publish(self, img):
         logger.warn('Publishing image {}...'.format(img))
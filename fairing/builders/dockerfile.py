@@ -2,10 +2,19 @@ import os
 import sys
 import shutil
 
+from fairing.builders.context import IgnoreRules
 from fairing.notebook_helper import get_notebook_name, is_in_notebook
 
+# Files describing the dependencies of the user code, they are copied in their own
+# layer when generating a layered Dockerfile.
+DEPENDENCY_FILES = ['requirements.txt', 'constraints.txt']
+
 class DockerFile(object):
-    
+    def __init__(self, dependency_layers=False):
+        # When True, dependencies are installed before the rest of the sources are copied
+        # so that editing the code doesn't invalidate the cached dependency layers
+        self.dependency_layers = dependency_layers
+
     def get_exec_file_name(self):
         exec_file = sys.argv[0]
         slash_ix = exec_file.find('/')
@@ -47,6 +56,9 @@ class DockerFile(object):
         return '\n'.join(all_steps)
 
     def get_mandatory_steps(self):
+        if self.dependency_layers:
+            return self.get_layered_steps()
+
         steps = [
             "ENV FAIRING_RUNTIME 1",
             "RUN pip install fairing",
@@ -62,11 +74,50 @@ class DockerFile(object):
             ]
         return steps
 
+    def get_layered_steps(self, context_dir='.'):
+        in_notebook = is_in_notebook()
+        steps = [
+            "ENV FAIRING_RUNTIME 1",
+            "RUN pip install fairing"
+        ]
+        if in_notebook:
+            steps += ["RUN pip install jupyter nbconvert"]
+
+        steps += self.get_dependency_steps(context_dir)
+        steps += ["COPY ./ /app/"]
+
+        if in_notebook:
+            nb_name = get_notebook_name()
+            steps += ["RUN jupyter nbconvert --to script /app/{}".format(nb_name)]
+        return steps
+
+    def get_dependency_steps(self, context_dir='.'):
+        # Ignored files are not in the build context, copying them would fail the build
+        rules = IgnoreRules.from_context(context_dir)
+        files = [f for f in DEPENDENCY_FILES
+                 if os.path.isfile(os.path.join(context_dir, f)) and not rules.is_ignored(f)]
+        if 'requirements.txt' not in files:
+            return []
+
+        install = "RUN pip install --no-cache -r /app/requirements.txt"
+        if 'constraints.txt' in files:
+            install += " -c /app/constraints.txt"
+        return [
+            "COPY {} /app/".format(' '.join(files)),
+            install
+        ]
+
     def get_env_steps(self, env):
         if env:
             return ["ENV {} {}".format(e['name'], e['value']) for e in env]
         return []
     
+    def get_content(self, env, dockerfile=None, base_image=None):
+        if dockerfile is not None:
+            with open(dockerfile, 'r') as f:
+                return f.read()
+        return self.generate_dockerfile(base_image, env)
+
     def write(self, env, destination='Dockerfile', dockerfile=None, base_image=None):
         if dockerfile is not None:
             shutil.copy(dockerfile, destination)
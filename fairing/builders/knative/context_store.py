@@ -0,0 +1,153 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+import logging
+
+from fairing.builders.context import list_context_files, hash_file, IgnoreRules
+
+logger = logging.getLogger('fairing')
+
+
+class ContextStore(object):
+    """Content-addressed store for the build contexts shared with the build pods.
+
+    Every file is stored once under .objects/, named after its content and mode,
+    and each build context is a directory of hard links to those objects.
+    Only files that changed since the previous build are actually copied."""
+
+    def __init__(self, root, max_contexts=10, max_bytes=10 * 1024 ** 3, grace_period=2 * 3600):
+        self.root = root
+        self.objects_dir = os.path.join(root, '.objects')
+        self.index_path = os.path.join(self.objects_dir, 'index.json')
+        # Garbage collection limits, the most recently used contexts are kept
+        self.max_contexts = max_contexts
+        self.max_bytes = max_bytes
+        # Contexts created less than grace_period seconds ago are never collected,
+        # they might belong to builds of other processes that haven't read them yet
+        self.grace_period = grace_period
+
+    def add_context(self, build_id, context_dir='.', dockerfile='Dockerfile'):
+        """Populates the context for build_id with the files of context_dir
+        and returns its path"""
+        dst = os.path.join(self.root, build_id)
+        if os.path.exists(dst):
+            shutil.rmtree(dst)
+        os.makedirs(dst)
+        os.makedirs(self.objects_dir, exist_ok=True)
+
+        rules = IgnoreRules.from_context(context_dir)
+        index = self._load_index()
+        copied = 0
+        files = list_context_files(context_dir, rules)
+        # The Dockerfile is always needed by the build, even if it is ignored
+        if dockerfile not in files and os.path.exists(os.path.join(context_dir, dockerfile)):
+            files.append(dockerfile)
+        for rel_path in files:
+            src = os.path.join(context_dir, rel_path)
+            target = os.path.join(dst, rel_path)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if os.path.islink(src):
+                os.symlink(os.readlink(src), target)
+                continue
+
+            obj = self._object_path(self._get_digest(src, index))
+            if not os.path.exists(obj):
+                self._store(src, obj)
+                copied += 1
+            self._link(obj, target)
+
+        self._save_index(index)
+        logger.warn('Build context ready, copied {} of {} files.'.format(copied, len(files)))
+        self.collect_garbage(keep=build_id)
+        return dst
+
+    def list_contexts(self):
+        """Returns the build contexts, least recently used first"""
+        if not os.path.isdir(self.root):
+            return []
+        contexts = [os.path.join(self.root, d) for d in os.listdir(self.root)
+                    if not d.startswith('.') and os.path.isdir(os.path.join(self.root, d))]
+        return sorted(contexts, key=os.path.getmtime)
+
+    def collect_garbage(self, keep=None):
+        all_contexts = self.list_contexts()
+        min_mtime = time.time() - self.grace_period
+        contexts = [c for c in all_contexts
+                    if os.path.basename(c) != keep and os.path.getmtime(c) < min_mtime]
+        excess = min(len(all_contexts) - self.max_contexts, len(contexts))
+        for context in contexts[:max(excess, 0)]:
+            shutil.rmtree(context, ignore_errors=True)
+        contexts = contexts[max(excess, 0):]
+
+        stored_bytes = self._remove_unreferenced_objects(min_mtime)
+        while stored_bytes > self.max_bytes and contexts:
+            shutil.rmtree(contexts.pop(0), ignore_errors=True)
+            stored_bytes = self._remove_unreferenced_objects(min_mtime)
+
+    def _remove_unreferenced_objects(self, min_ctime):
+        """Deletes objects not linked from any context, returns the size of the remaining ones.
+        Objects stored or linked after min_ctime are kept, another build might be about to link them."""
+        stored_bytes = 0
+        if not os.path.isdir(self.objects_dir):
+            return stored_bytes
+        for prefix in os.listdir(self.objects_dir):
+            prefix_dir = os.path.join(self.objects_dir, prefix)
+            if not os.path.isdir(prefix_dir):
+                continue
+            for name in os.listdir(prefix_dir):
+                obj = os.path.join(prefix_dir, name)
+                stat = os.stat(obj)
+                # The only remaining link is the store itself
+                if stat.st_nlink <= 1 and stat.st_ctime < min_ctime:
+                    os.remove(obj)
+                else:
+                    stored_bytes += stat.st_size
+        return stored_bytes
+
+    def _get_digest(self, path, index):
+        # Files that didn't change since the last build are not hashed again
+        stat = os.stat(path)
+        key = os.path.abspath(path)
+        signature = [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+        cached = index.get(key)
+        if cached and cached[:3] == signature:
+            digest = cached[3]
+        else:
+            digest = hash_file(path, hashlib.sha256()).hexdigest()
+            index[key] = signature + [digest]
+        # Links share their mode, so it has to be part of the object identity
+        return '{}-{:o}'.format(digest, stat.st_mode & 0o777)
+
+    def _object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    def _store(self, src, obj):
+        os.makedirs(os.path.dirname(obj), exist_ok=True)
+        # Copy to a temporary file first so a concurrent build never sees a partial object
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(obj))
+        os.close(fd)
+        shutil.copy2(src, tmp_path)
+        os.replace(tmp_path, obj)
+
+    def _link(self, obj, target):
+        try:
+            os.link(obj, target)
+        except OSError:
+            # Hard links are not supported by every filesystem
+            shutil.copy2(obj, target)
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, 'r') as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return {}
+
+    def _save_index(self, index):
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self.index_path)
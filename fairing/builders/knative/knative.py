@@ -1,6 +1,6 @@
+import hashlib
 import logging
 import os
-import shutil
 from pkg_resources import resource_filename
 
 import kubernetes.config
@@ -8,16 +8,19 @@ import kubernetes.config
 from fairing.builders.dockerfile import DockerFile
 from fairing.builders.container_image_builder import ContainerImageBuilder
 from fairing.builders.knative.models.build_template import BuildTemplate, BuildTemplateSpec, BuildTemplateSpecParameter, BuildTemplateSpecStep
-from fairing.builders.knative.models.build import Build, BuildSpec, BuildSpecArgument, BuildSpecTemplate
+from fairing.builders.knative.context_store import ContextStore
+from fairing.builders.knative.models.build import Build, BuildSpec, BuildSpecArgument, BuildSpecTemplate, DEFAULT_BUILD_TIMEOUT
 from fairing.utils import get_image, get_image_full, is_running_in_k8s, get_current_k8s_namespace
 
 logger = logging.getLogger('fairing')
 
 
 class KnativeBuilder(ContainerImageBuilder):
-    def __init__(self):
-        self.dockerfile = DockerFile()
+    def __init__(self, dependency_layers=False, max_build_contexts=10, build_timeout=DEFAULT_BUILD_TIMEOUT):
+        self.dockerfile = DockerFile(dependency_layers=dependency_layers)
         self.namespace = self.get_current_namespace()
+        self.context_store = ContextStore(self.get_mount_point(), max_contexts=max_build_contexts)
+        self.build_timeout = build_timeout
         self._build_id = None
 
     def execute(self, repository, image_name, image_tag, base_image, dockerfile, publish, env):
@@ -27,10 +30,15 @@ class KnativeBuilder(ContainerImageBuilder):
         self.copy_src_to_mount_point()
         self.build_and_push(image, image_tag)
 
+    def image_exists(self, repository, image_name, image_tag, publish):
+        # Builds are named after the image and its tag, a successful build
+        # means the image has already been pushed to the registry.
+        self.authenticate()
+        build = self.generate_build_resource(get_image(repository, image_name), image_tag)
+        return build.has_succeeded()
+
     def copy_src_to_mount_point(self):
-        context_dir = os.getcwd()
-        dst = os.path.join(self.get_mount_point(), self._build_id)
-        shutil.copytree(context_dir, dst)
+        self.context_store.add_context(self._build_id, os.getcwd())
 
     def get_mount_point(self):
         return os.path.join(os.environ['HOME'], '.fairing/build-contexts/')
@@ -42,8 +50,8 @@ class KnativeBuilder(ContainerImageBuilder):
         build_template = self.generate_build_template_resource()
         build_template.maybe_create()
 
-        build = self.generate_build_resource(img)
-        build.create_sync()
+        build = self.generate_build_resource(img, tag)
+        build.create_sync(self.build_timeout)
         #TODO: clean build?
 
     def authenticate(self):
@@ -86,18 +94,26 @@ class KnativeBuilder(ContainerImageBuilder):
             parameters=params, steps=steps, volumes=[volume])
         return BuildTemplate(metadata=metadata, spec=spec)
 
-    def generate_build_resource(self, image):
+    def generate_build_resource(self, image, tag):
         metadata = kubernetes.client.V1ObjectMeta(
-            name='fairing-build-{}'.format(self._build_id),
+            name=get_build_name(image, tag),
             namespace=self.namespace)
         
-        mount_path = '/src/{build_id}'.format(build_id=self._build_id)
+        # The build context was added to the store under the tag
+        mount_path = '/src/{build_id}'.format(build_id=tag)
 
         args = [BuildSpecArgument(name='IMAGE', value=image),
-                BuildSpecArgument(name='TAG', value=self._build_id),
+                BuildSpecArgument(name='TAG', value=tag),
                 BuildSpecArgument(name='DOCKERFILE', value=os.path.join(mount_path, 'Dockerfile')),
                 BuildSpecArgument(name='CONTEXT', value=mount_path)]
 
         template = BuildSpecTemplate(name='fairing-build', arguments=args)
         spec = BuildSpec(sa_name='fairing-build', template=template)
         return Build(metadata=metadata, spec=spec)
+
+
+def get_build_name(image, tag):
+    """Returns the name of the Build pushing image:tag. The same tag can be
+    used by other images, the name also holds a digest of the image."""
+    digest = hashlib.sha256(image.encode('utf-8')).hexdigest()[:8]
+    return 'fairing-build-{}-{}'.format(tag, digest)
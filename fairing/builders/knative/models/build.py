@@ -1,13 +1,30 @@
 import logging
+import math
 import time
-import datetime
-import sys
 
 import kubernetes.client
+import urllib3
+from kubernetes import watch
 from kubernetes.client.rest import ApiException
 
 logger = logging.getLogger('fairing')
 
+# Seconds to wait for a build to complete
+DEFAULT_BUILD_TIMEOUT = 600
+# Bounds of the exponential backoff, in seconds, when the watch connection is lost
+MIN_WATCH_BACKOFF = 1
+MAX_WATCH_BACKOFF = 30
+# Label holding the name of the Build, used to only watch the Build we are waiting for
+BUILD_NAME_LABEL = 'fairing-build-name'
+
+
+class BuildError(RuntimeError):
+    pass
+
+
+class BuildTimeoutError(BuildError):
+    pass
+
 
 class BuildSpecArgument(object):
     def __init__(self, name, value):
@@ -56,6 +73,9 @@ class Build(object):
 
         self._metadata = metadata
         self._spec = spec
+        if self._metadata is not None:
+            self._metadata.labels = dict(self._metadata.labels or {},
+                                         **{BUILD_NAME_LABEL: self._metadata.name})
 
         self._api_custom = None
         self._api_v1 = None
@@ -80,43 +100,128 @@ class Build(object):
                                                            body=self.to_dict(),
                                                            pretty=True)
         except ApiException as e:
-            logger.error(
-                "Exception when calling CustomObjectsApi->create_namespaced_custom_object: %s\n" % e)
-
-    def create_sync(self):
+            # The Build already exists, e.g. it is still running, it is waited upon
+            if e.status != 409:
+                raise
+            logger.warn('Build {} already exists.'.format(self._metadata.name))
+
+    def create_sync(self, timeout=DEFAULT_BUILD_TIMEOUT):
+        # Builds are named after the image tag, with content-addressed tags a previous
+        # failed attempt would otherwise be picked up instead of building again.
+        # A build that is still running is simply waited upon.
+        self.delete_if_failed()
         self.create()
-        self.wait_for_build_completion()
+        self.wait_for_build_completion(timeout)
 
-    def wait_for_build_completion(self):
-        timeout = 180
-        check_start = datetime.datetime.now()
+    def delete_if_failed(self):
+        bld = self._get_build()
+        if bld is None or self.check_build_succeeded(bld) != False:
+            return False
+        logger.warn('Deleting previously failed build {}...'.format(self._metadata.name))
+        try:
+            self._api_custom.delete_namespaced_custom_object(
+                self._group,
+                self._api_version,
+                self._metadata.namespace,
+                self._plural,
+                self._metadata.name,
+                body=kubernetes.client.V1DeleteOptions(propagation_policy='Background'))
+        except ApiException as e:
+            if e.status != 404:
+                raise
+        return True
+
+    def has_succeeded(self):
+        bld = self._get_build()
+        return bld is not None and self.check_build_succeeded(bld) == True
+
+    def wait_for_build_completion(self, timeout=DEFAULT_BUILD_TIMEOUT):
+        """Watches the Build until it completes, raises BuildError if it fails
+        or doesn't complete within timeout seconds"""
+        deadline = time.time() + timeout
+        resource_version = None
+        backoff = MIN_WATCH_BACKOFF
         while True:
+            if resource_version is None:
+                # Check the current state first, the watch only reports subsequent changes
+                bld = self._get_build()
+                if bld is not None:
+                    if self._is_completed(bld):
+                        return
+                    resource_version = bld['metadata'].get('resourceVersion')
+
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise BuildTimeoutError('Timeout while waiting for build {} to finish.'.format(
+                    self._metadata.name))
+
+            w = watch.Watch()
             try:
-                bld = self._api_custom.get_namespaced_custom_object(self._group,
-                                                                self._api_version,
-                                                                self._metadata.namespace,
-                                                                self._plural,
-                                                                self._metadata.name)
-            except ApiException as e:
+                for event in w.stream(self._api_custom.list_namespaced_custom_object,
+                                      self._group,
+                                      self._api_version,
+                                      self._metadata.namespace,
+                                      self._plural,
+                                      # The pinned kubernetes client doesn't support field
+                                      # selectors on custom objects, filter with a label instead
+                                      label_selector=self.get_build_label_selector(),
+                                      resource_version=resource_version,
+                                      timeout_seconds=int(math.ceil(remaining))):
+                    obj = event['object']
+                    if event['type'] == 'ERROR':
+                        # 410 Gone: the resource version is too old, start over from a fresh GET
+                        if obj.get('code') == 410:
+                            resource_version = None
+                            break
+                        raise ApiException(status=obj.get('code'), reason=obj.get('message'))
+
+                    if obj['metadata']['name'] != self._metadata.name:
+                        continue
+                    resource_version = obj['metadata'].get('resourceVersion', resource_version)
+                    if event['type'] == 'DELETED':
+                        raise BuildError('Build {} was deleted before completion.'.format(
+                            self._metadata.name))
+                    if self._is_completed(obj):
+                        return
+                backoff = MIN_WATCH_BACKOFF
+            except (ApiException, urllib3.exceptions.HTTPError) as e:
+                if getattr(e, 'status', None) == 410:
+                    resource_version = None
+                logger.warning('Watch on build {} interrupted, reconnecting in {}s: {}'.format(
+                    self._metadata.name, backoff, e))
+                time.sleep(min(backoff, max(deadline - time.time(), 0)))
+                backoff = min(backoff * 2, MAX_WATCH_BACKOFF)
+            finally:
+                w.stop()
+
+    def _get_build(self):
+        try:
+            return self._api_custom.get_namespaced_custom_object(self._group,
+                                                                 self._api_version,
+                                                                 self._metadata.namespace,
+                                                                 self._plural,
+                                                                 self._metadata.name)
+        except ApiException as e:
+            if e.status != 404:
                 logger.error(
                     "Exception when calling CustomObjectsApi->get_namespaced_custom_object: %s\n" % e)
+        return None
 
-            success = self.check_build_succeeded(bld)
-            if success:
-                logger.error('Build finished successfully.')
-                break
-            elif success == False:
-                logger.error('Build failed, fetching logs...')
-                logger.error(self.fetch_build_logs())
-                sys.exit(1)
-
-            if (datetime.datetime.now() - check_start).seconds > timeout:
-                logger.error('Timeout while waiting for build to finish.')
-                break
-
-            time.sleep(3)
+    def _is_completed(self, build_object):
+        success = self.check_build_succeeded(build_object)
+        if success:
+            logger.warn('Build finished successfully.')
+            return True
+        elif success == False:
+            logger.error('Build failed, fetching logs...')
+            logs = self.fetch_build_logs()
+            logger.error(logs)
+            raise BuildError('Build {} failed.'.format(self._metadata.name))
+        return False
+
+    def get_build_label_selector(self):
+        return '{}={}'.format(BUILD_NAME_LABEL, self._metadata.name)
 
-              
     def get_build_pod_labels_selector(self):
         return 'build-name={}'.format(self._metadata.name)
 
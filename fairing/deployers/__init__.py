@@ -0,0 +1,3 @@
+from fairing.deployers.deployer import get_deployer
+from fairing.deployers.deployer import Deployers
+from fairing.deployers.kubernetes import KubernetesDeployer
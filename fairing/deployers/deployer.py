@@ -0,0 +1,26 @@
+from enum import Enum
+
+from fairing.deployers.kubernetes import KubernetesDeployer
+from fairing.metaparticle import MetaparticleClient
+
+class Deployers(Enum):
+    METAPARTICLE = 1
+    KUBERNETES = 2
+
+def get_deployer(deployer_str=None):
+    if deployer_str == None:
+        return MetaparticleClient()
+
+    # Already configured deployer, i.e. KubernetesDeployer(max_workers=32)
+    if not isinstance(deployer_str, str):
+        return deployer_str
+
+    try:
+        deployer = Deployers[deployer_str.upper()]
+    except KeyError:
+        raise ValueError("Unsupported deployer type: ", deployer_str)
+
+    if deployer == Deployers.METAPARTICLE:
+        return MetaparticleClient()
+    elif deployer == Deployers.KUBERNETES:
+        return KubernetesDeployer()
@@ -0,0 +1,410 @@
+import copy
+import logging
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import kubernetes.client
+import kubernetes.config
+import urllib3
+from kubernetes.client.rest import ApiException
+
+from fairing.utils import is_running_in_k8s
+
+logger = logging.getLogger('fairing')
+
+# Label shared by all the objects of a deployment, used to find them back
+DEPLOYMENT_LABEL = 'fairing-deployment'
+# Label identifying the pods of a single job or service
+COMPONENT_LABEL = 'fairing-component'
+
+# Metaparticle replica types and their tf-operator counterparts
+TF_REPLICA_TYPES = {
+    'MASTER': 'Chief',
+    'WORKER': 'Worker',
+    'PS': 'PS',
+}
+TFJOB_API_VERSION = 'kubeflow.org/v1alpha2'
+
+# Typed API and method suffix used to manage each built-in kind
+TYPED_APIS = {
+    'Deployment': (kubernetes.client.AppsV1Api, 'deployment'),
+    'Service': (kubernetes.client.CoreV1Api, 'service'),
+    'Job': (kubernetes.client.BatchV1Api, 'job'),
+}
+
+# Kinds whose pod template can't be updated, they are replaced instead of patched
+IMMUTABLE_KINDS = ['Job', 'TFJob']
+# How many times to retry creating a replaced object while the previous one is being deleted
+MAX_RECREATE_ATTEMPTS = 30
+
+# API errors worth retrying: throttling and server side errors
+RETRIABLE_STATUSES = [429, 500, 502, 503, 504]
+
+# Seconds to wait for the pods of a deployment to start before giving up on their logs
+DEFAULT_PENDING_TIMEOUT = 600
+
+
+class RateLimiter(object):
+    """Thread-safe token bucket allowing max_qps calls per second, with bursts up to burst"""
+
+    def __init__(self, max_qps, burst=None):
+        self.max_qps = max_qps
+        self.burst = burst or max(int(max_qps), 1)
+        self._tokens = self.burst
+        self._last = time.time()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.max_qps:
+            return
+        while True:
+            with self._lock:
+                now = time.time()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.max_qps)
+                self._last = now
+                # Tolerate rounding errors, otherwise we could end up sleeping for ~0s forever
+                if self._tokens >= 1 - 1e-9:
+                    self._tokens = max(self._tokens - 1, 0)
+                    return
+                wait = (1 - self._tokens) / self.max_qps
+            time.sleep(wait)
+
+
+class KubernetesDeployer(object):
+    """Deploys the AST generated by the Trainer (jobs, tfJobs, services and serve)
+    by submitting the equivalent Kubernetes objects directly to the API server.
+
+    Objects are created concurrently over a single pooled ApiClient, limited to
+    max_qps requests per second, and retried up to max_retries times on throttling
+    or server errors. Deployments and Services that already exist are patched, while
+    Jobs and TFJobs, whose pod template is immutable, are deleted and created again."""
+
+    def __init__(self, max_workers=16, max_qps=50, max_retries=5):
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.rate_limiter = RateLimiter(max_qps)
+        self._api_client = None
+        # Objects submitted by the last call to run, deleted by cancel
+        self._applied = []
+        self._namespace = None
+        self._name = None
+
+    def run(self, svc):
+        objects = self.compile(svc)
+        self._namespace = svc.get('namespace', 'default')
+        self._name = svc['name']
+        self.apply_all(objects)
+        self._applied = objects
+
+    def cancel(self, name):
+        """Deletes every object of the deployment name, found by their label"""
+        objects = self.list_deployed(name)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            list(executor.map(self.delete, objects))
+        self._applied = []
+
+    def list_deployed(self, name):
+        namespace = self._namespace or 'default'
+        selector = '{}={}'.format(DEPLOYMENT_LABEL, name)
+        objects = []
+        for kind, (api_class, suffix) in TYPED_APIS.items():
+            api = api_class(self.get_api_client())
+            self.rate_limiter.acquire()
+            items = getattr(api, 'list_namespaced_' + suffix)(namespace, label_selector=selector).items
+            objects += [self.compile_reference(kind, item.metadata.name, namespace) for item in items]
+
+        api = kubernetes.client.CustomObjectsApi(self.get_api_client())
+        group, version = TFJOB_API_VERSION.split('/')
+        self.rate_limiter.acquire()
+        try:
+            tfjobs = api.list_namespaced_custom_object(group, version, namespace, 'tfjobs',
+                                                       label_selector=selector)['items']
+        except ApiException as e:
+            # tf-operator isn't installed on the cluster
+            if e.status != 404:
+                raise
+            tfjobs = []
+        objects += [self.compile_reference('TFJob', t['metadata']['name'], namespace) for t in tfjobs]
+        return objects
+
+    def compile_reference(self, kind, name, namespace):
+        """The part of an object needed to delete it"""
+        obj = {'kind': kind, 'metadata': {'name': name, 'namespace': namespace}}
+        if kind == 'TFJob':
+            obj['apiVersion'] = TFJOB_API_VERSION
+        return obj
+
+    def logs(self, name, pending_timeout=DEFAULT_PENDING_TIMEOUT):
+        core_api = kubernetes.client.CoreV1Api(self.get_api_client())
+        selector = '{}={}'.format(DEPLOYMENT_LABEL, self._name or name)
+        followed = {}
+        deadline = time.time() + pending_timeout
+        while True:
+            pods = core_api.list_namespaced_pod(self._namespace or 'default', label_selector=selector)
+            for pod in pods.items:
+                if pod.metadata.name in followed or pod.status.phase == 'Pending':
+                    continue
+                thread = threading.Thread(target=self._follow_logs, args=(core_api, pod), daemon=True)
+                thread.start()
+                followed[pod.metadata.name] = thread
+            if followed and not any(t.is_alive() for t in followed.values()):
+                return
+            if not followed and time.time() > deadline:
+                raise RuntimeError('No pod of {} started within {}s, {} still pending.'.format(
+                    self._name or name, pending_timeout, len(pods.items)))
+            time.sleep(1)
+
+    def _follow_logs(self, core_api, pod):
+        resp = core_api.read_namespaced_pod_log(pod.metadata.name,
+                                                pod.metadata.namespace,
+                                                follow=True,
+                                                _preload_content=False)
+        for line in resp.stream():
+            for ln in line.decode('utf-8').splitlines():
+                sys.stdout.write('[{}] {}\n'.format(pod.metadata.name, ln))
+
+    def get_api_client(self):
+        # A single client is shared by every request so connections are pooled
+        if self._api_client is None:
+            if is_running_in_k8s():
+                kubernetes.config.load_incluster_config()
+            else:
+                kubernetes.config.load_kube_config()
+            # Newer clients don't copy the loaded configuration by default anymore
+            if hasattr(kubernetes.client.Configuration, 'get_default_copy'):
+                configuration = kubernetes.client.Configuration.get_default_copy()
+            else:
+                configuration = kubernetes.client.Configuration()
+            configuration.connection_pool_maxsize = self.max_workers
+            self._api_client = kubernetes.client.ApiClient(configuration)
+        return self._api_client
+
+    def apply_all(self, objects):
+        if not objects:
+            return
+        start = time.time()
+        failures = []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [(obj, executor.submit(self.apply, obj)) for obj in objects]
+            for obj, future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.error('Failed to submit {} {}: {}'.format(
+                        obj['kind'], obj['metadata']['name'], e))
+                    failures.append(obj)
+
+        elapsed = max(time.time() - start, 1e-6)
+        submitted = len(objects) - len(failures)
+        logger.warn('Submitted {} objects in {:.1f}s ({:.1f} objects/s).'.format(
+            submitted, elapsed, submitted / elapsed))
+        if failures:
+            raise RuntimeError('Failed to submit {} of {} objects: {}'.format(
+                len(failures), len(objects), ', '.join(o['metadata']['name'] for o in failures)))
+
+    def apply(self, obj):
+        logger.info('Creating {} {}'.format(obj['kind'], obj['metadata']['name']))
+        try:
+            return self._call_with_retry('create', obj)
+        except ApiException as e:
+            if e.status != 409:
+                raise
+        if obj['kind'] in IMMUTABLE_KINDS:
+            return self.recreate(obj)
+        logger.info('{} {} already exists, updating it'.format(obj['kind'], obj['metadata']['name']))
+        return self._call_with_retry('patch', obj)
+
+    def recreate(self, obj):
+        logger.warn('{} {} already exists, replacing it'.format(obj['kind'], obj['metadata']['name']))
+        self.delete(obj)
+        for _ in range(MAX_RECREATE_ATTEMPTS):
+            try:
+                return self._call_with_retry('create', obj)
+            except ApiException as e:
+                # The previous object might still be terminating
+                if e.status != 409:
+                    raise
+            time.sleep(1)
+        raise RuntimeError('Timeout while replacing {} {}, the previous one is still being deleted'.format(
+            obj['kind'], obj['metadata']['name']))
+
+    def _call_with_retry(self, verb, obj):
+        backoff = 0.5
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire()
+            try:
+                return self._call(verb, obj)
+            except (ApiException, urllib3.exceptions.HTTPError) as e:
+                retriable = not isinstance(e, ApiException) or e.status in RETRIABLE_STATUSES
+                if not retriable or attempt == self.max_retries:
+                    raise
+                logger.info('Retrying {} of {} {} in {}s: {}'.format(
+                    verb, obj['kind'], obj['metadata']['name'], backoff, e))
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+
+    def delete(self, obj):
+        logger.info('Deleting {} {}'.format(obj['kind'], obj['metadata']['name']))
+        try:
+            self._call_with_retry('delete', obj)
+        except ApiException as e:
+            if e.status != 404:
+                raise
+
+    def _call(self, verb, obj):
+        namespace = obj['metadata']['namespace']
+        name = obj['metadata']['name']
+        delete_options = kubernetes.client.V1DeleteOptions(propagation_policy='Background')
+
+        if obj['kind'] == 'TFJob':
+            api = kubernetes.client.CustomObjectsApi(self.get_api_client())
+            group, version = obj['apiVersion'].split('/')
+            if verb == 'create':
+                return api.create_namespaced_custom_object(group, version, namespace, 'tfjobs', obj)
+            if verb == 'patch':
+                return api.patch_namespaced_custom_object(group, version, namespace, 'tfjobs', name, obj)
+            return api.delete_namespaced_custom_object(group, version, namespace, 'tfjobs', name,
+                                                       body=delete_options)
+
+        api_class, suffix = TYPED_APIS[obj['kind']]
+        api = api_class(self.get_api_client())
+        if verb == 'create':
+            return getattr(api, 'create_namespaced_' + suffix)(namespace, obj)
+        if verb == 'patch':
+            return getattr(api, 'patch_namespaced_' + suffix)(name, namespace, obj)
+        return getattr(api, 'delete_namespaced_' + suffix)(name, namespace, body=delete_options)
+
+    def compile(self, svc):
+        """Translates a fairing/Metaparticle AST into a list of Kubernetes objects"""
+        namespace = svc.get('namespace', 'default')
+        labels = {DEPLOYMENT_LABEL: svc['name']}
+        serve = svc.get('serve', {})
+        objects = []
+        for service in svc.get('services', []):
+            public = serve.get('name') == service['name'] and serve.get('public', False)
+            objects += self.compile_service(service, namespace, labels, public)
+        for job in svc.get('jobs', []):
+            objects.append(self.compile_job(job, namespace, labels))
+        for tfjob in svc.get('tfJobs', []):
+            objects.append(self.compile_tfjob(tfjob, namespace, labels))
+        return objects
+
+    def compile_service(self, service, namespace, labels, public):
+        pod_labels = dict(labels, **{COMPONENT_LABEL: service['name']})
+        ports = service.get('ports', [])
+        pod_spec = self.compile_pod_spec(service, ports=ports)
+        deployment = {
+            'apiVersion': 'apps/v1',
+            'kind': 'Deployment',
+            'metadata': self.compile_metadata(service['name'], namespace, labels),
+            'spec': {
+                'replicas': service.get('replicas', 1),
+                'selector': {'matchLabels': {COMPONENT_LABEL: service['name']}},
+                'template': {
+                    'metadata': {'labels': pod_labels},
+                    'spec': pod_spec
+                }
+            }
+        }
+        if not ports:
+            return [deployment]
+
+        k8s_service = {
+            'apiVersion': 'v1',
+            'kind': 'Service',
+            'metadata': self.compile_metadata(service['name'], namespace, labels),
+            'spec': {
+                'type': 'LoadBalancer' if public else 'ClusterIP',
+                'selector': {COMPONENT_LABEL: service['name']},
+                'ports': [{
+                    'name': 'port-{}'.format(p['number']),
+                    'port': p['number'],
+                    'targetPort': p['number'],
+                    'protocol': p.get('protocol', 'TCP')
+                } for p in ports]
+            }
+        }
+        return [deployment, k8s_service]
+
+    def compile_job(self, job, namespace, labels):
+        pod_labels = dict(labels, **{COMPONENT_LABEL: job['name']})
+        pod_spec = self.compile_pod_spec(job, restart_policy='OnFailure')
+        return {
+            'apiVersion': 'batch/v1',
+            'kind': 'Job',
+            'metadata': self.compile_metadata(job['name'], namespace, labels),
+            'spec': {
+                'parallelism': job.get('parallelism', 1),
+                'completions': job.get('completion', 1),
+                'template': {
+                    'metadata': {'labels': pod_labels},
+                    'spec': pod_spec
+                }
+            }
+        }
+
+    def compile_tfjob(self, tfjob, namespace, labels):
+        pod_labels = dict(labels, **{COMPONENT_LABEL: tfjob['name']})
+        replica_specs = {}
+        for replica_spec in tfjob['replicaSpecs']:
+            # tf-operator requires the container to be named tensorflow
+            pod_spec = self.compile_pod_spec(replica_spec,
+                                             restart_policy='OnFailure',
+                                             container_name='tensorflow')
+            replica_specs[TF_REPLICA_TYPES[replica_spec['replicaType']]] = {
+                'replicas': replica_spec.get('replicas', 1),
+                'template': {
+                    'metadata': {'labels': pod_labels},
+                    'spec': pod_spec
+                }
+            }
+        return {
+            'apiVersion': TFJOB_API_VERSION,
+            'kind': 'TFJob',
+            'metadata': self.compile_metadata(tfjob['name'], namespace, labels),
+            'spec': {'tfReplicaSpecs': replica_specs}
+        }
+
+    def compile_metadata(self, name, namespace, labels):
+        return {
+            'name': name,
+            'namespace': namespace,
+            'labels': copy.deepcopy(labels)
+        }
+
+    def compile_pod_spec(self, spec, ports=None, restart_policy=None, container_name=None):
+        containers = []
+        for ix, container in enumerate(spec.get('containers', [])):
+            k8s_container = {
+                'name': container_name or '{}-{}'.format(spec['name'], ix),
+                'image': container['image']
+            }
+            if container.get('command'):
+                k8s_container['command'] = container['command']
+            if container.get('env'):
+                k8s_container['env'] = container['env']
+            if container.get('volumeMounts'):
+                k8s_container['volumeMounts'] = container['volumeMounts']
+            if container.get('readinessProbe'):
+                k8s_container['readinessProbe'] = container['readinessProbe']
+            if ports:
+                k8s_container['ports'] = [{
+                    'containerPort': p['number'],
+                    'protocol': p.get('protocol', 'TCP')
+                } for p in ports]
+            containers.append(k8s_container)
+
+        pod_spec = {'containers': containers}
+        if spec.get('volumes'):
+            pod_spec['volumes'] = [self.compile_volume(v) for v in spec['volumes']]
+        if restart_policy:
+            pod_spec['restartPolicy'] = restart_policy
+        return pod_spec
+
+    def compile_volume(self, volume):
+        k8s_volume = {'name': volume['name']}
+        if volume.get('persistentVolumeClaim'):
+            k8s_volume['persistentVolumeClaim'] = {'claimName': volume['persistentVolumeClaim']}
+        return k8s_volume
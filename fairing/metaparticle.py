@@ -8,23 +8,72 @@ import requests
 import tempfile
 import zipfile
 import tarfile
-import shutil
+import hashlib
 import logging
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
 
 logger = logging.getLogger('fairing')
 
-def get_mp_bin_path():
+# Environment variable pointing to an already installed compiler binary,
+# i.e. for air-gapped environments where it can't be downloaded
+MP_COMPILER_PATH_ENV = 'METAPARTICLE_COMPILER_PATH'
+# Environment variable pointing to a directory where the compiler is (or will be) installed.
+# It can be pre-seeded with the compiler binary to avoid any download.
+MP_CACHE_DIR_ENV = 'METAPARTICLE_CACHE_DIR'
+# sha256 of the downloaded archive, it is verified when set
+MP_SHA256_ENV = 'METAPARTICLE_COMPILER_SHA256'
+
+MP_VERSION = 'v0.6.0'
+
+
+def get_mp_bin_name():
     plat = platform.system()
-    if plat == "Linux":
-        return resource_filename(__name__, "bin/metaparticle/linux/mp-compiler")
-    elif plat == "Windows":
-        return resource_filename(__name__, "bin/metaparticle/windows/mp-compiler.exe")
-    elif plat == "Darwin":
-        return resource_filename(__name__, "bin/metaparticle/darwin/mp-compiler")
+    if plat == "Windows":
+        return "mp-compiler.exe"
+    elif plat in ["Linux", "Darwin"]:
+        return "mp-compiler"
     else:
         raise Exception("Your platform is not supported.")
 
 
+def get_mp_bin_path():
+    if os.environ.get(MP_COMPILER_PATH_ENV):
+        return os.environ[MP_COMPILER_PATH_ENV]
+
+    bin_name = get_mp_bin_name()
+    if os.environ.get(MP_CACHE_DIR_ENV):
+        return os.path.join(os.environ[MP_CACHE_DIR_ENV], bin_name)
+
+    plat = platform.system().lower()
+    return resource_filename(__name__, "bin/metaparticle/{}/{}".format(plat, bin_name))
+
+
+def get_expected_checksum():
+    expected = os.environ.get(MP_SHA256_ENV)
+    if not expected:
+        logger.warn('{} is not set, the Metaparticle compiler archive will not be verified.'.format(
+            MP_SHA256_ENV))
+        return None
+    return expected.lower()
+
+
+def verify_checksum(archive_path, expected):
+    digest = hashlib.sha256()
+    with open(archive_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    digest = digest.hexdigest()
+
+    if digest != expected:
+        raise RuntimeError('Checksum mismatch for the Metaparticle compiler archive: '
+                           'expected {}, got {}'.format(expected, digest))
+
+
 def update_metaparticle():
     # TODO: we should dynamically find the latest tag using the github API
     # this would allow updating metaparticle without needing a new release of fairing
@@ -33,8 +82,10 @@ def update_metaparticle():
     # re = "https:\/\/[a-z\.\/-]*tag\/v[0-9].[0-9].[0-9]"
     # requests.get("{repo}/releases/latest".format(repo=repo), headers=headers)
 
+    expected_checksum = get_expected_checksum()
+
     logger.warn('Downloading Metaparticle compiler...')
-    base_url = "https://github.com/wbuchwalter/metaparticle-ast/releases/download/v0.6.0"
+    base_url = "https://github.com/wbuchwalter/metaparticle-ast/releases/download/{}".format(MP_VERSION)
     plat = platform.system().lower()
     ext = 'zip' if plat == 'windows' else 'tar.gz'
     full_url = "{base_url}/mp-compiler-{plat}-amd64.{ext}".format(
@@ -43,44 +94,75 @@ def update_metaparticle():
         ext=ext
     )
     r = requests.get(full_url, allow_redirects=True)
-    with tempfile.TemporaryDirectory() as tmp_dir:
+    r.raise_for_status()
+
+    install_path = get_mp_bin_path()
+    dir_path = os.path.dirname(install_path)
+    if not os.path.exists(dir_path):
+        os.makedirs(dir_path)
+
+    # Extract next to the destination so the final move is an atomic rename
+    with tempfile.TemporaryDirectory(dir=dir_path) as tmp_dir:
         archive_path = os.path.join(tmp_dir, 'mp-archive')
-        open(archive_path, 'wb+').write(r.content)
+        with open(archive_path, 'wb+') as f:
+            f.write(r.content)
+        if expected_checksum:
+            verify_checksum(archive_path, expected_checksum)
 
         archive = None
-        file_name = 'mp-compiler'
         if plat == 'windows':
             archive = zipfile.ZipFile(archive_path)
-            file_name += '.exe'
         else:
             archive = tarfile.open(archive_path)
         archive.extractall(tmp_dir)
         archive.close()
-        
-        logger.warn('Installing compiler at %s' %  get_mp_bin_path())
-
-        dir_path = os.path.dirname(get_mp_bin_path())
-        if not os.path.exists(dir_path):
-            os.makedirs(dir_path)
-        shutil.move(os.path.join(tmp_dir, file_name), dir_path)
-
-        os.chmod(get_mp_bin_path(),  stat.S_IEXEC |
-                                     stat.S_IREAD |
-                                     stat.S_IRGRP |
-                                     stat.S_IXGRP |
-                                     stat.S_IWRITE |
-                                     stat.S_IXOTH |
-                                     stat.S_IROTH)
+
+        logger.warn('Installing compiler at %s' % install_path)
+
+        tmp_bin_path = os.path.join(tmp_dir, get_mp_bin_name())
+        os.chmod(tmp_bin_path, stat.S_IEXEC |
+                               stat.S_IREAD |
+                               stat.S_IRGRP |
+                               stat.S_IXGRP |
+                               stat.S_IWRITE |
+                               stat.S_IXOTH |
+                               stat.S_IROTH)
+        os.replace(tmp_bin_path, install_path)
     logger.warn('Metaparticle compiler succesfully installed.')
 
+
+@contextmanager
+def install_lock(install_path):
+    """Prevents concurrent processes from downloading the compiler at the same time"""
+    lock_path = os.path.join(os.path.dirname(install_path), '.mp-compiler.lock')
+    if fcntl is None:
+        yield
+        return
+    with open(lock_path, 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
 def ensure_metaparticle_present():
+    """Returns the path of the compiler, downloading it on first use if needed"""
     install_path = get_mp_bin_path()
     if os.path.exists(install_path):
-        return
-    update_metaparticle()
-
+        return install_path
+    if os.environ.get(MP_COMPILER_PATH_ENV):
+        raise RuntimeError('Metaparticle compiler not found at {} (set by {})'.format(
+            install_path, MP_COMPILER_PATH_ENV))
 
-ensure_metaparticle_present()
+    dir_path = os.path.dirname(install_path)
+    if not os.path.exists(dir_path):
+        os.makedirs(dir_path)
+    with install_lock(install_path):
+        # Another process might have installed it while we were waiting for the lock
+        if not os.path.exists(install_path):
+            update_metaparticle()
+    return install_path
 
 
 class MetaparticleClient(object):
@@ -92,12 +174,12 @@ class MetaparticleClient(object):
         with open('.metaparticle/spec.json', 'w') as out:
             json.dump(svc, out)
 
-        subprocess.check_call([get_mp_bin_path(), '-f', '.metaparticle/spec.json'])
+        subprocess.check_call([ensure_metaparticle_present(), '-f', '.metaparticle/spec.json'])
 
     def cancel(self, name):
         subprocess.check_call(
-            [get_mp_bin_path(), '-f', '.metaparticle/spec.json', '--delete'])
+            [ensure_metaparticle_present(), '-f', '.metaparticle/spec.json', '--delete'])
 
     def logs(self, name):
         subprocess.check_call(
-            [get_mp_bin_path(), '-f', '.metaparticle/spec.json', '--deploy=false', '--attach=true'])
+            [ensure_metaparticle_present(), '-f', '.metaparticle/spec.json', '--deploy=false', '--attach=true'])
@@ -4,4 +4,8 @@ from collections import namedtuple
 # This would need to be supported in the AST
 class TensorboardOptions(namedtuple('Tensorboard', 'log_dir, pvc_name, public')):
   def __new__(cls, log_dir, pvc_name, public):
-    return super(TensorboardOptions, cls).__new__(cls, log_dir, pvc_name, public)
\ No newline at end of file
+    return super(TensorboardOptions, cls).__new__(cls, log_dir, pvc_name, public)
+
+class PackageOptions(namedtuple('Package', 'repository, name, publish')):
+  def __new__(cls, repository, name, publish=False):
+    return super(PackageOptions, cls).__new__(cls, repository, name, publish)
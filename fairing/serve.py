@@ -1,33 +1,68 @@
+import inspect
 import signal
 import sys
 import shutil
-import http.server
 import logging
+import threading
 
 from fairing.backend import NativeBackend
-from fairing.docker import DockerBuilder
+from fairing.builders.docker import DockerBuilder
 from fairing.utils import is_runtime_phase
 from fairing.options import PackageOptions
-import fairing.metaparticle as mp
+from fairing.metaparticle import MetaparticleClient
+from fairing.deployers import get_deployer
+from fairing.serving.app import ServingApp, READY_ROUTE
+from fairing.serving.cache import PredictionCache
+from fairing.serving.server import get_server, get_default_workers
 
 logger = logging.getLogger('fairing')
 
-user_function = None
-serving_route = None
-
 
 class Serve(object):
+    """Serves the decorated function, or class, on route.
+
+    A class is instantiated once per replica. Its load method is called first,
+    then its warmup method can return synthetic payloads that are predicted
+    before the replica is reported ready on /ready. Its predict method
+    receives a list of payloads and returns the list of their results.
+
+    Each replica answers requests with workers threads, using the 'threaded'
+    engine or the 'asyncio' one. At most max_queue requests wait for a worker,
+    the others get a 503, and idle connections are kept alive for keep_alive
+    seconds. On SIGTERM, the server stops accepting connections and exits once
+    the pending requests are answered, or after drain_timeout seconds.
+
+    With a max_batch_size, the function receives the list of the payloads of
+    up to max_batch_size requests received within max_latency_ms, and returns
+    the list of their results.
 
-    def __init__(self, package, route='/predict', port=8080, replicas=1):
-        global serving_route
-        serving_route = route
+    With cache, responses are cached by payload, see PredictionCache for its
+    bounds. cache can also be a PredictionCache.
 
+    The server is deployed with the Metaparticle compiler, or with the given
+    deployer (see fairing.deployers), 'kubernetes' configures the readiness
+    probe of the replicas."""
+
+    def __init__(self, package, route='/predict', port=8080, replicas=1,
+                 engine='threaded', workers=None, max_queue=64, keep_alive=5, drain_timeout=30,
+                 max_batch_size=None, max_latency_ms=5, cache=False, deployer=None):
         # For now we force native backend for serving,
         # we might want to give more option later, i.e using seldon + kubeflow
         self.backend = NativeBackend()
         self.route = route
         self.port = port
         self.replicas = replicas
+        self.engine = engine
+        self.workers = workers
+        self.max_queue = max_queue
+        self.keep_alive = keep_alive
+        self.drain_timeout = drain_timeout
+        self.max_batch_size = max_batch_size
+        self.max_latency_ms = max_latency_ms
+        self.cache = cache if isinstance(cache, PredictionCache) else None
+        if cache is True:
+            self.cache = PredictionCache()
+        self.deployer = deployer
         self.package = PackageOptions(**package)
         self.image = "{repo}/{name}:latest".format(
             repo=self.package.repository,
@@ -40,16 +75,18 @@ class Serve(object):
         def wrapped():
             if is_runtime_phase():
                 return self.serve(func)
-          
+
             ast = self.backend.compile_serving_ast(
-                self.image, self.package.name, self.port, self.replicas)
+                self.image, self.package.name, self.port, self.replicas, READY_ROUTE)
 
-            self.builder.write_dockerfile(self.package)
+            self.builder.dockerfile.write(None)
             self.builder.build(self.image)
 
             if self.package.publish:
                 self.builder.publish(self.image)
 
+            mp = self.get_metaparticle_client()
+
             def signal_handler(signal, frame):
                 mp.cancel(self.package.name)
                 sys.exit(0)
@@ -61,22 +98,42 @@ class Serve(object):
             return mp.logs(self.package.name)
         return wrapped
 
+    def get_metaparticle_client(self):
+        if self.deployer is None:
+            return MetaparticleClient()
+        return get_deployer(self.deployer)
+
+    def get_server(self, func):
+        model = None
+        if inspect.isclass(func):
+            model = func()
+            func = model.predict
+        app = ServingApp(func, self.route, self.max_batch_size, self.max_latency_ms, model, self.cache)
+        workers = self.workers
+        if workers is None and self.max_batch_size:
+            # Requests wait for their batch on a worker, there must be enough to fill it
+            workers = max(get_default_workers(), self.max_batch_size)
+        return get_server(self.engine, app,
+                          port=self.port,
+                          workers=workers,
+                          max_queue=self.max_queue,
+                          keep_alive=self.keep_alive,
+                          drain_timeout=self.drain_timeout)
+
+    def start(self, server):
+        try:
+            server.app.start()
+        except Exception:
+            logger.exception('The model could not be loaded.')
+            server.drain()
+
     def serve(self, func):
-        global user_function
-        user_function = func
-        # TODO: Serve only on url passed to decorator + port
-        httpd = http.server.HTTPServer(('', self.port), HTTPHandler)
-        logger.warn('Server running on port 8080...')
-        httpd.serve_forever()
-
-
-class HTTPHandler(http.server.BaseHTTPRequestHandler):
-    def do_GET(self):
-        if self.path == serving_route:
-            self.send_response(200)
-            self.send_header('Content-type', 'text/html')
-            self.end_headers()
-            # TODO: Handle parameters + error catching
-            res = user_function()
-            self.wfile.write(bytes(res, "utf8"))
-        return
+        server = self.get_server(func)
+        # Kubernetes sends SIGTERM before killing the pod
+        signal.signal(signal.SIGTERM, lambda signum, frame: server.drain())
+        # The model is loaded in the background, the server reports it isn't ready meanwhile
+        threading.Thread(target=self.start, args=(server,), daemon=True).start()
+        logger.warn('Server running on port {} with {} workers...'.format(server.port, server.workers))
+        server.run()
+        if not server.app.ready:
+            sys.exit(1)
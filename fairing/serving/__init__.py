@@ -0,0 +1,3 @@
+from fairing.serving.app import ServingApp, Request, Response
+from fairing.serving.server import get_server, Engines, ThreadedServer, AsyncioServer
+from fairing.serving.cache import PredictionCache
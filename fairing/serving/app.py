@@ -0,0 +1,210 @@
+import http
+import logging
+import time
+import urllib.parse
+
+from fairing.serving.batching import Batcher
+from fairing.serving.cache import get_cache_key
+from fairing.serving.codecs import CODECS, JSON, UnsupportedContentType, decode, get_codec, negotiate
+from fairing.serving.metrics import Metrics
+
+logger = logging.getLogger('fairing')
+
+METRICS_ROUTE = '/metrics'
+READY_ROUTE = '/ready'
+
+
+class Request(object):
+    def __init__(self, method, path, headers=None, body=b'', version='HTTP/1.1'):
+        self.method = method
+        self.path, _, self.query = path.partition('?')
+        # Header names are lower case
+        self.headers = headers or {}
+        self.body = body
+        self.version = version
+
+    @property
+    def keep_alive(self):
+        connection = self.headers.get('connection', '').lower()
+        if self.version == 'HTTP/1.0':
+            return connection == 'keep-alive'
+        return connection != 'close'
+
+
+class Response(object):
+    def __init__(self, status, body=b'', content_type='text/plain', headers=None):
+        self.status = status
+        self.body = body if isinstance(body, bytes) else bytes(body, 'utf8')
+        self.content_type = content_type
+        self.headers = headers or {}
+
+    def encode(self, keep_alive=True):
+        """Returns the HTTP/1.1 message of the response"""
+        lines = ['HTTP/1.1 {} {}'.format(self.status, http.HTTPStatus(self.status).phrase),
+                 'Content-Type: {}'.format(self.content_type),
+                 'Content-Length: {}'.format(len(self.body))]
+        lines.extend('{}: {}'.format(k, v) for k, v in self.headers.items())
+        if not keep_alive:
+            lines.append('Connection: close')
+        return bytes('\r\n'.join(lines) + '\r\n\r\n', 'latin-1') + self.body
+
+
+def unavailable():
+    """Returned when a request is shed because the server is overloaded or draining"""
+    return Response(503, headers={'Retry-After': '1'})
+
+
+class ServingApp(object):
+    """Answers the requests received by a server, whatever its engine.
+
+    GET requests on route call the user function, /metrics exposes the
+    metrics of the server and /ready answers 200 once the app is ready.
+
+    On POST, the function is called with the payload of the request, decoded
+    according to its Content-Type (see fairing.serving.codecs), and the result is
+    encoded in the format requested by its Accept header.
+
+    With a max_batch_size, the function is called with a list of payloads, the
+    bodies or the query parameters of the requests, and returns their results.
+
+    With a model, its predict method is called with a list of payloads, of a single
+    one without a max_batch_size. The model is loaded and warmed up by start,
+    predictions are only answered once it is done.
+
+    With a cache (see fairing.serving.cache), the responses of requests with
+    the same payload are predicted once."""
+
+    def __init__(self, func, route='/predict', max_batch_size=None, max_latency_ms=5, model=None,
+                 cache=None):
+        self.func = func
+        self.route = route
+        self.model = model
+        self.cache = cache
+        # Functions don't need to be loaded
+        self.ready = model is None
+        self.draining = False
+        self.metrics = Metrics()
+        self.batcher = None
+        if max_batch_size:
+            self.batcher = Batcher(func, max_batch_size, max_latency_ms, self.metrics)
+        self.metrics.describe('fairing_serving_requests_total', 'Requests answered, by status code.')
+        self.metrics.describe('fairing_serving_rejected_total', 'Requests shed with a 503.')
+        self.metrics.describe('fairing_serving_request_seconds_total', 'Time spent answering requests.')
+        if cache is not None:
+            self.metrics.describe('fairing_serving_cache_hits_total', 'Responses found in the cache.')
+            self.metrics.describe('fairing_serving_cache_misses_total', 'Responses predicted and cached.')
+            self.metrics.gauge('fairing_serving_cache_entries', lambda: len(cache))
+            self.metrics.gauge('fairing_serving_cache_bytes', lambda: cache.bytes)
+
+    def start(self):
+        """Loads the model, and runs its warm up predictions"""
+        if self.model is not None:
+            load = getattr(self.model, 'load', None)
+            if callable(load):
+                load()
+            warmup = getattr(self.model, 'warmup', None)
+            if callable(warmup):
+                # Synthetic payloads, predicted as a single batch
+                payloads = warmup()
+                if payloads:
+                    self.func(list(payloads))
+        self.ready = True
+        logger.warn('Ready to serve predictions.')
+
+    def drain(self):
+        """Reports the app as not ready anymore, so no new requests are routed to it"""
+        self.draining = True
+
+    def handle(self, request):
+        if request.path == METRICS_ROUTE:
+            return Response(200, self.metrics.render(), 'text/plain; version=0.0.4')
+        if request.path == READY_ROUTE:
+            if self.ready and not self.draining:
+                return Response(200, 'ok')
+            return unavailable()
+
+        start = time.time()
+        response = self.dispatch(request)
+        self.metrics.inc('fairing_serving_requests_total', code=response.status)
+        self.metrics.inc('fairing_serving_request_seconds_total', time.time() - start)
+        return response
+
+    def dispatch(self, request):
+        if request.path != self.route:
+            return Response(404)
+        if not self.ready:
+            return self.reject()
+        if request.method not in ('GET', 'POST'):
+            return Response(405)
+        # Functions without batching are called without arguments on GET, as they always were
+        plain = self.batcher is None and self.model is None
+        if plain and request.method == 'GET':
+            return self.predict(request, self.func)
+
+        try:
+            payload = parse_payload(request)
+        except UnsupportedContentType as e:
+            return Response(415, str(e))
+        except Exception as e:
+            return Response(400, 'Invalid payload: {}'.format(e))
+        key = None
+        if self.cache is not None:
+            # The format of the response depends on the headers too
+            key = get_cache_key(payload, request.headers.get('accept'), request.headers.get('content-type'))
+        if key is not None:
+            response = self.cache.get(key)
+            if response is not None:
+                self.metrics.inc('fairing_serving_cache_hits_total')
+                return response
+            self.metrics.inc('fairing_serving_cache_misses_total')
+
+        if plain:
+            response = self.predict(request, self.func, payload)
+        else:
+            response = self.predict(request, self.predict_payload, payload)
+        if key is not None and response.status == 200:
+            self.cache.put(key, response)
+        return response
+
+    def predict_payload(self, payload):
+        if self.batcher is not None:
+            return self.batcher.predict(payload)
+        return self.func([payload])[0]
+
+    def predict(self, request, func, *args):
+        try:
+            res = func(*args)
+        except Exception:
+            logger.exception('Prediction failed')
+            return Response(500)
+        return self.encode(request, res)
+
+    def encode(self, request, res):
+        """Encodes res in the format preferred by the client, the one
+        of its request by default, or JSON"""
+        accept = request.headers.get('accept')
+        if isinstance(res, (str, bytes)) and accept in (None, '', '*/*'):
+            return Response(200, res, 'text/html' if isinstance(res, str) else 'application/octet-stream')
+
+        default = get_codec(request.headers.get('content-type') or JSON) if request.body else None
+        codec = negotiate(accept, default or get_codec(JSON))
+        if codec is None:
+            return Response(406, 'Results can be encoded as: {}'.format(
+                ', '.join(c.content_type for c in CODECS if c.available())))
+        try:
+            return Response(200, codec.encode(res), codec.content_type)
+        except Exception:
+            logger.exception('Could not encode the result as {}'.format(codec.content_type))
+            return Response(500)
+
+    def reject(self):
+        self.metrics.inc('fairing_serving_rejected_total')
+        return unavailable()
+
+
+def parse_payload(request):
+    """Returns the decoded body of the request, or its query parameters"""
+    if request.body:
+        return decode(request.headers.get('content-type'), request.body)
+    params = urllib.parse.parse_qs(request.query)
+    return {k: v[0] if len(v) == 1 else v for k, v in params.items()}
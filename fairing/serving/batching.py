@@ -0,0 +1,73 @@
+import concurrent.futures
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger('fairing')
+
+
+class Batcher(object):
+    """Groups the payloads of concurrent requests into batches for func,
+    which receives a list of payloads and returns the list of their results.
+
+    A batch is run once it holds max_batch_size payloads, or max_latency_ms
+    after its first payload arrived. Batches run one at a time, so the requests
+    arriving while the model is busy make up the next batch: batches grow with
+    the load, and a lone request waits at most max_latency_ms.
+    Each request waits for its result on its worker, the server needs
+    at least max_batch_size workers to fill the batches."""
+
+    def __init__(self, func, max_batch_size=32, max_latency_ms=5, metrics=None):
+        self.func = func
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency_ms / 1000.
+        self.metrics = metrics
+        self.pending = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def predict(self, payload):
+        """Returns the result of payload once its batch ran"""
+        future = concurrent.futures.Future()
+        self.start()
+        self.pending.put((payload, future))
+        return future.result()
+
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='fairing-batcher', daemon=True)
+                self.thread.start()
+
+    def run(self):
+        while True:
+            self.run_batch(self.next_batch())
+
+    def next_batch(self):
+        batch = [self.pending.get()]
+        deadline = time.time() + self.max_latency
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self.pending.get(timeout=max(deadline - time.time(), 0)))
+            except queue.Empty:
+                break
+        return batch
+
+    def run_batch(self, batch):
+        payloads = [payload for payload, _ in batch]
+        if self.metrics is not None:
+            self.metrics.inc('fairing_serving_batches_total')
+            self.metrics.inc('fairing_serving_batched_requests_total', len(batch))
+        try:
+            results = self.func(payloads)
+            if len(results) != len(payloads):
+                raise ValueError('{} results were returned for a batch of {} requests'.format(
+                    len(results), len(payloads)))
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
@@ -0,0 +1,100 @@
+import collections
+import hashlib
+import threading
+import time
+
+import numpy as np
+
+
+class PredictionCache(object):
+    """Responses of the predictions, keyed by a hash of their request payload.
+
+    Holds at most max_entries responses and max_bytes of response bodies,
+    the least recently used are evicted first. Responses expire ttl seconds
+    after they were predicted."""
+
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024, ttl=60):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        # key -> (expiry time, response), least recently used first
+        self.entries = collections.OrderedDict()
+        self.bytes = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """Returns the response cached for key, or None"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, response = entry
+            if expires <= time.time():
+                self._remove(key)
+                return None
+            self.entries.move_to_end(key)
+            return response
+
+    def put(self, key, response):
+        size = len(response.body)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (time.time() + self.ttl, response)
+            self.bytes += size
+            while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+
+    def _remove(self, key):
+        _, response = self.entries.pop(key)
+        self.bytes -= len(response.body)
+
+
+def get_cache_key(payload, *context):
+    """Returns a hash of payload that doesn't depend on the order of its keys
+    or the layout of its arrays, None if it contains unsupported types"""
+    digest = hashlib.sha256()
+    for value in context:
+        _update(digest, value)
+    try:
+        _update(digest, payload)
+    except (TypeError, ValueError):
+        return None
+    return digest.hexdigest()
+
+
+def _update(digest, value):
+    # Every value is prefixed with its type, so that 1, '1' and [1] differ
+    if value is None or isinstance(value, (bool, int, float, np.generic)):
+        digest.update(bytes('{}:{!r};'.format(type(value).__name__, value), 'utf8'))
+    elif isinstance(value, str):
+        _update_bytes(digest, b's', bytes(value, 'utf8'))
+    elif isinstance(value, bytes):
+        _update_bytes(digest, b'b', value)
+    elif isinstance(value, np.ndarray):
+        if value.dtype.hasobject:
+            raise TypeError('Arrays of objects are not hashed')
+        digest.update(bytes('a:{}:{};'.format(value.dtype.str, value.shape), 'utf8'))
+        # A view of the array's memory, it is only copied if it isn't contiguous
+        digest.update(np.ascontiguousarray(value).view(np.uint8))
+    elif isinstance(value, (list, tuple)):
+        digest.update(bytes('l:{};'.format(len(value)), 'utf8'))
+        for item in value:
+            _update(digest, item)
+    elif isinstance(value, dict):
+        digest.update(bytes('d:{};'.format(len(value)), 'utf8'))
+        for k in sorted(value, key=str):
+            _update(digest, k)
+            _update(digest, value[k])
+    else:
+        raise TypeError('{} is not hashed'.format(type(value).__name__))
+
+
+def _update_bytes(digest, tag, value):
+    digest.update(tag + bytes(':{};'.format(len(value)), 'utf8'))
+    digest.update(value)
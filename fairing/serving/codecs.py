@@ -0,0 +1,168 @@
+import io
+import json
+
+import numpy as np
+
+# Optional, the formats they implement are only accepted when they are installed
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+JSON = 'application/json'
+
+
+class UnsupportedContentType(ValueError):
+    pass
+
+
+class Codec(object):
+    """Decodes request payloads of a content type, and encodes results to it"""
+
+    content_type = None
+    aliases = ()
+
+    def available(self):
+        return True
+
+    def decode(self, body):
+        raise NotImplementedError()
+
+    def encode(self, value):
+        raise NotImplementedError()
+
+
+class JsonCodec(Codec):
+    content_type = JSON
+
+    def decode(self, body):
+        return json.loads(body.decode('utf8'))
+
+    def encode(self, value):
+        return bytes(json.dumps(value, default=to_builtin), 'utf8')
+
+
+class MsgpackCodec(Codec):
+    content_type = 'application/msgpack'
+    aliases = ('application/x-msgpack',)
+
+    def available(self):
+        return msgpack is not None
+
+    def decode(self, body):
+        return msgpack.unpackb(body, raw=False)
+
+    def encode(self, value):
+        return msgpack.packb(value, default=to_builtin, use_bin_type=True)
+
+
+class NpyCodec(Codec):
+    """NumPy arrays in the .npy format. Decoded arrays are read-only
+    views of the request body, nothing is copied."""
+
+    content_type = 'application/x-npy'
+
+    def decode(self, body):
+        stream = io.BytesIO(body)
+        version = np.lib.format.read_magic(stream)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(stream)
+        elif version == (2, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(stream)
+        else:
+            return np.load(io.BytesIO(body), allow_pickle=False)
+        if dtype.hasobject:
+            raise ValueError('Arrays of objects are not accepted')
+
+        count = int(np.prod(shape))
+        array = np.frombuffer(body, dtype=dtype, count=count, offset=stream.tell())
+        return array.reshape(shape, order='F' if fortran_order else 'C')
+
+    def encode(self, value):
+        stream = io.BytesIO()
+        np.save(stream, np.asarray(value), allow_pickle=False)
+        return stream.getvalue()
+
+
+class ArrowCodec(Codec):
+    """Tables in the Arrow IPC stream format, decoded to a dict of column name -> array.
+    Columns without nulls are views of the request body."""
+
+    content_type = 'application/vnd.apache.arrow.stream'
+
+    def available(self):
+        return pyarrow is not None
+
+    def decode(self, body):
+        table = pyarrow.ipc.open_stream(pyarrow.py_buffer(body)).read_all()
+        return {name: column.to_numpy() for name, column in zip(table.column_names, table.columns)}
+
+    def encode(self, value):
+        # A table, a record batch, or a dict of column name -> array
+        table = value
+        if not isinstance(value, (pyarrow.Table, pyarrow.RecordBatch)):
+            table = pyarrow.table(value)
+        sink = pyarrow.BufferOutputStream()
+        with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+            writer.write(table)
+        return sink.getvalue().to_pybytes()
+
+
+CODECS = [JsonCodec(), MsgpackCodec(), NpyCodec(), ArrowCodec()]
+
+
+def to_builtin(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError('Object of type {} is not serializable'.format(type(value).__name__))
+
+
+def get_codec(content_type):
+    """Returns the codec of content_type, or None if it isn't supported"""
+    content_type = content_type.split(';')[0].strip().lower()
+    for codec in CODECS:
+        if content_type in (codec.content_type,) + codec.aliases and codec.available():
+            return codec
+    return None
+
+
+def decode(content_type, body):
+    codec = get_codec(content_type or JSON)
+    if codec is None:
+        raise UnsupportedContentType('Unsupported content type: {}'.format(content_type))
+    return codec.decode(body)
+
+
+def negotiate(accept, default):
+    """Returns the codec of the preferred type of the Accept header,
+    default if any type is accepted, or None if none is supported"""
+    if not accept:
+        return default
+    media_ranges = []
+    for i, media_range in enumerate(accept.split(',')):
+        content_type, _, params = media_range.partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    pass
+        if quality > 0:
+            # Highest quality first, in the order of the header when equal
+            media_ranges.append((-quality, i, content_type.strip().lower()))
+
+    for _, _, content_type in sorted(media_ranges):
+        if content_type in ('*/*', 'application/*'):
+            return default
+        codec = get_codec(content_type)
+        if codec is not None:
+            return codec
+    return None
@@ -0,0 +1,55 @@
+import threading
+
+
+class Metrics(object):
+    """Counters and gauges of a server, rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # (name, sorted labels) -> value
+        self.counters = {}
+        # name -> function returning the current value
+        self.gauges = {}
+        self.help = {}
+
+    def describe(self, name, text):
+        self.help[name] = text
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def get(self, name, **labels):
+        return self.counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def gauge(self, name, func):
+        """Registers a gauge whose value is read from func when rendered"""
+        self.gauges[name] = func
+
+    def render(self):
+        with self.lock:
+            counters = sorted(self.counters.items())
+        lines = []
+        described = set()
+        for (name, labels), value in counters:
+            if name not in described:
+                lines.extend(self._header(name, 'counter'))
+                described.add(name)
+            lines.append('{}{} {}'.format(name, _format_labels(labels), value))
+        for name, func in sorted(self.gauges.items()):
+            lines.extend(self._header(name, 'gauge'))
+            lines.append('{} {}'.format(name, func()))
+        return '\n'.join(lines) + '\n'
+
+    def _header(self, name, metric_type):
+        lines = ['# TYPE {} {}'.format(name, metric_type)]
+        if name in self.help:
+            lines.insert(0, '# HELP {} {}'.format(name, self.help[name]))
+        return lines
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(k, v) for k, v in labels) + '}'
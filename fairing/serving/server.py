@@ -0,0 +1,317 @@
+import asyncio
+import concurrent.futures
+import http.server
+import logging
+import os
+import queue
+import socket
+import threading
+import time
+from enum import Enum
+
+from fairing.serving.app import Request
+
+logger = logging.getLogger('fairing')
+
+
+class Engines(Enum):
+    THREADED = 1
+    ASYNCIO = 2
+
+
+def get_server(engine, app, **kwargs):
+    """Returns a server of the given engine answering requests with app"""
+    if engine is None:
+        return ThreadedServer(app, **kwargs)
+
+    try:
+        engine = Engines[engine.upper()]
+    except KeyError:
+        raise ValueError("Unsupported serving engine: ", engine)
+
+    if engine == Engines.THREADED:
+        return ThreadedServer(app, **kwargs)
+    elif engine == Engines.ASYNCIO:
+        return AsyncioServer(app, **kwargs)
+
+
+def get_default_workers():
+    # The CPUs this process may run on, which can be fewer than the machine has
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+class ServingHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        # Idle keep-alive connections are closed after keep_alive seconds
+        self.timeout = self.server.keep_alive
+        http.server.BaseHTTPRequestHandler.setup(self)
+        self.server.track(self.connection, idle=True)
+
+    def finish(self):
+        self.server.untrack(self.connection)
+        http.server.BaseHTTPRequestHandler.finish(self)
+
+    def do_GET(self):
+        self.server.track(self.connection, idle=False)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        headers = {k.lower(): v for k, v in self.headers.items()}
+        request = Request(self.command, self.path, headers, body, self.request_version)
+
+        response = self.server.app.handle(request)
+        # Requests already received are answered while draining, but connections are not kept.
+        # Neither are they while others wait for this worker.
+        keep_alive = request.keep_alive and not self.server.draining and self.server.connections.empty()
+        self.close_connection = not keep_alive
+        self.wfile.write(response.encode(keep_alive))
+        self.server.track(self.connection, idle=True)
+
+    do_POST = do_GET
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+class ThreadedServer(http.server.HTTPServer):
+    """Accepts connections on the calling thread and hands them to a pool of
+    worker threads through a bounded queue. Connections arriving while
+    max_queue of them are already waiting for a worker get a 503.
+
+    A connection is served by the same worker until it is closed, so idle
+    keep-alive connections are closed after keep_alive seconds, and
+    connections are not kept alive while others are waiting."""
+
+    def __init__(self, app, port=8080, workers=None, max_queue=64, keep_alive=5, drain_timeout=30, host=''):
+        self.app = app
+        self.workers = workers or get_default_workers()
+        self.keep_alive = keep_alive
+        self.drain_timeout = drain_timeout
+        self.draining = False
+        self.connections = queue.Queue(max_queue)
+        self.threads = []
+        # Connection -> whether it is waiting for its next request
+        self.idle = {}
+        self.idle_lock = threading.Lock()
+        # Backlog of the listening socket
+        self.request_queue_size = max(max_queue, 5)
+        http.server.HTTPServer.__init__(self, (host, port), ServingHandler)
+        app.metrics.gauge('fairing_serving_queued', self.connections.qsize)
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def run(self):
+        """Serves until drained"""
+        self.threads = [threading.Thread(target=self.work, name='fairing-serving-{}'.format(i), daemon=True)
+                        for i in range(self.workers)]
+        for thread in self.threads:
+            thread.start()
+        try:
+            self.serve_forever()
+        finally:
+            self.server_close()
+            self.close_idle_connections()
+            # Workers finish the queued connections before reaching their sentinel
+            deadline = time.time() + self.drain_timeout
+            try:
+                for _ in self.threads:
+                    self.connections.put(None, timeout=max(deadline - time.time(), 0))
+            except queue.Full:
+                pass
+            for thread in self.threads:
+                thread.join(max(deadline - time.time(), 0))
+
+    def drain(self):
+        """Stops accepting connections and returns from run once the
+        received requests are answered, or after drain_timeout seconds.
+        Can be called from a signal handler."""
+        if self.draining:
+            return
+        logger.warn('Draining the server...')
+        self.draining = True
+        self.app.drain()
+        # shutdown waits for serve_forever to return, it can't be called from its thread
+        threading.Thread(target=self.shutdown, daemon=True).start()
+
+    def track(self, connection, idle):
+        with self.idle_lock:
+            self.idle[connection] = idle
+            if idle and self.draining:
+                # Wakes up the worker waiting for the next request
+                _shutdown_read(connection)
+
+    def untrack(self, connection):
+        with self.idle_lock:
+            self.idle.pop(connection, None)
+
+    def close_idle_connections(self):
+        with self.idle_lock:
+            for connection, idle in self.idle.items():
+                if idle:
+                    _shutdown_read(connection)
+
+    def process_request(self, request, client_address):
+        try:
+            self.connections.put_nowait((request, client_address))
+        except queue.Full:
+            self.reject(request)
+
+    def reject(self, request):
+        try:
+            request.sendall(self.app.reject().encode(keep_alive=False))
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+    def work(self):
+        while True:
+            item = self.connections.get()
+            if item is None:
+                return
+            request, client_address = item
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+
+def _shutdown_read(connection):
+    try:
+        connection.shutdown(socket.SHUT_RD)
+    except OSError:
+        pass
+
+
+# Only a method of Task before Python 3.7
+current_task = getattr(asyncio, 'current_task', None) or asyncio.Task.current_task
+
+
+def new_event_loop():
+    try:
+        import uvloop
+    except ImportError:
+        return asyncio.new_event_loop()
+    return uvloop.new_event_loop()
+
+
+class AsyncioServer(object):
+    """Handles the connections from an event loop, uvloop's when it is installed,
+    and answers the requests on a pool of worker threads. Requests arriving
+    while max_queue of them are already waiting for a worker get a 503.
+
+    Idle connections cost no worker, they are closed after keep_alive seconds."""
+
+    def __init__(self, app, port=8080, workers=None, max_queue=64, keep_alive=5, drain_timeout=30, host=''):
+        self.app = app
+        self.workers = workers or get_default_workers()
+        self.max_queue = max_queue
+        self.keep_alive = keep_alive
+        self.drain_timeout = drain_timeout
+        self.draining = False
+        # Requests waiting for, or being answered by, a worker
+        self.pending = 0
+        self.tasks = set()
+        self.executor = concurrent.futures.ThreadPoolExecutor(self.workers)
+        self.loop = new_event_loop()
+        self.drained = None
+        self.server = self.loop.run_until_complete(self.start_server(host, port))
+        self.port = self.server.sockets[0].getsockname()[1]
+        app.metrics.gauge('fairing_serving_queued', lambda: max(self.pending - self.workers, 0))
+
+    async def start_server(self, host, port):
+        # Before Python 3.10, asyncio objects are bound to the loop running when they are
+        # created, the default one outside of a coroutine
+        self.drained = asyncio.Event()
+        return await asyncio.start_server(
+            self.handle_connection, host or None, port, backlog=max(self.max_queue, 5))
+
+    def run(self):
+        """Serves until drained"""
+        try:
+            self.loop.run_until_complete(self.drained.wait())
+            self.loop.run_until_complete(self.finish())
+        finally:
+            self.executor.shutdown(wait=False)
+            self.loop.close()
+
+    def drain(self):
+        """Stops accepting connections and returns from run once the
+        received requests are answered, or after drain_timeout seconds.
+        Can be called from any thread or a signal handler."""
+        self.loop.call_soon_threadsafe(self._drain)
+
+    def _drain(self):
+        if self.draining:
+            return
+        logger.warn('Draining the server...')
+        self.draining = True
+        self.app.drain()
+        self.server.close()
+        self.drained.set()
+
+    async def finish(self):
+        deadline = self.loop.time() + self.drain_timeout
+        while self.pending and self.loop.time() < deadline:
+            await asyncio.sleep(0.05)
+        # The remaining connections are idle
+        for task in list(self.tasks):
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    async def handle_connection(self, reader, writer):
+        task = current_task()
+        self.tasks.add(task)
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(read_request(reader), self.keep_alive)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+                    break
+                if request is None:
+                    break
+
+                self.pending += 1
+                try:
+                    if self.pending > self.workers + self.max_queue:
+                        response = self.app.reject()
+                    else:
+                        response = await self.loop.run_in_executor(self.executor, self.app.handle, request)
+                    keep_alive = request.keep_alive and not self.draining
+                    writer.write(response.encode(keep_alive))
+                    await writer.drain()
+                finally:
+                    self.pending -= 1
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            self.tasks.discard(task)
+            writer.close()
+
+
+async def read_request(reader):
+    """Reads the next request of a connection, returns None once it is closed"""
+    line = await reader.readline()
+    if not line.strip():
+        return None
+    method, path, version = line.decode('latin-1').split()
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if not line.strip():
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    length = int(headers.get('content-length') or 0)
+    body = await reader.readexactly(length) if length else b''
+    return Request(method, path, headers, body, version)
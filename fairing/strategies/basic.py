@@ -7,6 +7,32 @@ class BasicTrainingStrategy(object):
   def add_training(self, svc, repository, image_name, image_tag, volumes, volume_mounts):
    return self.arch.add_jobs(svc, self.runs, repository, image_name, image_tag, volumes, volume_mounts), None
 
+  def add_redis(self, svc, name):
+    """Adds a Redis service the runs can share state through,
+    returns the environment variable locating it"""
+    redis_hostname = '{}-redis'.format(name)
+    r_svc = {
+      "name": redis_hostname,
+      "replicas": 1,
+      "containers": [{
+        "image": "library/redis",
+      }],
+      "ports": [{
+        'number': 6379,
+        'protocol': 'TCP'
+      }]
+    }
+    if not "services" in svc:
+      svc["services"] = [r_svc]
+    else:
+      svc["services"].append(r_svc)
+
+    #Metaparticle seem to only support one serving endpoint?
+    svc["serve"] = {
+      "name": redis_hostname
+    }
+    return svc, {'name': 'REDIS_HOSTNAME', 'value': redis_hostname}
+
   def get_params(self):
     return {}
   
@@ -1,24 +1,146 @@
 import types
+import logging
+import os
 from fairing.strategies.basic import BasicTrainingStrategy
+from fairing.strategies.space import SearchSpace
+from fairing.strategies.trials import RedisTrialStore, new_trial, COMPLETED, FAILED, PRUNED
+
+logger = logging.getLogger('fairing')
 
 
 class HyperparameterTuning(BasicTrainingStrategy):
-    def __init__(self, runs=1):
+    """Trains runs copies of the model with different hyperparameters.
+
+    Without a search, each run gets the values of the model's hyperparameters method.
+    With one, each run claims the next trial of the search over space, and the
+    metric returned by train is recorded in the trials store. A Redis service is
+    deployed to hold the trials if no store is given.
+
+    With a pruner, train also receives a reporter to call with intermediate metrics,
+    it returns True when the trial should stop early."""
+
+    def __init__(self, runs=1, space=None, search=None, trials=None, pruner=None):
         super(HyperparameterTuning, self).__init__()
         self.runs = runs
+        if search is not None and space is None:
+            raise ValueError('A search requires a hyperparameter space')
+        self.space = SearchSpace(space) if isinstance(space, dict) else space
+        self.search = search
+        self.trials = trials
+        self.pruner = pruner
 
     # def get_params(self):
     #   if isinstance(self.hyperparameters, types.FunctionType):
     #     return self.hyperparameters()
     #   return self.hyperparameters
 
+    def add_training(self, svc, repository, image_name, image_tag, volumes, volume_mounts):
+        if not self.tracks_trials() or self.trials is not None:
+            return super(HyperparameterTuning, self).add_training(
+                svc, repository, image_name, image_tag, volumes, volume_mounts)
+
+        svc, redis_env = self.add_redis(svc, image_name)
+        svc = self.arch.add_jobs(svc, self.runs, repository, image_name, image_tag, volumes, volume_mounts)
+        return svc, [redis_env]
+
+    def tracks_trials(self):
+        return self.search is not None or self.pruner is not None
+
+    def get_stores(self):
+        """Stores shared by the runs, None when it is deployed with the job"""
+        return [self.trials] if self.tracks_trials() else []
+
     def exec_user_code(self, user_object):
+        if self.tracks_trials():
+            self.run_trial(user_object)
+            return
+
+        hp = self.get_user_params(user_object)
+        user_object.build(hp)
+        user_object.train(hp)
+        # return user_func(**self.get_params())
+
+    def get_user_params(self, user_object):
         hp = None
 
         # hyperparameters method is not mandatory
         hp_func = getattr(user_object, "hyperparameters", None)
         if callable(hp_func):
             hp = hp_func()
-        user_object.build(hp)
-        user_object.train(hp)
-        # return user_func(**self.get_params())
+        return hp
+
+    def initialize_trials(self):
+        if self.trials is None:
+            self.trials = RedisTrialStore(host=os.environ.get('REDIS_HOSTNAME'))
+
+    def start_trial(self, user_object):
+        """Claims the next trial of the search, returns None once it is exhausted"""
+        self.initialize_trials()
+        trial_id = self.trials.claim_trial_id()
+        if self.search is None:
+            hp = self.get_user_params(user_object)
+        else:
+            hp = self.search.suggest(trial_id, self.space, self.trials.get_trials())
+            if hp is None:
+                return None
+        trial = new_trial(trial_id, hp)
+        self.trials.save_trial(trial)
+        return trial
+
+    def run_trial(self, user_object):
+        trial = self.start_trial(user_object)
+        if trial is None:
+            logger.warn('The search is exhausted, nothing left to train.')
+            return
+
+        logger.warn('Starting trial {} with {}'.format(trial['id'], trial['hp']))
+        user_object.build(trial['hp'])
+        reporter = None
+        try:
+            if self.pruner is None:
+                metric = user_object.train(trial['hp'])
+            else:
+                reporter = TrialReporter(trial, self.trials, self.pruner)
+                metric = user_object.train(trial['hp'], reporter)
+        except Exception:
+            trial['state'] = FAILED
+            self.trials.save_trial(trial)
+            raise
+
+        trial['state'] = COMPLETED
+        if reporter and reporter.pruned:
+            logger.warn('Trial {} was pruned at step {}'.format(
+                trial['id'], trial['intermediate'][-1][0]))
+            trial['state'] = PRUNED
+            metric = trial['intermediate'][-1][1]
+        elif metric is None and trial['intermediate']:
+            metric = trial['intermediate'][-1][1]
+        trial['metric'] = to_python(metric)
+        self.trials.save_trial(trial)
+        return trial
+
+
+class TrialReporter(object):
+    """Callback passed to train to report intermediate metrics of a trial"""
+
+    def __init__(self, trial, trials, pruner):
+        self.trial = trial
+        self.trials = trials
+        self.pruner = pruner
+        self.pruned = False
+
+    def __call__(self, metric, step=None):
+        """Records the metric at step, the number of reports so far by default.
+        Returns True if the trial should stop."""
+        if step is None:
+            step = len(self.trial['intermediate']) + 1
+        self.trial['intermediate'].append([step, to_python(metric)])
+        self.pruned = self.pruner.should_prune(self.trial, self.trials.get_trials())
+        self.trials.save_trial(self.trial)
+        return self.pruned
+
+
+def to_python(metric):
+    if type(metric).__module__ == 'numpy':
+        return metric.item()
+    return metric
@@ -1 +1,3 @@
-from .pbt import PopulationBasedTraining
\ No newline at end of file
+from .pbt import PopulationBasedTraining
+from .scoreboard import RedisScoreboard, FileScoreboard, MemoryScoreboard
+from .lineage import get_hp_schedule
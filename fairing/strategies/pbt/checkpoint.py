@@ -0,0 +1,123 @@
+import contextlib
+import logging
+import os
+import shutil
+import uuid
+
+logger = logging.getLogger('fairing')
+
+# Directory of a snapshot holding one file per member currently reading it
+REFS_DIR = '.refs'
+
+
+class CheckpointStore(object):
+    """Immutable snapshots of the members' checkpoints, on the shared volume.
+
+    A snapshot is taken for every (member, step) the member reports, and that
+    snapshot is what other members restore from, so the member can keep
+    writing its live checkpoint while they read. Files are hard linked when
+    the filesystem allows it: frameworks such as TensorFlow write checkpoints
+    to a new file and rename it, which leaves the snapshot untouched.
+    Set hard_links to False if the checkpoint files are modified in place.
+
+    Only the keep_last most recent snapshots of each member are kept, and
+    never one a member is still restoring from."""
+
+    def __init__(self, root, keep_last=2, hard_links=True):
+        self.root = root
+        self.keep_last = keep_last
+        self.hard_links = hard_links
+
+    def get_snapshot_dir(self, member_id, step):
+        return os.path.join(self.root, member_id, str(step))
+
+    def snapshot(self, member_id, step, model_path):
+        """Snapshots the files of the checkpoint model_path, returns the path to restore it from.
+        model_path can also be a directory, i.e. a SavedModel, it is snapshotted as a whole."""
+        dst = self.get_snapshot_dir(member_id, step)
+        # Built next to its final location, a snapshot only appears once complete
+        tmp_dir = '{}.{}.tmp'.format(dst, uuid.uuid4().hex[:8])
+        os.makedirs(tmp_dir)
+        src_dir, prefix = os.path.split(os.path.normpath(model_path))
+        copy = _link_or_copy if self.hard_links else shutil.copy2
+        for name in os.listdir(src_dir or '.'):
+            src = os.path.join(src_dir, name)
+            # TensorFlow checkpoints are made of several files sharing the prefix,
+            # plus the 'checkpoint' index
+            if not (name.startswith(prefix) or name == 'checkpoint'):
+                continue
+            if os.path.isfile(src):
+                copy(src, os.path.join(tmp_dir, name))
+            elif os.path.isdir(src) and os.path.abspath(src) != os.path.abspath(self.root):
+                shutil.copytree(src, os.path.join(tmp_dir, name), symlinks=True, copy_function=copy)
+        if os.path.exists(dst):
+            shutil.rmtree(dst)
+        os.rename(tmp_dir, dst)
+
+        self.collect_garbage(member_id)
+        return os.path.join(dst, prefix)
+
+    def list_snapshots(self, member_id):
+        """Returns the snapshot directories of a member, oldest first"""
+        member_dir = os.path.join(self.root, member_id)
+        if not os.path.isdir(member_dir):
+            return []
+        steps = sorted(int(d) for d in os.listdir(member_dir) if d.isdigit())
+        return [os.path.join(member_dir, str(step)) for step in steps]
+
+    def collect_garbage(self, member_id):
+        for snapshot_dir in self.list_snapshots(member_id)[:-self.keep_last or None]:
+            # Moved away before checking the references: a member acquiring it
+            # from now on can't find it, and the ones that did are visible
+            trash_dir = '{}.{}.trash'.format(snapshot_dir, uuid.uuid4().hex[:8])
+            try:
+                os.rename(snapshot_dir, trash_dir)
+            except OSError:
+                continue
+            if self.get_refcount(trash_dir):
+                os.rename(trash_dir, snapshot_dir)
+                continue
+            shutil.rmtree(trash_dir, ignore_errors=True)
+
+    def get_refcount(self, snapshot_dir):
+        refs_dir = os.path.join(snapshot_dir, REFS_DIR)
+        return len(os.listdir(refs_dir)) if os.path.isdir(refs_dir) else 0
+
+    @contextlib.contextmanager
+    def acquire(self, model_path, member_id):
+        """Keeps the snapshot of model_path from being collected while in the block.
+        Yields False if the snapshot doesn't exist anymore."""
+        snapshot_dir = os.path.dirname(model_path)
+        ref = os.path.join(snapshot_dir, REFS_DIR, '{}.{}'.format(member_id, uuid.uuid4().hex[:8]))
+        try:
+            # Not makedirs, a collected snapshot must not be recreated
+            os.mkdir(os.path.dirname(ref))
+        except FileExistsError:
+            pass
+        except OSError:
+            ref = None
+        if ref is not None:
+            try:
+                open(ref, 'w').close()
+            except OSError:
+                ref = None
+        try:
+            # The snapshot might have been collected before the reference was taken
+            acquired = ref is not None and os.path.isdir(snapshot_dir) and os.path.exists(ref)
+            if not acquired:
+                logger.warn('Snapshot {} was collected, it cannot be restored.'.format(model_path))
+            yield acquired
+        finally:
+            if ref is not None:
+                try:
+                    os.remove(ref)
+                except OSError:
+                    pass
+
+
+def _link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        # Hard links are not supported by every filesystem
+        shutil.copy2(src, dst)
@@ -0,0 +1,54 @@
+import json
+import logging
+
+from .explore import member_rng
+from .scoreboard import DEFAULT_ASSIGNMENT
+
+logger = logging.getLogger('fairing')
+
+# Set on the controller's container, it runs the controller instead of training
+CONTROLLER_ENV = 'FAIRING_PBT_CONTROLLER'
+
+
+class PopulationController(object):
+    """Takes the exploit and explore decisions for the whole population.
+
+    After each round, the scoreboard is ranked once, every member's donor is
+    selected and the hyperparameters of all the exploiting members are
+    explored in a single batch. Each member then reads its own assignment."""
+
+    def __init__(self, pbt):
+        self.pbt = pbt
+        self.rng = member_rng(pbt.seed, 'controller')
+
+    def run(self):
+        for exploit in range(1, self.pbt.exploit_count + 1):
+            step = exploit * self.pbt.steps_per_exploit
+            self.pbt.wait_for_population(step)
+            scoreboard, _ = self.pbt.scoreboard.get_scoreboard()
+            assignments = self.get_assignments(scoreboard)
+            self.pbt.scoreboard.put_assignments(step, assignments)
+            logger.warn('Step {}: {} of {} members exploit another one.'.format(
+                step, len([a for a in assignments.values() if a['donor']]), len(scoreboard)))
+
+    def get_assignments(self, scoreboard):
+        """Returns a dict of member id -> the model and hp it should continue with,
+        None for members that keep their own"""
+        keep = {'model_path': None, 'hp': None, 'donor': None, 'donor_step': None}
+        assignments = {member_id: dict(keep) for member_id in self.pbt.scoreboard.get_members()}
+        # Members that didn't make it for this round, even the ones that never
+        # reported yet, keep their model
+        assignments[DEFAULT_ASSIGNMENT] = keep
+
+        exploiting = []
+        for rank, info in enumerate(scoreboard):
+            donor = self.pbt.exploiter.select_donor(rank, scoreboard, self.rng)
+            if donor is not None:
+                exploiting.append((info['id'], donor))
+
+        explored = self.pbt.explorer.explore_batch(
+            [json.loads(donor['hp']) for _, donor in exploiting], self.rng)
+        for (member_id, donor), hp in zip(exploiting, explored):
+            assignments[member_id] = {'model_path': donor['model_path'], 'hp': hp,
+                                      'donor': donor['id'], 'donor_step': donor['step']}
+        return assignments
@@ -1,37 +1,70 @@
 import logging
-import random
 import math
 import json
+import numpy as np
 
 logger = logging.getLogger('fairing')
 
 
+class RankedScoreboard(list):
+    """Performance info of the members, best first, indexed by member id
+    so ranks are looked up in constant time"""
+
+    def __init__(self, entries=()):
+        super(RankedScoreboard, self).__init__(entries)
+        self.ranks = {info['id']: rank for rank, info in enumerate(self)}
+
+    def rank(self, member_id):
+        return self.ranks.get(member_id)
+
+
 class ExploitStrategy(object):
-    pass
+    def select_donor(self, rank, scoreboard, rng):
+        """Returns the performance info of the member to copy from,
+        or None if the member at rank should keep its own model"""
+        raise NotImplementedError()
 
-# TODO: parametrize truncation limits
+    def exploit(self, current_instance_id, scoreboard, rank=None, rng=None):
+        # Returns the path and hp of the model to copy from, or None, None
+        if rank is None:
+            if not isinstance(scoreboard, RankedScoreboard):
+                scoreboard = RankedScoreboard(scoreboard)
+            rank = scoreboard.rank(current_instance_id)
+        donor = self.select_donor(rank, scoreboard, rng or np.random)
+        if donor is None:
+            return None, None
+        return donor['model_path'], json.loads(donor['hp'])
 
 
 class Truncation(ExploitStrategy):
-    def exploit(self, current_instance_id, scoreboard):
-        # Check if current_istance_id is in the worst 20%, if yes returns the path
-        # and hp of a model that is in the top 20%
-        # otherwise returns None
-        population_size = len(scoreboard)
-        curr_item = list(
-            filter(lambda x: x['id'] == current_instance_id, scoreboard))[0]
-        rank = scoreboard.index(curr_item)
+    """Members in the bottom bottom_fraction of the population copy
+    a random member of the top top_fraction"""
 
-        if not rank >= math.floor(population_size * 0.8):
-            return None, None
+    def __init__(self, bottom_fraction=0.2, top_fraction=0.2):
+        self.bottom_fraction = bottom_fraction
+        self.top_fraction = top_fraction
 
-        # randomly choose a member to copy from the top 20%
-        high_bound = max(int(population_size * 0.2) - 1, 0)
-        top_id = random.randint(0, high_bound)
-        model_path = scoreboard[top_id]['model_path']
-        hp = json.loads(scoreboard[top_id]['hp'])
-        return model_path, hp
+    def select_donor(self, rank, scoreboard, rng):
+        population_size = len(scoreboard)
+        if not rank >= math.floor(population_size * (1 - self.bottom_fraction)):
+            return None
+
+        # randomly choose a member to copy from the top
+        high_bound = max(int(population_size * self.top_fraction) - 1, 0)
+        return scoreboard[rng.randint(0, high_bound + 1)]
 
 
 class BinaryTournament(ExploitStrategy):
-    pass
+    """Each member is compared to another member picked at random,
+    and copies it if it performs better"""
+
+    def select_donor(self, rank, scoreboard, rng):
+        if len(scoreboard) < 2:
+            return None
+        # Uniform over the other members
+        other = rng.randint(0, len(scoreboard) - 1)
+        if other >= rank:
+            other += 1
+        if other > rank:
+            return None
+        return scoreboard[other]
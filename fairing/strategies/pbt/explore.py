@@ -1,31 +1,97 @@
-import random
 import logging
+import zlib
+import numpy as np
+
+from fairing.strategies.space import Continuous
 
 logger = logging.getLogger('fairing')
 
+
+def member_rng(seed, member_id):
+    """Returns the random stream of a member of the population. Streams are
+    independent between members, and reproducible given the same seed."""
+    return np.random.RandomState([seed or 0, zlib.crc32(str(member_id).encode('utf8'))])
+
+
 class ExploreStrategy(object):
-    def explore(self, hp_dict):
-      raise NotImplementedError()
+    # Whether the strategy can't explore without a hyperparameter space
+    requires_space = False
+
+    def __init__(self, space=None):
+        # Typed hyperparameter space, see fairing.strategies.space
+        self.space = space
+
+    def explore(self, hp_dict, rng=None):
+        """Returns new hyperparameters derived from hp_dict"""
+        return self.explore_batch([hp_dict], rng)[0]
+
+    def explore_batch(self, hp_dicts, rng=None):
+        """Returns new hyperparameters for every member of hp_dicts at once"""
+        raise NotImplementedError()
 
 
 class Perturb(ExploreStrategy):
-    def __init__(self, min_multiplier=0.8, max_multiplier=1.2):
+    """Multiplies each continuous hyperparameter by a random factor
+    between min_multiplier and max_multiplier, within its bounds.
+
+    Without a space, every float hyperparameter is perturbed, unbounded."""
+
+    def __init__(self, min_multiplier=0.8, max_multiplier=1.2, space=None):
+        super(Perturb, self).__init__(space)
         self.min_multiplier = min_multiplier
         self.max_multiplier = max_multiplier
-    
-    def explore(self, hp):  
-        new_dict = {}
-        for key in hp.keys():
-            v = hp[key]
-
-            # Don't touch non decimal HP as they might be batch size, layer size etc...
-            # Modifying them will not allow restoring the model
-            # TODO: Can we find a better way to do this?
-            if type(v) != float:
-                new_dict[key] = v
-                continue
-            perturb_factor = random.uniform(self.min_multiplier, self.max_multiplier)
-            new_dict[key] = perturb_factor*v
-        return new_dict
-
-class Resample(ExploreStrategy): pass
\ No newline at end of file
+
+    def get_perturbed_keys(self, hp):
+        # Don't touch discrete HP as they might be batch size, layer size etc...
+        # Modifying them will not allow restoring the model
+        # TODO: Can we find a better way to do this?
+        if self.space is None:
+            return sorted(k for k, v in hp.items() if type(v) == float)
+        return [k for k in self.space.names if isinstance(self.space.parameters[k], Continuous)]
+
+    def explore_batch(self, hp_dicts, rng=None):
+        rng = rng or np.random
+        if not hp_dicts:
+            return []
+        keys = self.get_perturbed_keys(hp_dicts[0])
+        values = np.array([[hp[k] for k in keys] for hp in hp_dicts], dtype=float).reshape(-1, len(keys))
+        values *= rng.uniform(self.min_multiplier, self.max_multiplier, size=values.shape)
+        if self.space is not None:
+            low = [self.space.parameters[k].low for k in keys]
+            high = [self.space.parameters[k].high for k in keys]
+            values = np.clip(values, low, high)
+
+        new_dicts = []
+        for hp, row in zip(hp_dicts, values.tolist()):
+            new_dict = dict(hp)
+            new_dict.update(zip(keys, row))
+            new_dicts.append(new_dict)
+        return new_dicts
+
+
+class Resample(ExploreStrategy):
+    """Resamples each hyperparameter from the space with the given probability,
+    the others are kept"""
+
+    requires_space = True
+
+    def __init__(self, space=None, probability=1.0):
+        super(Resample, self).__init__(space)
+        self.probability = probability
+
+    def explore_batch(self, hp_dicts, rng=None):
+        if self.space is None:
+            raise ValueError('Resample requires a hyperparameter space')
+        rng = rng or np.random
+        if not hp_dicts:
+            return []
+        shape = (len(hp_dicts), len(self.space))
+        resampled = self.space.from_unit_batch(rng.uniform(size=shape))
+        mask = (rng.uniform(size=shape) < self.probability).tolist()
+
+        new_dicts = []
+        for hp, new_hp, row in zip(hp_dicts, resampled, mask):
+            new_dict = dict(hp)
+            new_dict.update((k, new_hp[k]) for k, m in zip(self.space.names, row) if m)
+            new_dicts.append(new_dict)
+        return new_dicts
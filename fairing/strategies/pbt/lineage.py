@@ -0,0 +1,58 @@
+import logging
+
+logger = logging.getLogger('fairing')
+
+# Every member appends a lineage record to the scoreboard store each time it reports:
+#   id, step, metric: as in its performance info
+#   hp: the hyperparameters it trained with since its previous report
+#   parent, parent_step: the member and step it restored its model from before
+#     training with hp, or None if it continued its own model
+
+
+def new_lineage_record(member_id, step, metric, hp, parent=None, parent_step=None):
+    return {
+        'id': member_id,
+        'step': step,
+        'metric': metric,
+        'hp': hp,
+        'parent': parent,
+        'parent_step': parent_step,
+    }
+
+
+def get_hp_schedule(store, member_id=None):
+    """Returns the hyperparameters the model of member_id was trained with,
+    the best member of the scoreboard by default, following it back through
+    the members it copied.
+
+    The schedule is a list of dicts, in training order, with the 'hp' used for
+    'steps' steps starting at step 'start', and the 'member' that trained them.
+    Replaying it on a single worker reproduces the schedule found by the population."""
+    if member_id is None:
+        scoreboard, _ = store.get_scoreboard()
+        if not scoreboard:
+            return []
+        member_id = scoreboard[0]['id']
+
+    segments = []
+    until = None
+    while member_id is not None:
+        records = [r for r in store.get_lineage(member_id) if until is None or r['step'] <= until]
+        parent = None
+        for i in reversed(range(len(records))):
+            record = records[i]
+            start = records[i - 1]['step'] if i > 0 else 0
+            segments.append({'member': member_id, 'hp': record['hp'], 'steps': record['step'] - start})
+            if record['parent'] is not None:
+                parent = record['parent']
+                until = record['parent_step']
+                break
+        member_id = parent
+
+    schedule = []
+    start = 0
+    for segment in reversed(segments):
+        segment['start'] = start
+        start += segment['steps']
+        schedule.append(segment)
+    return schedule
@@ -1,17 +1,21 @@
 
+import copy
 import logging
 import types
-import redis
 import os
 import json
 import math
 import numpy as np
-import time
 
 from ..basic import BasicTrainingStrategy
-from .exploit import Truncation
-from .explore import Resample, Perturb
-from fairing.utils import is_runtime_phase
+from .exploit import Truncation, RankedScoreboard
+from .explore import Perturb, member_rng
+from .checkpoint import CheckpointStore
+from .controller import PopulationController, CONTROLLER_ENV
+from .lineage import new_lineage_record
+from fairing.strategies.space import SearchSpace
+from .scoreboard import RedisScoreboard
+from fairing.utils import is_runtime_phase, get_image_full
 
 #TODO: can we make this class framework agnostic?
 if is_runtime_phase():
@@ -19,6 +23,9 @@ if is_runtime_phase():
 
 logger = logging.getLogger('fairing')
 
+# Seconds a member waits for the decisions of the controller by default
+DEFAULT_ASSIGNMENT_TIMEOUT = 3600
+
 class PopulationBasedTraining(BasicTrainingStrategy):
     def __init__(self,
                  model_path,
@@ -28,6 +35,17 @@ class PopulationBasedTraining(BasicTrainingStrategy):
                  pvc_name,
                  exploiter=Truncation(),
                  explorer=Perturb(),
+                 barrier_timeout=None,
+                 quorum=None,
+                 synchronous=True,
+                 max_staleness=None,
+                 scoreboard=None,
+                 space=None,
+                 seed=None,
+                 snapshots=True,
+                 keep_snapshots=2,
+                 controller=False,
+                 assignment_timeout=DEFAULT_ASSIGNMENT_TIMEOUT,
                  ):
 
         self.model_path = model_path
@@ -39,14 +57,53 @@ class PopulationBasedTraining(BasicTrainingStrategy):
         self.pvc_name = pvc_name
         self.exploiter = exploiter  # binary tournament or truncation
         self.explorer = explorer  # perturb or resample
+        # Seconds to wait for the whole population before each exploit, None waits forever.
+        # Once it elapsed, members proceed as soon as quorum members reported.
+        self.barrier_timeout = barrier_timeout
+        self.quorum = quorum or population_size
+        # In asynchronous mode members never wait for each other, they exploit
+        # the scoreboard as it is, ignoring reports older than max_staleness steps
+        self.synchronous = synchronous
+        self.max_staleness = max_staleness
         
         # Values of HP for the latest run
         self.current_hp_values = None
         self.hostname = None
         self.user_func = None
-        self.redis = None
+        # Where members share their scores, a Redis service is deployed if None
+        self.scoreboard = scoreboard
+        # Typed hyperparameter space, used by the explorer when it doesn't have its own,
+        # and to sample the initial hyperparameters if the model doesn't define them
+        self.space = SearchSpace(space) if isinstance(space, dict) else space
+        if self.space is not None and self.explorer.space is None:
+            # The default explorer is shared between instances
+            self.explorer = copy.copy(self.explorer)
+            self.explorer.space = self.space
+        if self.explorer.requires_space and self.explorer.space is None:
+            # Otherwise it would only fail at the first exploit, after a whole round of training
+            raise ValueError('{} requires a hyperparameter space, pass space to {} or to the explorer'.format(
+                type(self.explorer).__name__, type(self).__name__))
+        # Each member draws from its own random stream, derived from seed and its id
+        self.seed = seed
+        self.rng = None
+        # With a controller, exploit and explore decisions are taken once per round
+        # by a dedicated job, members only apply them
+        self.controller = controller
+        # Seconds a member waits for the decisions of the controller, i.e. if it
+        # died, before it goes on with its own model
+        self.assignment_timeout = assignment_timeout
+        # Members restore from immutable snapshots of each other's checkpoints,
+        # stored on the checkpoint volume, instead of their live model_path.
+        # snapshots can also be a CheckpointStore.
+        self.checkpoints = snapshots if isinstance(snapshots, CheckpointStore) else None
+        if snapshots is True:
+            self.checkpoints = CheckpointStore(
+                os.path.join(os.path.dirname(model_path), '.snapshots'), keep_last=keep_snapshots)
         self.step_count = 0
         self.curr_exploit_count = 0
+        # Performance info of the member the current model was restored from,
+        # since the latest report, recorded in the lineage log
+        self.parent = None
 
     def add_training(self, svc, repository, image_name, image_tag, volumes, volume_mounts):
         volumes = volumes if volumes else []
@@ -61,50 +118,52 @@ class PopulationBasedTraining(BasicTrainingStrategy):
             "persistentVolumeClaim": self.pvc_name
         })
 
-        # use image name as identifier for redis
-        svc, redis_env = self.add_redis(svc, image_name)
+        env = None
+        if self.scoreboard is None:
+            # use image name as identifier for redis
+            svc, redis_env = self.add_redis(svc, image_name)
+            env = [redis_env]
         svc = self.arch.add_jobs(svc, self.runs, repository, image_name, image_tag, volumes, volume_mounts)
-        return svc, [redis_env]
+        if self.controller:
+            svc = self.add_controller(svc, get_image_full(repository, image_name, image_tag),
+                                      image_name, volumes, volume_mounts)
+        return svc, env
 
-    def add_redis(self, svc, name):
-        redis_hostname = '{}-redis'.format(name)
-        r_svc = {
-            "name": redis_hostname,
-            "replicas": 1,
+    def add_controller(self, svc, image, name, volumes, volume_mounts):
+        # Same image as the members, the environment variable makes it run the controller
+        controller = {
+            "name": '{}-pbt-controller'.format(name),
+            "parallelism": 1,
+            "completion": 1,
             "containers": [{
-                "image": "library/redis",
+                "image": image,
+                "env": [{'name': CONTROLLER_ENV, 'value': '1'}],
+                "volumeMounts": volume_mounts
             }],
-            "ports": [{
-                'number': 6379,
-                'protocol': 'TCP'
-            }]
+            "volumes": volumes
         }
-        if not "services" in svc:
-            svc["services"] = [r_svc]
-        else:
-            svc["services"].append(r_svc)
-        
+        svc.setdefault("jobs", []).append(controller)
+        return svc
 
-        #Metaparticle seem to only support one serving endpoint?
-        svc["serve"] = {
-            "name": redis_hostname
-        }
-        # if not 'serve' in svc:
-        #     svc["serve"] = r_endpoint
-        # else:
-        #     svc["serve"].append(r_endpoint)
-        return svc, {'name': 'REDIS_HOSTNAME', 'value': redis_hostname}
+    def get_stores(self):
+        """Stores shared by the members, None when it is deployed with the job"""
+        return [self.scoreboard]
 
     def get_params(self):
         hp = None
         hp_func = getattr(self.user_object, "hyperparameters", None)
         if callable(hp_func):
             hp = hp_func()
+        elif self.space is not None:
+            hp = self.space.sample(self.rng)
         return hp
 
     def exec_user_code(self, user_object):
         self.user_object = user_object
         self.initialize_training()
+        if os.environ.get(CONTROLLER_ENV):
+            PopulationController(self).run()
+            return
 
         params = self.get_params()
         self.user_object.build(params)
@@ -116,8 +175,10 @@ class PopulationBasedTraining(BasicTrainingStrategy):
 
     def initialize_training(self):
         self.hostname = os.environ.get('HOSTNAME')
-        redis_hostname = os.environ.get('REDIS_HOSTNAME')      
-        self.redis = redis.StrictRedis(host=redis_hostname)
+        self.rng = member_rng(self.seed, self.hostname)
+        if self.scoreboard is None:
+            redis_hostname = os.environ.get('REDIS_HOSTNAME')
+            self.scoreboard = RedisScoreboard(host=redis_hostname)
 
     def reporter(self, loss_metric):
         self.step_count += self.steps_per_exploit
@@ -130,40 +191,101 @@ class PopulationBasedTraining(BasicTrainingStrategy):
             # Training is finished
             return
 
-        # Exploit
-        scoreboard = self.get_scoreboard()
-        new_model_path, copied_hp = self.exploiter.exploit(self.hostname, scoreboard)
-        run_hp = self.current_hp_values
+        if self.controller:
+            donor, new_hp = self.get_assignment()
+        else:
+            donor, new_hp = self.exploit_and_explore()
 
-        if new_model_path:
-            # Explore
-            if type(self.explorer) is Resample:
-                run_hp = self.get_params()
-            else:
-                run_hp = self.explorer.explore(copied_hp)
-            self.user_object.build(run_hp)
-            self.user_object.restore(new_model_path)
+        run_hp = self.current_hp_values
+        self.parent = None
+        if donor and self.restore(donor['model_path'], new_hp):
+            run_hp = new_hp
+            self.parent = donor
 
         self.curr_exploit_count += 1
         self.training_loop(run_hp)
 
+    def exploit_and_explore(self):
+        """Returns the performance info of the member to copy and the hyperparameters
+        to continue with, or None, None to keep going with the current ones"""
+        # Exploit
+        scoreboard, rank = self.get_scoreboard()
+        donor = None
+        # Nobody else to exploit yet, which can only happen in asynchronous mode
+        if len(scoreboard) > 1:
+            donor = self.exploiter.select_donor(rank, scoreboard, self.rng or np.random)
+        if donor is None:
+            return None, None
+        # Explore
+        return donor, self.explorer.explore(json.loads(donor['hp']), self.rng)
+
+    def get_assignment(self):
+        """Returns the member to copy and the hyperparameters decided by the controller
+        for this step, or None, None"""
+        assignment = self.scoreboard.wait_for_assignment(
+            self.hostname, self.step_count, self.assignment_timeout)
+        if assignment is None:
+            logger.warn('No assignment from the controller for step {} after {} seconds, '
+                        'keeping the current model.'.format(self.step_count, self.assignment_timeout))
+            return None, None
+        if not assignment['donor']:
+            return None, None
+        donor = {'id': assignment['donor'], 'step': assignment['donor_step'],
+                 'model_path': assignment['model_path']}
+        return donor, assignment['hp']
+
+    def restore(self, model_path, hp):
+        """Rebuilds the model with hp and restores it from model_path,
+        returns False if the snapshot is gone and the model was left untouched"""
+        if self.checkpoints is None:
+            self.user_object.build(hp)
+            self.user_object.restore(model_path)
+            return True
+
+        with self.checkpoints.acquire(model_path, self.hostname) as acquired:
+            if acquired:
+                self.user_object.build(hp)
+                self.user_object.restore(model_path)
+            return acquired
+
     def get_scoreboard(self):
-        keys = self.redis.keys()
-        while len(keys) < self.population_size:
-            logger.error("Population size is {}, but only found {} scores. Will retry in 10 seconds".format(
-                self.population_size,
-                len(keys)
-            ))
-            time.sleep(10)
-            keys = self.redis.keys()
-            
-            
-        scoreboard = []
-        for key in keys:
-            v = self.redis.get(key).decode('utf8')
-            scoreboard.append(json.loads(v))
-        return sorted(scoreboard, key=lambda x: x['metric'])
+        """Returns the scoreboard sorted by metric and the rank of this member in it"""
+        if not self.synchronous:
+            return self.get_recent_scoreboard()
+        self.wait_for_population()
+        return self.scoreboard.get_scoreboard(self.hostname)
+
+    def get_recent_scoreboard(self):
+        """Returns the current scoreboard without the members that are more
+        than max_staleness steps behind this one"""
+        scoreboard, rank = self.scoreboard.get_scoreboard(self.hostname)
+        if self.max_staleness is None:
+            return scoreboard, rank
+
+        min_step = self.step_count - self.max_staleness
+        recent = RankedScoreboard(info for info in scoreboard if info['step'] >= min_step)
+        return recent, recent.rank(self.hostname)
+
+    def wait_for_population(self, step=None):
+        """Waits until every member reached step, the current one by default,
+        or a quorum of them if they didn't all make it within barrier_timeout"""
+        step = self.step_count if step is None else step
+        count = self.scoreboard.wait_for(self.population_size, step, self.barrier_timeout)
+        if count >= self.population_size:
+            return count
+
+        logger.warn("Population size is {}, but only {} members reached step {} after {} seconds. "
+                    "Waiting for a quorum of {}.".format(
+                        self.population_size, count, step,
+                        self.barrier_timeout, self.quorum))
+        return self.scoreboard.wait_for(self.quorum, step)
     
+    def get_snapshot(self):
+        """Returns the path the current checkpoint can be restored from by other members"""
+        if self.checkpoints is None:
+            return self.model_path
+        return self.checkpoints.snapshot(self.hostname, self.step_count, self.model_path)
+
     def commit_performance_info(self, metric):
         if type(metric).__module__ == 'numpy':
             metric = metric.item()
@@ -173,6 +295,11 @@ class PopulationBasedTraining(BasicTrainingStrategy):
             "metric": metric,
             "step": self.step_count,
             "hp": json.dumps(self.current_hp_values),
-            "model_path": self.model_path,
+            "model_path": self.get_snapshot(),
         }
-        self.redis.set(self.hostname, json.dumps(info))
+        self.scoreboard.commit(info)
+
+        parent = self.parent or {}
+        self.scoreboard.append_lineage(new_lineage_record(
+            self.hostname, self.step_count, metric, self.current_hp_values,
+            parent.get('id'), parent.get('step')))
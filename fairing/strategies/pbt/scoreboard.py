@@ -0,0 +1,351 @@
+import json
+import logging
+import math
+import os
+import threading
+import time
+
+import redis
+
+from fairing.utils import read_json, update_json
+from .exploit import RankedScoreboard
+
+logger = logging.getLogger('fairing')
+
+# Sorted set of member ids, scored by their latest metric
+SCORES_KEY = 'fairing:pbt:scores'
+# Hash of member id -> JSON encoded performance info
+MEMBERS_KEY = 'fairing:pbt:members'
+# Sorted set of member ids, scored by the step of their latest report
+STEPS_KEY = 'fairing:pbt:steps'
+# Channel notified on every commit, wakes up the members waiting for the population
+COMMITS_CHANNEL = 'fairing:pbt:commits'
+# Hash of member id -> JSON encoded assignment, per step, written by the controller
+ASSIGNMENTS_KEY = 'fairing:pbt:assignments:{}'
+# Channel notified when the assignments of a step are available
+ASSIGNMENTS_CHANNEL = 'fairing:pbt:assignments'
+# Assignment of the members without one of their own, i.e. the ones that
+# reported after the controller took its decisions
+DEFAULT_ASSIGNMENT = '*'
+# List of JSON encoded lineage records, per member, oldest first
+LINEAGE_KEY = 'fairing:pbt:lineage:{}'
+
+# Upper bound on the time between two checks of the population while waiting,
+# in case a notification is lost while (re)subscribing
+MAX_WAIT_INTERVAL = 5
+
+# Fetches the whole scoreboard, ordered by metric, and the rank of a member
+# in a single round trip. HMGET doesn't accept an empty list of fields.
+GET_SCOREBOARD_SCRIPT = """
+local ids = redis.call('ZRANGE', KEYS[1], 0, -1)
+if #ids == 0 then
+    return {{}, {}, false}
+end
+local infos = redis.call('HMGET', KEYS[2], unpack(ids))
+return {ids, infos, redis.call('ZRANK', KEYS[1], ARGV[1])}
+"""
+
+
+def get_score(metric):
+    """Returns the score ranking a metric, the metric of a diverging member
+    can be NaN, it is ranked last"""
+    metric = float(metric)
+    return float('inf') if math.isnan(metric) else metric
+
+
+class ScoreboardStore(object):
+    """Where the members of a population share their performance info.
+
+    Members commit a dict with at least their 'id', 'metric' and 'step',
+    lower metrics are better."""
+
+    # Seconds between two checks of the population while waiting for it
+    poll_interval = 1
+
+    def is_shared(self):
+        """Whether members running in other processes see the commits"""
+        return True
+
+    def commit(self, info):
+        raise NotImplementedError()
+
+    def get_members(self):
+        """Returns a dict of member id -> latest performance info"""
+        raise NotImplementedError()
+
+    def count(self, min_step=None):
+        """Returns the number of members that reported at min_step or later"""
+        members = self.get_members().values()
+        if min_step is None:
+            return len(members)
+        return len([info for info in members if info['step'] >= min_step])
+
+    def wait_for(self, size, min_step=None, timeout=None):
+        """Blocks until size members reported at min_step or later,
+        or until timeout seconds elapsed. Returns the number of members that reported."""
+        deadline = None if timeout is None else time.time() + timeout
+        count = self.count(min_step)
+        while count < size:
+            wait = self.poll_interval
+            if deadline is not None:
+                wait = min(wait, deadline - time.time())
+                if wait <= 0:
+                    break
+            time.sleep(wait)
+            count = self.count(min_step)
+        return count
+
+    def put_assignments(self, step, assignments):
+        """Records the decisions of the controller for step,
+        a dict of member id -> assignment"""
+        raise NotImplementedError()
+
+    def get_assignment(self, member_id, step):
+        """Returns the assignment of a member for step, the default one of the step
+        if it has none, or None if not decided yet"""
+        raise NotImplementedError()
+
+    def wait_for_assignment(self, member_id, step, timeout=None):
+        """Blocks until the assignment of a member for step is available,
+        returns None if it isn't after timeout seconds"""
+        deadline = None if timeout is None else time.time() + timeout
+        assignment = self.get_assignment(member_id, step)
+        while assignment is None:
+            wait = self.poll_interval
+            if deadline is not None:
+                wait = min(wait, deadline - time.time())
+                if wait <= 0:
+                    break
+            time.sleep(wait)
+            assignment = self.get_assignment(member_id, step)
+        return assignment
+
+    def append_lineage(self, record):
+        """Appends a record to the lineage log of the member record['id'],
+        see fairing.strategies.pbt.lineage"""
+        raise NotImplementedError()
+
+    def get_lineage(self, member_id):
+        """Returns the lineage records of a member, oldest first"""
+        raise NotImplementedError()
+
+    def get_scoreboard(self, member_id=None):
+        """Returns the performance info of every member, best first,
+        and the rank of member_id in it"""
+        scoreboard = RankedScoreboard(sorted(self.get_members().values(), key=lambda x: get_score(x['metric'])))
+        return scoreboard, scoreboard.rank(member_id)
+
+
+class RedisScoreboard(ScoreboardStore):
+    """Scoreboard of the population, stored in Redis.
+
+    Members are ranked server side in a sorted set keyed by metric,
+    lower is better, their details are kept in a hash."""
+
+    def __init__(self, host=None, port=6379, client=None):
+        self.redis = client or redis.StrictRedis(host=host, port=port)
+        self._get_scoreboard = self.redis.register_script(GET_SCOREBOARD_SCRIPT)
+
+    def commit(self, info):
+        """Records the latest performance info of a member"""
+        pipe = self.redis.pipeline()
+        # Raw command, the signature of zadd differs between redis-py versions.
+        # Redis rejects NaN scores.
+        pipe.execute_command('ZADD', SCORES_KEY, get_score(info['metric']), info['id'])
+        pipe.hset(MEMBERS_KEY, info['id'], json.dumps(info))
+        pipe.execute_command('ZADD', STEPS_KEY, info['step'], info['id'])
+        pipe.publish(COMMITS_CHANNEL, info['id'])
+        pipe.execute()
+
+    def get_members(self):
+        members = self.redis.hgetall(MEMBERS_KEY)
+        return {k.decode('utf8'): json.loads(v.decode('utf8')) for k, v in members.items()}
+
+    def count(self, min_step=None):
+        if min_step is None:
+            return self.redis.zcard(SCORES_KEY)
+        return self.redis.zcount(STEPS_KEY, min_step, '+inf')
+
+    def wait_for(self, size, min_step=None, timeout=None):
+        deadline = None if timeout is None else time.time() + timeout
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        # Subscribe before counting, so no commit can be missed in between
+        pubsub.subscribe(COMMITS_CHANNEL)
+        try:
+            count = self.count(min_step)
+            while count < size:
+                wait = MAX_WAIT_INTERVAL
+                if deadline is not None:
+                    wait = min(wait, deadline - time.time())
+                    if wait <= 0:
+                        break
+                pubsub.get_message(timeout=wait)
+                count = self.count(min_step)
+            return count
+        finally:
+            pubsub.close()
+
+    def put_assignments(self, step, assignments):
+        pipe = self.redis.pipeline()
+        for member_id, assignment in assignments.items():
+            pipe.hset(ASSIGNMENTS_KEY.format(step), member_id, json.dumps(assignment))
+        pipe.publish(ASSIGNMENTS_CHANNEL, step)
+        pipe.execute()
+
+    def get_assignment(self, member_id, step):
+        assignment, default = self.redis.hmget(ASSIGNMENTS_KEY.format(step), member_id, DEFAULT_ASSIGNMENT)
+        assignment = assignment or default
+        return None if assignment is None else json.loads(assignment.decode('utf8'))
+
+    def wait_for_assignment(self, member_id, step, timeout=None):
+        deadline = None if timeout is None else time.time() + timeout
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(ASSIGNMENTS_CHANNEL)
+        try:
+            assignment = self.get_assignment(member_id, step)
+            while assignment is None:
+                wait = MAX_WAIT_INTERVAL
+                if deadline is not None:
+                    wait = min(wait, deadline - time.time())
+                    if wait <= 0:
+                        break
+                pubsub.get_message(timeout=wait)
+                assignment = self.get_assignment(member_id, step)
+            return assignment
+        finally:
+            pubsub.close()
+
+    def append_lineage(self, record):
+        self.redis.rpush(LINEAGE_KEY.format(record['id']), json.dumps(record))
+
+    def get_lineage(self, member_id):
+        return [json.loads(record.decode('utf8'))
+                for record in self.redis.lrange(LINEAGE_KEY.format(member_id), 0, -1)]
+
+    def get_rank(self, member_id):
+        """Returns the rank of a member, 0 being the best, or None"""
+        return self.redis.zrank(SCORES_KEY, member_id)
+
+    def get_scoreboard(self, member_id=None):
+        ids, infos, rank = self._get_scoreboard(keys=[SCORES_KEY, MEMBERS_KEY],
+                                                args=[member_id or ''])
+        scoreboard = RankedScoreboard(json.loads(info.decode('utf8')) for info in infos if info is not None)
+        return scoreboard, rank
+
+
+class FileScoreboard(ScoreboardStore):
+    """Scoreboard stored in a JSON file on a filesystem shared by the population,
+    typically the volume of the checkpoints.
+
+    Writers are serialized with a lock file, and the scoreboard is replaced
+    atomically so readers never need the lock."""
+
+    def __init__(self, path, poll_interval=1):
+        self.path = path
+        self.assignments_path = path + '.assignments'
+        # One JSON-lines file per member, only ever appended to
+        self.lineage_dir = path + '.lineage'
+        self.poll_interval = poll_interval
+
+    def commit(self, info):
+        update_json(self.path, lambda members: members.update({info['id']: info}))
+
+    def get_members(self):
+        return read_json(self.path, {})
+
+    def put_assignments(self, step, assignments):
+        update_json(self.assignments_path, lambda content: content.update({str(step): assignments}))
+
+    def get_assignment(self, member_id, step):
+        assignments = read_json(self.assignments_path, {}).get(str(step), {})
+        return assignments.get(member_id, assignments.get(DEFAULT_ASSIGNMENT))
+
+    def append_lineage(self, record):
+        os.makedirs(self.lineage_dir, exist_ok=True)
+        # A single write in append mode, lines of concurrent writers don't interleave
+        with open(os.path.join(self.lineage_dir, record['id'] + '.jsonl'), 'a') as f:
+            f.write(json.dumps(record) + '\n')
+
+    def get_lineage(self, member_id):
+        try:
+            with open(os.path.join(self.lineage_dir, member_id + '.jsonl'), 'r') as f:
+                lines = f.read().split('\n')
+        except IOError:
+            return []
+        # The last line is incomplete while it is being written
+        return [json.loads(line) for line in lines[:-1]]
+
+
+class MemoryScoreboard(ScoreboardStore):
+    """Scoreboard kept in memory, for populations running on a single machine.
+
+    By default it is only shared between threads, use MemoryScoreboard.shared()
+    to share it between processes."""
+
+    def __init__(self, members=None, condition=None, assignments=None, lineage=None):
+        self.members = {} if members is None else members
+        self.condition = condition or threading.Condition()
+        # Step -> assignments of that step
+        self.assignments = {} if assignments is None else assignments
+        # Member id -> lineage records
+        self.lineage = {} if lineage is None else lineage
+
+    @classmethod
+    def shared(cls, manager=None):
+        """Returns a scoreboard backed by a multiprocessing manager"""
+        if manager is None:
+            import multiprocessing
+            manager = multiprocessing.Manager()
+        return cls(manager.dict(), manager.Condition(), manager.dict(), manager.dict())
+
+    def is_shared(self):
+        return not isinstance(self.members, dict)
+
+    def commit(self, info):
+        with self.condition:
+            self.members[info['id']] = info
+            self.condition.notify_all()
+
+    def get_members(self):
+        return dict(self.members)
+
+    def wait_for(self, size, min_step=None, timeout=None):
+        deadline = None if timeout is None else time.time() + timeout
+        with self.condition:
+            count = self.count(min_step)
+            while count < size:
+                wait = None if deadline is None else deadline - time.time()
+                if wait is not None and wait <= 0:
+                    break
+                self.condition.wait(wait)
+                count = self.count(min_step)
+            return count
+
+    def put_assignments(self, step, assignments):
+        with self.condition:
+            self.assignments[step] = dict(assignments)
+            self.condition.notify_all()
+
+    def get_assignment(self, member_id, step):
+        assignments = self.assignments.get(step, {})
+        return assignments.get(member_id, assignments.get(DEFAULT_ASSIGNMENT))
+
+    def append_lineage(self, record):
+        with self.condition:
+            # Reassigned rather than appended to, for the manager to see the change
+            self.lineage[record['id']] = self.lineage.get(record['id'], []) + [record]
+
+    def get_lineage(self, member_id):
+        return list(self.lineage.get(member_id, []))
+
+    def wait_for_assignment(self, member_id, step, timeout=None):
+        deadline = None if timeout is None else time.time() + timeout
+        with self.condition:
+            assignment = self.get_assignment(member_id, step)
+            while assignment is None:
+                wait = None if deadline is None else deadline - time.time()
+                if wait is not None and wait <= 0:
+                    break
+                self.condition.wait(wait)
+                assignment = self.get_assignment(member_id, step)
+            return assignment
@@ -0,0 +1,82 @@
+import logging
+import numpy as np
+
+logger = logging.getLogger('fairing')
+
+
+class Pruner(object):
+    """Decides whether a trial should stop early, given the metrics
+    reported so far by every trial. Lower metrics are better."""
+
+    def should_prune(self, trial, trials):
+        raise NotImplementedError()
+
+
+class MedianStoppingPruner(Pruner):
+    """Stops a trial whose latest metric is worse than the median of the metrics
+    other trials reported at the same step"""
+
+    def __init__(self, warmup_steps=0, min_trials=5):
+        # Steps during which trials are never stopped
+        self.warmup_steps = warmup_steps
+        # Number of other trials that must have reached the step to compare to
+        self.min_trials = min_trials
+
+    def should_prune(self, trial, trials):
+        if not trial['intermediate']:
+            return False
+        step, metric = trial['intermediate'][-1]
+        if step < self.warmup_steps:
+            return False
+
+        others = [value_at(t, step) for t in trials if t['id'] != trial['id']]
+        others = [v for v in others if v is not None]
+        if len(others) < self.min_trials:
+            return False
+        return metric > np.median(others)
+
+
+class SuccessiveHalvingPruner(Pruner):
+    """Asynchronous successive halving (ASHA).
+
+    Rungs are at min_resource * reduction_factor ** k steps. When a trial
+    reaches a rung, it keeps training only if its metric is in the best
+    1 / reduction_factor of the metrics reported at that rung so far."""
+
+    def __init__(self, min_resource=1, reduction_factor=3):
+        self.min_resource = min_resource
+        self.reduction_factor = reduction_factor
+
+    def get_rung(self, step):
+        """Returns the index of the highest rung reached at step, -1 if none"""
+        rung = -1
+        while step >= self.min_resource * self.reduction_factor ** (rung + 1):
+            rung += 1
+        return rung
+
+    def should_prune(self, trial, trials):
+        if not trial['intermediate']:
+            return False
+        step, _ = trial['intermediate'][-1]
+        rung = self.get_rung(step)
+        # Once promoted to a rung, a trial isn't evaluated at it again
+        if rung <= trial.get('rung', -1):
+            return False
+
+        rung_step = self.min_resource * self.reduction_factor ** rung
+        metric = value_at(trial, rung_step)
+        competing = [value_at(t, rung_step) for t in trials if t['id'] != trial['id']]
+        competing = sorted([v for v in competing if v is not None] + [metric])
+        promotable = competing[max(len(competing) // self.reduction_factor - 1, 0)]
+        if metric > promotable:
+            return True
+        trial['rung'] = rung
+        return False
+
+
+def value_at(trial, step):
+    """Returns the first metric a trial reported at step or later"""
+    for reported_step, metric in trial.get('intermediate', []):
+        if reported_step >= step:
+            return metric
+    return None
@@ -0,0 +1,116 @@
+import math
+import logging
+import numpy as np
+
+from fairing.strategies.trials import COMPLETED
+
+logger = logging.getLogger('fairing')
+
+PRIMES = [2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41, 43, 47, 53, 59, 61, 67, 71,
+          73, 79, 83, 89, 97, 101, 103, 107, 109, 113, 127, 131, 137, 139, 149, 151]
+
+
+class Sampler(object):
+    """Decides the hyperparameters of each trial of a search"""
+
+    def suggest(self, trial_id, space, trials):
+        """Returns the hyperparameters of trial trial_id, or None once the search is exhausted.
+        trials are the trials started so far, and their results."""
+        raise NotImplementedError()
+
+
+class GridSearch(Sampler):
+    """Tries every combination of points values per parameter,
+    categorical parameters always get all their choices"""
+
+    def __init__(self, points=3):
+        self.points = points
+
+    def suggest(self, trial_id, space, trials):
+        grid = space.grid(self.points)
+        if trial_id >= len(grid):
+            return None
+        return grid[trial_id]
+
+
+class QuasiRandomSearch(Sampler):
+    """Samples a low discrepancy (Halton) sequence, which covers the space
+    more evenly than independent random draws"""
+
+    def __init__(self, skip=0):
+        # Starting further in the sequence gives a different set of points
+        self.skip = skip
+
+    def suggest(self, trial_id, space, trials):
+        return space.from_unit(halton(trial_id + self.skip + 1, len(space)))
+
+
+class TPESearch(Sampler):
+    """Tree-structured Parzen Estimator.
+
+    Completed trials are split between the gamma best ones and the others,
+    and the next trial is the candidate maximizing the ratio of the densities
+    of the good trials over the bad ones. Lower metrics are better."""
+
+    def __init__(self, startup_trials=10, gamma=0.25, candidates=24, seed=0):
+        self.startup_trials = startup_trials
+        self.gamma = gamma
+        self.candidates = candidates
+        self.seed = seed
+        self.startup = QuasiRandomSearch()
+
+    def suggest(self, trial_id, space, trials):
+        completed = [t for t in trials if t['state'] == COMPLETED and t['metric'] is not None]
+        if len(completed) < self.startup_trials:
+            return self.startup.suggest(trial_id, space, trials)
+
+        rng = np.random.RandomState(self.seed + trial_id)
+        points = np.array([space.to_unit(t['hp']) for t in completed])
+        order = np.argsort([t['metric'] for t in completed])
+        good_count = max(1, int(math.ceil(self.gamma * len(completed))))
+        good, bad = points[order[:good_count]], points[order[good_count:]]
+
+        # Both densities share the same bandwidth, so their ratio only depends on
+        # how good the trials around a candidate were, not on how spread they are
+        bandwidth = self.bandwidth(points)
+        candidates = self.sample_parzen(good, bandwidth, rng)
+        scores = self.log_parzen(candidates, good, bandwidth) - self.log_parzen(candidates, bad, bandwidth)
+        return space.from_unit(candidates[np.argmax(scores)])
+
+    def bandwidth(self, points):
+        count, dims = points.shape
+        std = points.std(axis=0) if count > 1 else np.ones(dims)
+        return np.clip(std * count ** (-1.0 / (dims + 4)), 0.05, 1.0)
+
+    def sample_parzen(self, points, bandwidth, rng):
+        """Samples candidates from the mixture of a gaussian around each point
+        and of the uniform prior"""
+        dims = points.shape[1]
+        centers = points[rng.randint(len(points), size=self.candidates)]
+        samples = centers + rng.normal(size=(self.candidates, dims)) * bandwidth
+        from_prior = rng.uniform(size=self.candidates) < 1.0 / (len(points) + 1)
+        samples[from_prior] = rng.uniform(size=(from_prior.sum(), dims))
+        return np.clip(samples, 0, 1)
+
+    def log_parzen(self, x, points, bandwidth):
+        if len(points) == 0:
+            return np.zeros(len(x))
+        z = (x[:, None, :] - points[None, :, :]) / bandwidth
+        kernels = np.exp(-0.5 * z ** 2) / (bandwidth * math.sqrt(2 * math.pi))
+        # The uniform prior keeps the density positive everywhere
+        density = (kernels.sum(axis=1) + 1) / (len(points) + 1)
+        return np.log(density).sum(axis=1)
+
+
+def halton(index, dims):
+    """Returns the point index of the Halton sequence in the unit hypercube"""
+    if dims > len(PRIMES):
+        raise ValueError('Halton sequences support up to {} dimensions'.format(len(PRIMES)))
+    point = np.zeros(dims)
+    for d, base in enumerate(PRIMES[:dims]):
+        i, f = index, 1.0
+        while i > 0:
+            f /= base
+            point[d] += f * (i % base)
+            i //= base
+    return point
@@ -0,0 +1,141 @@
+import numpy as np
+
+
+class Parameter(object):
+    """A dimension of a hyperparameter space.
+
+    Every value maps to a point of the unit interval, so samplers can work
+    on the unit hypercube whatever the type of the parameters."""
+
+    def to_unit(self, value):
+        raise NotImplementedError()
+
+    def from_unit(self, u):
+        raise NotImplementedError()
+
+    def grid(self, points):
+        """Returns up to points values evenly spread over the parameter"""
+        return [self.from_unit(u) for u in (np.arange(points) + 0.5) / points]
+
+
+class Continuous(Parameter):
+    def __init__(self, low, high, log=False):
+        if not low < high:
+            raise ValueError('low must be lower than high, got {} and {}'.format(low, high))
+        if log and low <= 0:
+            raise ValueError('log scaled parameters must be positive, got {}'.format(low))
+        self.low = low
+        self.high = high
+        self.log = log
+
+    def _scale(self, value):
+        return np.log(value) if self.log else value
+
+    def to_unit(self, value):
+        low, high = self._scale(self.low), self._scale(self.high)
+        return (self._scale(value) - low) / (high - low)
+
+    def from_unit(self, u):
+        low, high = self._scale(self.low), self._scale(self.high)
+        u = np.asarray(u, dtype=float)
+        value = low + u * (high - low)
+        if self.log:
+            value = np.exp(value)
+        # Bounds are returned exactly, whatever the rounding of the scale
+        value = np.where(u <= 0, self.low, np.where(u >= 1, self.high, value))
+        return _to_python(np.clip(value, self.low, self.high))
+
+    def grid(self, points):
+        if points == 1:
+            return [self.from_unit(0.5)]
+        return [self.from_unit(u) for u in np.linspace(0, 1, points)]
+
+
+class Integer(Parameter):
+    """Integer parameter, both bounds included"""
+
+    def __init__(self, low, high, log=False):
+        self.low = int(low)
+        self.high = int(high)
+        self._continuous = Continuous(self.low - 0.5, self.high + 0.5, log=log)
+
+    def to_unit(self, value):
+        return self._continuous.to_unit(value)
+
+    def from_unit(self, u):
+        value = np.rint(self._continuous.from_unit(u))
+        return _to_python(np.clip(value, self.low, self.high).astype(int))
+
+    def grid(self, points):
+        if points >= self.high - self.low + 1:
+            return list(range(self.low, self.high + 1))
+        return sorted(set(super(Integer, self).grid(points)))
+
+
+class Categorical(Parameter):
+    def __init__(self, choices):
+        self.choices = list(choices)
+
+    def to_unit(self, value):
+        return (self.choices.index(value) + 0.5) / len(self.choices)
+
+    def from_unit(self, u):
+        index = np.clip(np.floor(np.asarray(u) * len(self.choices)), 0, len(self.choices) - 1)
+        index = index.astype(int)
+        if index.ndim == 0:
+            return self.choices[index]
+        return [self.choices[i] for i in index]
+
+    def grid(self, points):
+        return list(self.choices)
+
+
+class SearchSpace(object):
+    """Typed hyperparameter space, a dict of name -> Parameter.
+
+    Dimensions are ordered by name so unit vectors are stable between runs."""
+
+    def __init__(self, parameters):
+        self.parameters = dict(parameters)
+        self.names = sorted(self.parameters)
+
+    def __len__(self):
+        return len(self.names)
+
+    def to_unit(self, hp):
+        return np.array([self.parameters[name].to_unit(hp[name]) for name in self.names])
+
+    def from_unit(self, u):
+        return {name: self.parameters[name].from_unit(u[i]) for i, name in enumerate(self.names)}
+
+    def from_unit_batch(self, u):
+        """Converts a (count, dimensions) array of unit vectors at once"""
+        columns = [_to_list(self.parameters[name].from_unit(u[:, i]))
+                   for i, name in enumerate(self.names)]
+        return [dict(zip(self.names, row)) for row in zip(*columns)]
+
+    def sample(self, rng):
+        return self.from_unit(rng.uniform(size=len(self)))
+
+    def sample_batch(self, count, rng):
+        return self.from_unit_batch(rng.uniform(size=(count, len(self))))
+
+    def grid(self, points):
+        """Returns the list of every combination of points values per parameter"""
+        hps = [{}]
+        for name in self.names:
+            hps = [dict(hp, **{name: v}) for hp in hps for v in self.parameters[name].grid(points)]
+        return hps
+
+
+def _to_list(values):
+    if isinstance(values, np.ndarray):
+        return values.tolist()
+    return list(values)
+
+
+def _to_python(value):
+    # Hyperparameters are serialized to JSON, numpy scalars aren't
+    if np.ndim(value) == 0:
+        return np.asarray(value).item()
+    return value
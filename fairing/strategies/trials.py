@@ -0,0 +1,127 @@
+import json
+import logging
+import threading
+
+import redis
+
+from fairing.utils import read_json, update_json
+
+logger = logging.getLogger('fairing')
+
+# Trial states
+RUNNING = 'running'
+COMPLETED = 'completed'
+PRUNED = 'pruned'
+FAILED = 'failed'
+
+# Counter of the trials handed to workers
+NEXT_TRIAL_KEY = 'fairing:hp:next-trial'
+# Hash of trial id -> JSON encoded trial
+TRIALS_KEY = 'fairing:hp:trials'
+
+
+def new_trial(trial_id, hp):
+    return {
+        'id': trial_id,
+        'hp': hp,
+        'state': RUNNING,
+        'metric': None,
+        # [step, metric] pairs reported while training
+        'intermediate': [],
+    }
+
+
+class TrialStore(object):
+    """Where the workers of a hyperparameter search get their trial
+    and record its results."""
+
+    def is_shared(self):
+        """Whether workers running in other processes see the trials"""
+        return True
+
+    def claim_trial_id(self):
+        """Returns the id of the next trial, unique across workers"""
+        raise NotImplementedError()
+
+    def save_trial(self, trial):
+        raise NotImplementedError()
+
+    def get_trials(self):
+        """Returns every trial, ordered by id"""
+        raise NotImplementedError()
+
+    def get_best_trial(self):
+        """Returns the completed trial with the lowest metric"""
+        completed = [t for t in self.get_trials() if t['state'] == COMPLETED and t['metric'] is not None]
+        if not completed:
+            return None
+        return min(completed, key=lambda t: t['metric'])
+
+
+class RedisTrialStore(TrialStore):
+    def __init__(self, host=None, port=6379, client=None):
+        self.redis = client or redis.StrictRedis(host=host, port=port)
+
+    def claim_trial_id(self):
+        return self.redis.incr(NEXT_TRIAL_KEY) - 1
+
+    def save_trial(self, trial):
+        self.redis.hset(TRIALS_KEY, trial['id'], json.dumps(trial))
+
+    def get_trials(self):
+        trials = [json.loads(v.decode('utf8')) for v in self.redis.hvals(TRIALS_KEY)]
+        return sorted(trials, key=lambda t: t['id'])
+
+
+class FileTrialStore(TrialStore):
+    """Trials stored in a JSON file on a filesystem shared by the workers"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def claim_trial_id(self):
+        def claim(content):
+            trial_id = content.get('next_trial', 0)
+            content['next_trial'] = trial_id + 1
+            return trial_id
+        return update_json(self.path, claim)
+
+    def save_trial(self, trial):
+        update_json(self.path, lambda content: content.setdefault('trials', {}).update(
+            {str(trial['id']): trial}))
+
+    def get_trials(self):
+        trials = read_json(self.path, {}).get('trials', {}).values()
+        return sorted(trials, key=lambda t: t['id'])
+
+
+class MemoryTrialStore(TrialStore):
+    """Trials kept in memory, shared between threads, or between processes
+    when created with MemoryTrialStore.shared()"""
+
+    def __init__(self, trials=None, counter=None, lock=None):
+        self.trials = {} if trials is None else trials
+        self.counter = {'next_trial': 0} if counter is None else counter
+        self.lock = lock or threading.Lock()
+
+    @classmethod
+    def shared(cls, manager=None):
+        if manager is None:
+            import multiprocessing
+            manager = multiprocessing.Manager()
+        return cls(manager.dict(), manager.dict({'next_trial': 0}), manager.Lock())
+
+    def is_shared(self):
+        return not isinstance(self.trials, dict)
+
+    def claim_trial_id(self):
+        with self.lock:
+            trial_id = self.counter['next_trial']
+            self.counter['next_trial'] = trial_id + 1
+            return trial_id
+
+    def save_trial(self, trial):
+        self.trials[trial['id']] = trial
+
+    def get_trials(self):
+        return sorted(self.trials.values(), key=lambda t: t['id'])
@@ -6,11 +6,15 @@ import shutil
 
 # from fairing.backend import get_backend, Native
 from fairing.builders import get_container_builder
+from fairing.builders.context import get_content_tag
+from fairing.builders.dockerfile import DockerFile
 from fairing.utils import is_runtime_phase, get_image_full
 from fairing.options import TensorboardOptions
 from fairing.architectures.native.basic import BasicArchitecture
 from fairing.strategies.basic import BasicTrainingStrategy
 from fairing.metaparticle import MetaparticleClient
+from fairing.backend.local import LocalBackend
+from fairing.deployers import get_deployer
 from fairing.utils import get_unique_tag, is_running_in_k8s, get_current_k8s_namespace
 
 logger = logging.getLogger('fairing')
@@ -27,11 +31,16 @@ class Trainer(object):
                  tensorboard=None,
                  architecture=BasicArchitecture(),
                  strategy=BasicTrainingStrategy(),
-                 builder=None):
+                 builder=None,
+                 content_addressed_tag=False,
+                 deployer=None):
 
         self.repository = repository
         self.image_name = image_name
         self.image_tag = image_tag
+        # When set, and no image_tag is given, the tag is derived from the content
+        # of the image so unchanged code doesn't get rebuilt and pushed again.
+        self.content_addressed_tag = content_addressed_tag and image_tag is None
 
         # Target namespace where the job(s) will be deployed
         self.namespace = namespace or self.get_default_target_namespace()
@@ -46,6 +55,8 @@ class Trainer(object):
         self.strategy.set_architecture(self.architecture)
 
         self.builder = get_container_builder(builder)
+        # Submits the compiled AST to the cluster, Metaparticle by default
+        self.deployer = deployer
 
         self.full_image_name = None
 
@@ -77,18 +88,32 @@ class Trainer(object):
         return ast, env
 
     def get_metaparticle_client(self):
-        return MetaparticleClient()
-
-    def fill_image_name_and_tag(self):
-        if self.image_tag is None:
+        if self.deployer is None:
+            return MetaparticleClient()
+        return get_deployer(self.deployer)
+
+    def get_content_tag(self, env):
+        # Use the same Dockerfile generator as the builder so the tag matches what gets built
+        dockerfile = getattr(self.builder, 'dockerfile', None) or DockerFile()
+        content = dockerfile.get_content(
+            env, dockerfile=self.dockerfile, base_image=self.base_image)
+        return get_content_tag(content, env)
+
+    def fill_image_name_and_tag(self, env=None):
+        if self.content_addressed_tag:
+            # Always recomputed since the code might have changed since the last deployment
+            self.image_tag = self.get_content_tag(env)
+        elif self.image_tag is None:
             self.image_tag = get_unique_tag()
         
         self.full_image_name = get_image_full(
             self.repository, self.image_name, self.image_tag)
 
-    def deploy_training(self, stream_logs=True):
-        self.fill_image_name_and_tag()
-        ast, env = self.compile_ast()
+    def build_image(self, env):
+        if self.content_addressed_tag and \
+           self.builder.image_exists(self.repository, self.image_name, self.image_tag, self.publish):
+            logger.warn('Image {} already exists, skipping build.'.format(self.full_image_name))
+            return
 
         self.builder.execute(self.repository,
                              self.image_name,
@@ -98,10 +123,26 @@ class Trainer(object):
                              self.publish,
                              env)
 
+    def deploy_training(self, stream_logs=True, user_object=None):
+        if isinstance(self.backend, LocalBackend):
+            # Runs on this machine, straight from the current code
+            self.backend.run_training(self.strategy, user_object, self.image_name)
+            return
+
+        env = None
+        if self.content_addressed_tag:
+            # The environment variables don't depend on the tag, but they are part of the
+            # image content, so they have to be known before the tag can be computed.
+            _, env = self.compile_ast()
+        self.fill_image_name_and_tag(env)
+        ast, env = self.compile_ast()
+
+        self.build_image(env)
+
         mp = self.get_metaparticle_client()
 
         def signal_handler(signal, frame):
-            mp.cancel(self.image_name)
+            mp.cancel(ast['name'])
             sys.exit(0)
         signal.signal(signal.SIGINT, signal_handler)
         mp.run(ast)
@@ -109,7 +150,7 @@ class Trainer(object):
         logger.warn("Training(s) launched.")
 
         if stream_logs:
-            self.backend.stream_logs(self.image_name, self.image_tag)
+            self.backend.stream_logs(self.image_name, self.image_tag, mp)
 
     def start_training(self, user_class):
         self.strategy.exec_user_code(user_class)
@@ -127,7 +168,9 @@ class Train(object):
                  tensorboard=None,
                  architecture=BasicArchitecture(),
                  strategy=BasicTrainingStrategy(),
-                 builder=None):
+                 builder=None,
+                 content_addressed_tag=False,
+                 deployer=None):
 
         self.trainer = Trainer(repository=repository,
                                image_name=image_name,
@@ -139,7 +182,9 @@ class Train(object):
                                tensorboard=tensorboard,
                                architecture=architecture,
                                strategy=strategy,
-                               builder=builder)
+                               builder=builder,
+                               content_addressed_tag=content_addressed_tag,
+                               deployer=deployer)
 
     def __call__(self, cls):
         class UserClass(cls):
@@ -168,6 +213,6 @@ class Train(object):
                 pass
 
             def _deploy_training(user_class):
-                self.trainer.deploy_training()
+                self.trainer.deploy_training(user_object=user_class)
 
         return UserClass
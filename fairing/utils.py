@@ -1,6 +1,12 @@
+import json
 import os
 import uuid
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
 def get_image_full(repository, name, tag):
     return "{base}:{tag}".format(
         base=get_image(repository, name),
@@ -26,4 +32,31 @@ def get_current_k8s_namespace():
 
 def get_unique_tag():
     id = uuid.uuid4()
-    return str(id).split('-')[0]
\ No newline at end of file
+    return str(id).split('-')[0]
+
+def read_json(path, default=None):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return default
+
+def update_json(path, update):
+    """Applies update to the content of the JSON file at path, and returns its result.
+    Concurrent writers are serialized with a lock file, where fcntl is available,
+    and the file is replaced atomically so readers never see a partial write."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path + '.lock', 'a') as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            content = read_json(path, {})
+            result = update(content)
+            tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+            with open(tmp_path, 'w') as f:
+                json.dump(content, f)
+            os.replace(tmp_path, path)
+            return result
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_UN)
@@ -1,6 +1,10 @@
 import pytest
+from unittest.mock import Mock
 
-from fairing.builders.knative.models.build import Build
+import kubernetes.client
+from kubernetes.client.rest import ApiException
+
+from fairing.builders.knative.models.build import Build, BuildError, BuildTimeoutError
 
 @pytest.fixture
 def build():
@@ -14,4 +18,104 @@ def build():
     ({'status': 'malformed-obhect'}, None)
 ])
 def test_check_build_succeeded(build, status, expected):
-    assert build.check_build_succeeded(status) == expected
\ No newline at end of file
+    assert build.check_build_succeeded(status) == expected
+
+def build_object(name, status, resource_version='1'):
+    return {
+        'metadata': {'name': name, 'resourceVersion': resource_version},
+        'status': {'conditions': [{'state': 'Succeeded', 'status': status}]}
+    }
+
+
+class FakeWatch(object):
+    def __init__(self, events):
+        self.events = events
+        self.calls = []
+
+    def __call__(self):
+        return self
+
+    def stream(self, func, *args, **kwargs):
+        self.calls.append(kwargs)
+        return iter(self.events.pop(0))
+
+    def stop(self):
+        pass
+
+
+@pytest.fixture
+def watched_build(monkeypatch):
+    metadata = kubernetes.client.V1ObjectMeta(name='fairing-build-test', namespace='fairing')
+    bld = Build(metadata=metadata, spec=None)
+    bld._api_custom = Mock()
+    bld._api_custom.get_namespaced_custom_object.return_value = build_object(
+        'fairing-build-test', 'Unknown')
+    monkeypatch.setattr('fairing.builders.knative.models.build.time.sleep', lambda x: None)
+    return bld
+
+
+def test_wait_for_build_completion(watched_build, monkeypatch):
+    fake_watch = FakeWatch([[
+        {'type': 'MODIFIED', 'object': build_object('other-build', 'False')},
+        {'type': 'MODIFIED', 'object': build_object('fairing-build-test', 'Unknown', '2')},
+        {'type': 'MODIFIED', 'object': build_object('fairing-build-test', 'True', '3')},
+    ]])
+    monkeypatch.setattr('fairing.builders.knative.models.build.watch.Watch', fake_watch)
+    watched_build.wait_for_build_completion()
+    # The watch should resume from the version returned by the initial GET
+    assert fake_watch.calls[0]['resource_version'] == '1'
+    # Only this build should be watched
+    assert fake_watch.calls[0]['label_selector'] == 'fairing-build-name=fairing-build-test'
+    assert watched_build._metadata.labels == {'fairing-build-name': 'fairing-build-test'}
+
+
+def test_wait_for_build_completion_reconnects(watched_build, monkeypatch):
+    fake_watch = FakeWatch([
+        # The resource version expired, the watch should be restarted from a fresh GET
+        [{'type': 'ERROR', 'object': {'code': 410, 'message': 'Gone'}}],
+        [{'type': 'MODIFIED', 'object': build_object('fairing-build-test', 'True', '3')}],
+    ])
+    monkeypatch.setattr('fairing.builders.knative.models.build.watch.Watch', fake_watch)
+    watched_build.wait_for_build_completion()
+    assert watched_build._api_custom.get_namespaced_custom_object.call_count == 2
+    assert len(fake_watch.calls) == 2
+
+
+def test_wait_for_build_completion_failure(watched_build, monkeypatch):
+    fake_watch = FakeWatch([
+        [{'type': 'MODIFIED', 'object': build_object('fairing-build-test', 'False', '2')}],
+    ])
+    monkeypatch.setattr('fairing.builders.knative.models.build.watch.Watch', fake_watch)
+    monkeypatch.setattr(watched_build, 'fetch_build_logs', lambda: 'some logs')
+    with pytest.raises(BuildError):
+        watched_build.wait_for_build_completion()
+
+
+def test_wait_for_build_completion_timeout(watched_build):
+    with pytest.raises(BuildTimeoutError):
+        watched_build.wait_for_build_completion(timeout=0)
+
+
+@pytest.mark.parametrize("status, deleted", [
+    ('False', True),
+    ('Unknown', False),
+    ('True', False),
+])
+def test_delete_if_failed(watched_build, status, deleted):
+    watched_build._api_custom.get_namespaced_custom_object.return_value = build_object(
+        'fairing-build-test', status)
+    # Only failed builds should be deleted, running ones are waited upon
+    assert watched_build.delete_if_failed() == deleted
+    assert watched_build._api_custom.delete_namespaced_custom_object.called == deleted
+
+
+def test_create_raises_rejected_builds(watched_build):
+    watched_build.to_dict = Mock(return_value={})
+    create = watched_build._api_custom.create_namespaced_custom_object
+    # An existing build is waited upon
+    create.side_effect = ApiException(status=409)
+    watched_build.create()
+
+    create.side_effect = ApiException(status=403)
+    with pytest.raises(ApiException):
+        watched_build.create()
@@ -0,0 +1,79 @@
+import os
+import pytest
+
+from fairing.builders.knative.context_store import ContextStore
+
+
+@pytest.fixture
+def context_dir(tmpdir):
+    src = tmpdir.mkdir('src')
+    src.join('main.py').write('print("hello")')
+    src.mkdir('lib').join('utils.py').write('x = 1')
+    return str(src)
+
+
+@pytest.fixture
+def store(tmpdir):
+    return ContextStore(str(tmpdir.join('build-contexts')), max_contexts=2)
+
+
+def read(path):
+    with open(path) as f:
+        return f.read()
+
+
+def test_add_context(store, context_dir):
+    dst = store.add_context('build1', context_dir)
+    assert read(os.path.join(dst, 'main.py')) == 'print("hello")'
+    assert read(os.path.join(dst, 'lib', 'utils.py')) == 'x = 1'
+
+
+def test_unchanged_files_are_linked(store, context_dir):
+    first = store.add_context('build1', context_dir)
+    with open(os.path.join(context_dir, 'main.py'), 'w') as f:
+        f.write('print("world")')
+    second = store.add_context('build2', context_dir)
+
+    # Unchanged files should share the same stored object
+    assert os.stat(os.path.join(first, 'lib', 'utils.py')).st_ino == \
+        os.stat(os.path.join(second, 'lib', 'utils.py')).st_ino
+    assert read(os.path.join(first, 'main.py')) == 'print("hello")'
+    assert read(os.path.join(second, 'main.py')) == 'print("world")'
+
+
+def test_collect_garbage(store, context_dir):
+    store.grace_period = 0
+    for ix in range(3):
+        with open(os.path.join(context_dir, 'main.py'), 'w') as f:
+            f.write('print({})'.format(ix))
+        store.add_context('build{}'.format(ix), context_dir)
+        # Make sure contexts have distinct modification times
+        os.utime(os.path.join(store.root, 'build{}'.format(ix)), (ix, ix))
+
+    contexts = [os.path.basename(c) for c in store.list_contexts()]
+    assert contexts == ['build1', 'build2']
+
+    # Objects only referenced by the removed context should be gone too
+    objects = [name for prefix in os.listdir(store.objects_dir)
+               if os.path.isdir(os.path.join(store.objects_dir, prefix))
+               for name in os.listdir(os.path.join(store.objects_dir, prefix))]
+    assert len(objects) == 3
+
+
+def test_dockerfile_always_included(store, context_dir):
+    with open(os.path.join(context_dir, 'Dockerfile'), 'w') as f:
+        f.write('FROM library/python:3.6')
+    with open(os.path.join(context_dir, '.dockerignore'), 'w') as f:
+        f.write('Dockerfile\nlib\n')
+    dst = store.add_context('build1', context_dir)
+    assert read(os.path.join(dst, 'Dockerfile')) == 'FROM library/python:3.6'
+    assert not os.path.exists(os.path.join(dst, 'lib'))
+
+
+def test_collect_garbage_grace_period(store, context_dir):
+    # Contexts of builds that just started, possibly in other processes, should be kept
+    for ix in range(3):
+        store.add_context('build{}'.format(ix), context_dir)
+
+    contexts = [os.path.basename(c) for c in store.list_contexts()]
+    assert sorted(contexts) == ['build0', 'build1', 'build2']
@@ -0,0 +1,29 @@
+from unittest.mock import Mock
+
+from fairing.builders.knative.knative import KnativeBuilder, get_build_name
+
+
+def test_build_name_depends_on_image():
+    assert get_build_name('repoA/img', 'abc') == get_build_name('repoA/img', 'abc')
+    assert get_build_name('repoA/img', 'abc') != get_build_name('repoB/img', 'abc')
+    assert get_build_name('repoA/img', 'abc') != get_build_name('repoA/other', 'abc')
+    assert len(get_build_name('repoA/img', 'a' * 16)) <= 63
+
+
+def test_image_exists_looks_up_the_build_of_the_image(tmpdir, monkeypatch):
+    monkeypatch.setenv('HOME', str(tmpdir))
+    builder = KnativeBuilder()
+    builder.authenticate = Mock()
+    builder._build_id = 'previous'
+
+    built = {get_build_name('repoA/img', 'abc')}
+    def get_build(self):
+        if self._metadata.name in built:
+            return {'status': {'conditions': [{'state': 'Succeeded', 'status': 'True'}]}}
+        return None
+    monkeypatch.setattr('fairing.builders.knative.models.build.Build._get_build', get_build)
+
+    assert builder.image_exists('repoA', 'img', 'abc', True)
+    assert not builder.image_exists('repoB', 'img', 'abc', True)
+    assert not builder.image_exists('repoA', 'other', 'abc', True)
+    assert builder._build_id == 'previous'
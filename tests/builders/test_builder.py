@@ -11,3 +11,7 @@ def test_get_container_builder():
 
     with pytest.raises(ValueError):
         get_container_builder('wrong_key')
+
+def test_get_configured_container_builder():
+    builder = DockerBuilder(dependency_layers=True)
+    assert get_container_builder(builder) is builder
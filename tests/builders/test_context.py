@@ -0,0 +1,67 @@
+import os
+import tarfile
+import pytest
+
+from fairing.builders.context import list_context_files, get_content_tag, create_context_tar, IgnoreRules
+
+DOCKERFILE = 'FROM library/python:3.6'
+
+
+@pytest.fixture
+def context_dir(tmpdir):
+    tmpdir.join('main.py').write('print("hello")')
+    tmpdir.mkdir('lib').join('utils.py').write('x = 1')
+    tmpdir.mkdir('.git').join('HEAD').write('ref: refs/heads/master')
+    tmpdir.join('Dockerfile').write(DOCKERFILE)
+    return str(tmpdir)
+
+
+def test_list_context_files(context_dir):
+    assert list_context_files(context_dir) == ['Dockerfile', os.path.join('lib', 'utils.py'), 'main.py']
+
+
+@pytest.mark.parametrize("patterns, path, expected", [
+    (['data'], 'data/train.csv', True),
+    (['*.csv'], 'train.csv', True),
+    (['*.csv'], 'data/train.csv', False),
+    (['*/*.csv'], 'data/train.csv', True),
+    (['**/*.csv'], 'data/2018/train.csv', True),
+    (['**/*.csv'], 'train.csv', True),
+    (['data', '!data/keep.csv'], 'data/keep.csv', False),
+    (['# data'], 'data/train.csv', False),
+    ([], '.git/HEAD', True),
+    ([], 'lib/__pycache__/utils.pyc', True),
+])
+def test_ignore_rules(patterns, path, expected):
+    assert IgnoreRules(patterns=patterns).is_ignored(path) == expected
+
+
+def test_create_context_tar(context_dir):
+    with open(os.path.join(context_dir, '.dockerignore'), 'w') as f:
+        f.write('lib\nDockerfile\n')
+    fileobj, sizes = create_context_tar(context_dir)
+    with tarfile.open(fileobj=fileobj) as tar:
+        names = sorted(tar.getnames())
+    # The Dockerfile should always be sent even when ignored
+    assert names == ['.dockerignore', 'Dockerfile', 'main.py']
+    assert sizes['main.py'] == len('print("hello")')
+
+
+def test_content_tag_is_deterministic(context_dir):
+    tag = get_content_tag(DOCKERFILE, [], context_dir)
+    assert tag == get_content_tag(DOCKERFILE, [], context_dir)
+
+    # Ignored files should not change the tag
+    with open(os.path.join(context_dir, '.git', 'HEAD'), 'w') as f:
+        f.write('ref: refs/heads/other')
+    assert tag == get_content_tag(DOCKERFILE, [], context_dir)
+
+
+def test_content_tag_changes(context_dir):
+    tag = get_content_tag(DOCKERFILE, [], context_dir)
+    assert tag != get_content_tag(DOCKERFILE + '\nENV a b', [], context_dir)
+    assert tag != get_content_tag(DOCKERFILE, [{'name': 'a', 'value': 'b'}], context_dir)
+
+    with open(os.path.join(context_dir, 'main.py'), 'w') as f:
+        f.write('print("world")')
+    assert tag != get_content_tag(DOCKERFILE, [], context_dir)
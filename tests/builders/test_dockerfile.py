@@ -56,4 +56,42 @@ def test_get_env_steps(dockerfile):
                          ])
 def test_get_exec_file_name(dockerfile, monkeypatch, file_name, expected_name):
     monkeypatch.setattr('sys.argv', [file_name, "--some-arguments"])
-    assert dockerfile.get_exec_file_name() == expected_name
\ No newline at end of file
+    assert dockerfile.get_exec_file_name() == expected_name
+
+def test_get_layered_steps(monkeypatch, tmpdir):
+    monkeypatch.chdir(tmpdir)
+    dockerfile = DockerFile(dependency_layers=True)
+    # Without any dependency file the sources are simply copied
+    assert dockerfile.get_mandatory_steps() == [
+        "ENV FAIRING_RUNTIME 1",
+        "RUN pip install fairing",
+        "COPY ./ /app/"
+    ]
+
+    tmpdir.join('requirements.txt').write('numpy')
+    tmpdir.join('constraints.txt').write('numpy==1.15.0')
+    # Dependencies should be installed before the rest of the sources are copied
+    assert dockerfile.get_mandatory_steps() == [
+        "ENV FAIRING_RUNTIME 1",
+        "RUN pip install fairing",
+        "COPY requirements.txt constraints.txt /app/",
+        "RUN pip install --no-cache -r /app/requirements.txt -c /app/constraints.txt",
+        "COPY ./ /app/"
+    ]
+
+
+def test_get_dependency_steps_ignored_files(monkeypatch, tmpdir):
+    monkeypatch.chdir(tmpdir)
+    tmpdir.join('requirements.txt').write('numpy')
+    tmpdir.join('constraints.txt').write('numpy==1.15.0')
+    dockerfile = DockerFile(dependency_layers=True)
+
+    # Files excluded by .dockerignore are not part of the context and can't be copied
+    tmpdir.join('.dockerignore').write('constraints.txt')
+    assert dockerfile.get_dependency_steps() == [
+        "COPY requirements.txt /app/",
+        "RUN pip install --no-cache -r /app/requirements.txt"
+    ]
+
+    tmpdir.join('.dockerignore').write('*.txt')
+    assert dockerfile.get_dependency_steps() == []
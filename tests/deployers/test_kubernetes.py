@@ -0,0 +1,215 @@
+import pytest
+from types import SimpleNamespace
+from unittest.mock import Mock
+
+from kubernetes.client.rest import ApiException
+
+from fairing.deployers import get_deployer, KubernetesDeployer
+from fairing.deployers.kubernetes import RateLimiter, TYPED_APIS
+from fairing.metaparticle import MetaparticleClient
+from fairing.architectures.kubeflow.basic import BasicArchitecture as KubeflowArchitecture
+from fairing.architectures.native.basic import BasicArchitecture
+from fairing.backend import NativeBackend
+from fairing.options import TensorboardOptions
+
+REPO_NAME = 'testrepo'
+IMAGE_NAME = 'fairing-test'
+IMAGE_TAG = 'test'
+
+
+@pytest.fixture
+def deployer():
+    return KubernetesDeployer()
+
+
+def test_get_deployer():
+    assert type(get_deployer()) == MetaparticleClient
+    assert type(get_deployer('metaparticle')) == MetaparticleClient
+    assert type(get_deployer('kubernetes')) == KubernetesDeployer
+
+    with pytest.raises(ValueError):
+        get_deployer('wrong_key')
+
+
+def test_compile_job(deployer):
+    volumes = [{'name': 'checkpoint', 'persistentVolumeClaim': 'my-pvc'}]
+    volume_mounts = [{'name': 'checkpoint', 'mountPath': '/ckpt'}]
+    svc = {'namespace': 'ns', 'name': 'job-test'}
+    svc = BasicArchitecture().add_jobs(svc, 3, REPO_NAME, IMAGE_NAME, IMAGE_TAG, volumes, volume_mounts)
+
+    objects = deployer.compile(svc)
+    assert len(objects) == 1
+    job = objects[0]
+    assert job['kind'] == 'Job'
+    assert job['metadata']['namespace'] == 'ns'
+    assert job['metadata']['labels'] == {'fairing-deployment': 'job-test'}
+    assert job['spec']['parallelism'] == 3
+    assert job['spec']['completions'] == 3
+
+    pod_spec = job['spec']['template']['spec']
+    assert pod_spec['containers'][0]['image'] == 'testrepo/fairing-test:test'
+    assert pod_spec['containers'][0]['volumeMounts'] == volume_mounts
+    assert pod_spec['volumes'] == [{'name': 'checkpoint', 'persistentVolumeClaim': {'claimName': 'my-pvc'}}]
+
+
+def test_compile_tfjobs(deployer):
+    svc = {'namespace': 'ns', 'name': 'tfjob-test'}
+    svc = KubeflowArchitecture().add_jobs(svc, 2, REPO_NAME, IMAGE_NAME, IMAGE_TAG, [], [])
+
+    objects = deployer.compile(svc)
+    assert [o['metadata']['name'] for o in objects] == ['fairing-test-test-0', 'fairing-test-test-1']
+    chief = objects[0]['spec']['tfReplicaSpecs']['Chief']
+    assert chief['replicas'] == 1
+    assert chief['template']['spec']['containers'][0]['name'] == 'tensorflow'
+
+
+def test_compile_public_service(deployer):
+    tb_options = TensorboardOptions(log_dir='/logs', pvc_name='tb-pvc', public=True)
+    svc, _, _ = NativeBackend().add_tensorboard({'name': 'tb-test'}, 'tb', tb_options)
+
+    deployment, service = deployer.compile(svc)
+    assert deployment['kind'] == 'Deployment'
+    assert deployment['metadata']['namespace'] == 'default'
+    assert service['spec']['type'] == 'LoadBalancer'
+    assert service['spec']['ports'][0]['port'] == 6006
+    assert service['spec']['selector'] == deployment['spec']['selector']['matchLabels']
+
+
+def test_compile_serving_readiness_probe(deployer):
+    svc = NativeBackend().compile_serving_ast('repo/model:latest', 'model', 8080, 2, '/ready')
+
+    deployment, service = deployer.compile(svc)
+    container = deployment['spec']['template']['spec']['containers'][0]
+    assert container['readinessProbe'] == {'httpGet': {'path': '/ready', 'port': 8080}}
+    assert deployment['spec']['replicas'] == 2
+    assert service['spec']['type'] == 'LoadBalancer'
+
+
+def test_run_patches_existing_services(deployer):
+    tb_options = TensorboardOptions(log_dir='/logs', pvc_name='tb-pvc', public=True)
+    svc, _, _ = NativeBackend().add_tensorboard({'name': 'tb-test'}, 'tb', tb_options)
+
+    def call(verb, obj):
+        if verb == 'create':
+            raise ApiException(status=409)
+    deployer._call = Mock(side_effect=call)
+
+    deployer.run(svc)
+    verbs = sorted(c[0][0] for c in deployer._call.call_args_list)
+    assert verbs == ['create', 'create', 'patch', 'patch']
+
+    deployer.list_deployed = Mock(return_value=deployer.compile(svc))
+    deployer.cancel('tb-test')
+    assert deployer._call.call_args[0][0] == 'delete'
+
+
+def test_cancel_deletes_by_label(deployer, monkeypatch):
+    selectors = []
+
+    def list_objects(*args, label_selector=None):
+        selectors.append(label_selector)
+        return SimpleNamespace(items=[SimpleNamespace(metadata=SimpleNamespace(name='obj'))])
+    api = Mock(**{'list_namespaced_job': list_objects,
+                  'list_namespaced_service': list_objects,
+                  'list_namespaced_deployment': list_objects,
+                  'list_namespaced_custom_object.side_effect': ApiException(status=404)})
+    for kind, (_, suffix) in TYPED_APIS.items():
+        monkeypatch.setitem(TYPED_APIS, kind, (Mock(return_value=api), suffix))
+    monkeypatch.setattr('kubernetes.client.CustomObjectsApi', Mock(return_value=api))
+    deployer.get_api_client = Mock()
+    deployer._call = Mock()
+
+    # Nothing was deployed by this deployer, i.e. it was started by another process
+    deployer.cancel('job-test')
+    assert selectors == ['fairing-deployment=job-test'] * 3
+    deleted = sorted(c[0][1]['kind'] for c in deployer._call.call_args_list if c[0][0] == 'delete')
+    assert deleted == ['Deployment', 'Job', 'Service']
+
+
+def test_logs_gives_up_on_pending_pods(deployer, monkeypatch):
+    monkeypatch.setattr('fairing.deployers.kubernetes.time.sleep', lambda x: None)
+    pod = SimpleNamespace(metadata=SimpleNamespace(name='pod'), status=SimpleNamespace(phase='Pending'))
+    core_api = Mock(**{'list_namespaced_pod.return_value': SimpleNamespace(items=[pod])})
+    monkeypatch.setattr('kubernetes.client.CoreV1Api', Mock(return_value=core_api))
+    deployer.get_api_client = Mock()
+    with pytest.raises(RuntimeError, match='1 still pending'):
+        deployer.logs('job-test', pending_timeout=0)
+
+
+def test_run_replaces_existing_jobs(deployer, monkeypatch):
+    monkeypatch.setattr('fairing.deployers.kubernetes.time.sleep', lambda x: None)
+    svc = {'name': 'job-test'}
+    svc = BasicArchitecture().add_jobs(svc, 1, REPO_NAME, IMAGE_NAME, IMAGE_TAG, [], [])
+
+    existing = {'job': True}
+    terminating = {'count': 2}
+
+    def call(verb, obj):
+        if verb == 'delete':
+            existing['job'] = False
+        elif verb == 'create':
+            if existing['job']:
+                raise ApiException(status=409)
+            # The deleted job takes a little while to go away
+            if terminating['count'] > 0:
+                terminating['count'] -= 1
+                raise ApiException(status=409)
+        elif verb == 'patch':
+            # The pod template of a Job is immutable
+            raise ApiException(status=422)
+    deployer._call = Mock(side_effect=call)
+
+    deployer.run(svc)
+    verbs = [c[0][0] for c in deployer._call.call_args_list]
+    assert verbs == ['create', 'delete', 'create', 'create', 'create']
+
+
+def test_run_retries_throttled_requests(deployer, monkeypatch):
+    monkeypatch.setattr('fairing.deployers.kubernetes.time.sleep', lambda x: None)
+    svc = {'name': 'tfjob-test'}
+    svc = KubeflowArchitecture().add_jobs(svc, 20, REPO_NAME, IMAGE_NAME, IMAGE_TAG, [], [])
+
+    attempts = {}
+
+    def call(verb, obj):
+        name = obj['metadata']['name']
+        attempts[name] = attempts.get(name, 0) + 1
+        # Every job gets throttled once before being accepted
+        if attempts[name] == 1:
+            raise ApiException(status=429)
+    deployer._call = Mock(side_effect=call)
+
+    deployer.run(svc)
+    assert len(attempts) == 20
+    assert all(count == 2 for count in attempts.values())
+
+
+def test_run_reports_failures(deployer, monkeypatch):
+    monkeypatch.setattr('fairing.deployers.kubernetes.time.sleep', lambda x: None)
+    svc = {'name': 'tfjob-test'}
+    svc = KubeflowArchitecture().add_jobs(svc, 3, REPO_NAME, IMAGE_NAME, IMAGE_TAG, [], [])
+
+    def call(verb, obj):
+        if obj['metadata']['name'].endswith('-1'):
+            raise ApiException(status=403)
+    deployer._call = Mock(side_effect=call)
+
+    # Other jobs should still be submitted, the failure being reported at the end
+    with pytest.raises(RuntimeError, match='1 of 3'):
+        deployer.run(svc)
+    # Non retriable errors should not be retried
+    assert deployer._call.call_count == 3
+
+
+def test_rate_limiter(monkeypatch):
+    clock = {'now': 0.0}
+    monkeypatch.setattr('fairing.deployers.kubernetes.time.time', lambda: clock['now'])
+
+    def sleep(seconds):
+        clock['now'] += seconds
+    monkeypatch.setattr('fairing.deployers.kubernetes.time.sleep', sleep)
+
+    limiter = RateLimiter(max_qps=10, burst=1)
+    for _ in range(11):
+        limiter.acquire()
+    assert clock['now'] == pytest.approx(1.0)
@@ -0,0 +1,80 @@
+import os
+import pytest
+
+from fairing.train import Train
+from fairing.architectures.local.process import LocalProcessArchitecture
+from fairing.strategies.hp import HyperparameterTuning
+from fairing.strategies.pbt import PopulationBasedTraining, MemoryScoreboard
+from fairing.strategies.search import GridSearch
+from fairing.strategies.space import Continuous
+from fairing.strategies.trials import MemoryTrialStore
+
+
+def make_model(output_dir, fail_run=None):
+    @Train(repository='test',
+           architecture=LocalProcessArchitecture(max_workers=2),
+           strategy=HyperparameterTuning(runs=4))
+    class Model(object):
+        def build(self, hp):
+            pass
+
+        def train(self, hp):
+            run_name = os.environ['HOSTNAME']
+            assert os.environ['FAIRING_RUNTIME']
+            if run_name == fail_run:
+                raise ValueError('boom')
+            with open(os.path.join(output_dir, run_name), 'w') as f:
+                f.write(str(os.getpid()))
+
+    return Model()
+
+
+def test_runs_locally(tmpdir):
+    make_model(str(tmpdir)).train()
+
+    runs = sorted(os.listdir(str(tmpdir)))
+    assert runs == ['fairing-job-{}'.format(i) for i in range(4)]
+    pids = set(tmpdir.join(run).read() for run in runs)
+    assert len(pids) == 4
+    assert str(os.getpid()) not in pids
+
+
+def test_reports_failed_runs(tmpdir):
+    with pytest.raises(RuntimeError, match='1 of 4 runs failed: fairing-job-2'):
+        make_model(str(tmpdir), fail_run='fairing-job-2').train()
+    assert len(tmpdir.listdir()) == 3
+
+
+def test_pins_cpus_per_worker():
+    backend = LocalProcessArchitecture(max_workers=2).get_associated_backend()
+    cpu_sets = backend.get_cpu_sets(2)
+    if len(os.sched_getaffinity(0)) >= 2:
+        assert cpu_sets[0] and cpu_sets[1]
+        assert not cpu_sets[0] & cpu_sets[1]
+
+
+def pbt(scoreboard=None):
+    return PopulationBasedTraining('/model', 2, 1, 10, 'pvc', scoreboard=scoreboard, snapshots=False)
+
+
+def hp(trials=None):
+    return HyperparameterTuning(runs=2, space={'x': Continuous(0, 1)}, search=GridSearch(), trials=trials)
+
+
+@pytest.mark.parametrize('strategy', [
+    pbt(),
+    pbt(scoreboard=MemoryScoreboard()),
+    hp(),
+    hp(MemoryTrialStore()),
+])
+def test_requires_shared_stores(strategy):
+    backend = LocalProcessArchitecture().get_associated_backend()
+    with pytest.raises(ValueError):
+        backend.run_training(strategy, None)
+
+
+def test_accepts_shared_stores():
+    backend = LocalProcessArchitecture().get_associated_backend()
+    backend.check_stores(pbt(scoreboard=MemoryScoreboard.shared()))
+    backend.check_stores(hp(MemoryTrialStore.shared()))
+    backend.check_stores(HyperparameterTuning(runs=2))
@@ -0,0 +1,81 @@
+import io
+import os
+import hashlib
+import tarfile
+import importlib
+import pytest
+
+import fairing.metaparticle as mp
+
+
+@pytest.fixture
+def fake_download(monkeypatch):
+    # Archive containing a fake compiler, as released on github
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode='w:gz') as tar:
+        content = b'#!/bin/sh\n'
+        info = tarfile.TarInfo(name='mp-compiler')
+        info.size = len(content)
+        tar.addfile(info, io.BytesIO(content))
+
+    class FakeResponse(object):
+        content = buf.getvalue()
+
+        def raise_for_status(self):
+            pass
+
+    calls = []
+
+    def fake_get(url, **kwargs):
+        calls.append(url)
+        return FakeResponse()
+
+    monkeypatch.setattr('fairing.metaparticle.requests.get', fake_get)
+    monkeypatch.setattr('fairing.metaparticle.platform.system', lambda: 'Linux')
+    monkeypatch.setenv(mp.MP_SHA256_ENV, hashlib.sha256(buf.getvalue()).hexdigest())
+    return calls
+
+
+def test_import_does_not_download(fake_download):
+    importlib.reload(mp)
+    assert fake_download == []
+
+
+def test_compiler_path_override(monkeypatch, tmpdir):
+    compiler = tmpdir.join('mp-compiler')
+    compiler.write('')
+    monkeypatch.setenv(mp.MP_COMPILER_PATH_ENV, str(compiler))
+    assert mp.ensure_metaparticle_present() == str(compiler)
+
+    # An explicit path that doesn't exist should never trigger a download
+    monkeypatch.setenv(mp.MP_COMPILER_PATH_ENV, str(tmpdir.join('missing')))
+    with pytest.raises(RuntimeError):
+        mp.ensure_metaparticle_present()
+
+
+def test_download_on_first_use(fake_download, monkeypatch, tmpdir):
+    monkeypatch.setenv(mp.MP_CACHE_DIR_ENV, str(tmpdir))
+    path = mp.ensure_metaparticle_present()
+    assert path == str(tmpdir.join('mp-compiler'))
+    assert os.access(path, os.X_OK)
+    assert len(fake_download) == 1
+
+    # Once installed, the compiler should not be downloaded again
+    mp.ensure_metaparticle_present()
+    assert len(fake_download) == 1
+
+
+def test_unverified_download(fake_download, monkeypatch, tmpdir):
+    monkeypatch.setenv(mp.MP_CACHE_DIR_ENV, str(tmpdir))
+    monkeypatch.delenv(mp.MP_SHA256_ENV)
+    # Verification is opt-in, the compiler is still installed without a checksum
+    assert os.access(mp.ensure_metaparticle_present(), os.X_OK)
+    assert len(fake_download) == 1
+
+
+def test_checksum_mismatch(fake_download, monkeypatch, tmpdir):
+    monkeypatch.setenv(mp.MP_CACHE_DIR_ENV, str(tmpdir))
+    monkeypatch.setenv(mp.MP_SHA256_ENV, '0' * 64)
+    with pytest.raises(RuntimeError):
+        mp.ensure_metaparticle_present()
+    assert not os.path.exists(str(tmpdir.join('mp-compiler')))
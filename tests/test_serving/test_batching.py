@@ -0,0 +1,102 @@
+import http.client
+import json
+import threading
+import time
+import pytest
+
+from fairing.serving.app import ServingApp, Request
+from fairing.serving.batching import Batcher
+from fairing.serving.metrics import Metrics
+from fairing.serving.server import get_server
+
+
+def predict_concurrently(predict, payloads):
+    results = {}
+
+    def run(payload):
+        try:
+            results[payload] = predict(payload)
+        except Exception as e:
+            results[payload] = e
+
+    threads = [threading.Thread(target=run, args=(p,)) for p in payloads]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    return results
+
+
+def test_batches_are_scattered_back():
+    batches = []
+
+    def double(payloads):
+        batches.append(payloads)
+        time.sleep(0.05)
+        return [p * 2 for p in payloads]
+
+    metrics = Metrics()
+    batcher = Batcher(double, max_batch_size=4, max_latency_ms=200, metrics=metrics)
+    results = predict_concurrently(batcher.predict, range(10))
+
+    assert results == {p: p * 2 for p in range(10)}
+    assert sorted(p for batch in batches for p in batch) == list(range(10))
+    assert max(len(batch) for batch in batches) == 4
+    assert len(batches) < 10
+    assert metrics.get('fairing_serving_batches_total') == len(batches)
+    assert metrics.get('fairing_serving_batched_requests_total') == 10
+
+
+def test_lone_request_waits_at_most_max_latency():
+    batcher = Batcher(lambda payloads: payloads, max_batch_size=32, max_latency_ms=50)
+    start = time.time()
+    assert batcher.predict('x') == 'x'
+    assert time.time() - start < 0.5
+
+
+def test_batch_errors_are_raised_to_every_caller():
+    def fail(payloads):
+        raise RuntimeError('boom')
+
+    results = predict_concurrently(Batcher(fail, max_latency_ms=50).predict, range(3))
+    assert all(isinstance(e, RuntimeError) for e in results.values())
+
+    results = predict_concurrently(Batcher(lambda p: p[:1], max_latency_ms=50).predict, range(3))
+    assert any(isinstance(e, ValueError) for e in results.values())
+
+
+def test_app_passes_payloads():
+    app = ServingApp(lambda payloads: [{'sum': sum(p['x'])} for p in payloads], max_batch_size=8)
+    res = app.handle(Request('POST', '/predict', body=b'{"x": [1, 2, 3]}'))
+    assert (res.status, res.content_type, json.loads(res.body)) == (200, 'application/json', {'sum': 6})
+
+    app = ServingApp(lambda payloads: [p['name'] for p in payloads], max_batch_size=8)
+    res = app.handle(Request('GET', '/predict?name=fairing'))
+    assert (res.status, res.body) == (200, b'fairing')
+    assert app.handle(Request('POST', '/predict', body=b'{not json')).status == 400
+
+
+@pytest.mark.parametrize('engine', ['threaded', 'asyncio'])
+def test_server_batches_requests(engine):
+    sizes = []
+
+    def predict(payloads):
+        sizes.append(len(payloads))
+        return [p['x'] + 1 for p in payloads]
+
+    app = ServingApp(predict, max_batch_size=8, max_latency_ms=200)
+    server = get_server(engine, app, host='127.0.0.1', port=0, workers=8)
+    thread = threading.Thread(target=server.run)
+    thread.start()
+
+    def post(x):
+        conn = http.client.HTTPConnection('127.0.0.1', server.port, timeout=10)
+        conn.request('POST', '/predict', json.dumps({'x': x}), {'Content-Type': 'application/json'})
+        return json.loads(conn.getresponse().read())
+
+    results = predict_concurrently(post, range(8))
+    server.drain()
+    thread.join(10)
+
+    assert results == {x: x + 1 for x in range(8)}
+    assert len(sizes) < 8
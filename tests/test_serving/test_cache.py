@@ -0,0 +1,92 @@
+import io
+import numpy as np
+
+from fairing.serve import Serve
+from fairing.serving.app import ServingApp, Request, Response
+from fairing.serving.cache import PredictionCache, get_cache_key
+import fairing.serving.cache as cache_module
+
+
+def test_cache_key_is_canonical():
+    array = np.arange(6, dtype=np.float64).reshape(2, 3)
+    assert get_cache_key({'a': 1, 'b': [1, 2]}) == get_cache_key({'b': [1, 2], 'a': 1})
+    assert get_cache_key(array) == get_cache_key(np.asfortranarray(array))
+    assert get_cache_key(array) != get_cache_key(array.astype(np.float32))
+    assert get_cache_key(array) != get_cache_key(array.reshape(3, 2))
+    assert get_cache_key(1) != get_cache_key('1')
+    assert get_cache_key([1]) != get_cache_key(1)
+    assert get_cache_key({'x': 1}, 'application/json') != get_cache_key({'x': 1}, 'application/x-npy')
+    assert get_cache_key(object()) is None
+
+
+def test_cache_evicts_least_recently_used():
+    cache = PredictionCache(max_entries=2, max_bytes=10)
+    cache.put('a', Response(200, b'aaa'))
+    cache.put('b', Response(200, b'bbb'))
+    assert cache.get('a').body == b'aaa'
+    cache.put('c', Response(200, b'ccc'))
+    assert cache.get('b') is None
+    assert len(cache) == 2
+
+    # Over max_bytes
+    cache.put('d', Response(200, b'dddddddd'))
+    assert [k for k in 'acd' if cache.get(k)] == ['d']
+    assert cache.bytes == 8
+    cache.put('e', Response(200, b'e' * 11))
+    assert cache.get('e') is None
+
+
+def test_cache_entries_expire(monkeypatch):
+    now = [1000.]
+    monkeypatch.setattr(cache_module.time, 'time', lambda: now[0])
+    cache = PredictionCache(ttl=60)
+    cache.put('a', Response(200, b'a'))
+    now[0] += 59
+    assert cache.get('a') is not None
+    now[0] += 1
+    assert cache.get('a') is None
+    assert len(cache) == 0 and cache.bytes == 0
+
+
+def test_app_caches_predictions():
+    calls = []
+
+    def predict(x):
+        calls.append(x)
+        return np.array([x['x'] * 2])
+
+    app = ServingApp(predict, cache=PredictionCache())
+
+    def post(body, headers=None):
+        headers = dict(headers or {}, **{'content-type': 'application/json'})
+        return app.handle(Request('POST', '/predict', headers, body))
+
+    assert post(b'{"x": 1, "z": 0}').body == b'[2]'
+    assert post(b'{"z": 0, "x": 1}').body == b'[2]'
+    assert len(calls) == 1
+    res = post(b'{"x": 1, "z": 0}', {'accept': 'application/x-npy'})
+    assert res.content_type == 'application/x-npy'
+    np.testing.assert_array_equal(np.load(io.BytesIO(res.body)), [2])
+    assert len(calls) == 2
+
+    metrics = app.handle(Request('GET', '/metrics')).body
+    assert b'fairing_serving_cache_hits_total 1' in metrics
+    assert b'fairing_serving_cache_misses_total 2' in metrics
+    assert b'fairing_serving_cache_entries 2' in metrics
+
+
+def test_failed_predictions_are_not_cached():
+    def fail(x):
+        raise RuntimeError()
+
+    cache = PredictionCache()
+    app = ServingApp(fail, cache=cache)
+    assert app.handle(Request('POST', '/predict', body=b'{}')).status == 500
+    assert len(cache) == 0
+
+
+def test_serve_cache_option():
+    assert Serve({'repository': 'repo', 'name': 'model'}).cache is None
+    assert isinstance(Serve({'repository': 'repo', 'name': 'model'}, cache=True).cache, PredictionCache)
+    cache = PredictionCache(ttl=5)
+    assert Serve({'repository': 'repo', 'name': 'model'}, cache=cache).cache is cache
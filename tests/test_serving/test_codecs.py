@@ -0,0 +1,106 @@
+import io
+import json
+import numpy as np
+import pytest
+
+from fairing.serving.app import ServingApp, Request
+from fairing.serving.codecs import get_codec, negotiate, decode, UnsupportedContentType, JsonCodec, NpyCodec
+
+NPY = 'application/x-npy'
+ARROW = 'application/vnd.apache.arrow.stream'
+
+
+def to_npy(array):
+    stream = io.BytesIO()
+    np.save(stream, array)
+    return stream.getvalue()
+
+
+def post(app, body, content_type, accept=None):
+    headers = {'content-type': content_type}
+    if accept:
+        headers['accept'] = accept
+    return app.handle(Request('POST', '/predict', headers, body))
+
+
+@pytest.mark.parametrize('array', [
+    np.arange(12, dtype=np.float32).reshape(3, 4),
+    np.asfortranarray(np.arange(6, dtype=np.int64).reshape(2, 3)),
+    np.array(3.5),
+])
+def test_npy_is_decoded_without_copy(array):
+    body = to_npy(array)
+    decoded = NpyCodec().decode(body)
+    np.testing.assert_array_equal(decoded, array)
+    assert decoded.dtype == array.dtype
+    # A view of the body
+    assert not decoded.flags.writeable
+    assert np.shares_memory(decoded, np.frombuffer(body, dtype=np.uint8))
+
+
+def test_npy_rejects_objects():
+    with pytest.raises(ValueError):
+        NpyCodec().decode(to_npy(np.array([{}, []], dtype=object)))
+
+
+def test_negotiate():
+    json_codec = get_codec('application/json; charset=utf-8')
+    npy_codec = get_codec(NPY)
+    assert isinstance(json_codec, JsonCodec)
+    assert negotiate(None, json_codec) is json_codec
+    assert negotiate('*/*', npy_codec) is npy_codec
+    assert negotiate('application/json;q=0.5, application/x-npy', json_codec) is npy_codec
+    assert negotiate('text/csv, application/json', npy_codec) is json_codec
+    assert negotiate('text/csv', json_codec) is None
+    assert negotiate('application/x-npy;q=0, */*;q=0.1', json_codec) is json_codec
+
+    with pytest.raises(UnsupportedContentType):
+        decode('text/csv', b'a,b')
+
+
+def test_app_negotiates_content():
+    app = ServingApp(lambda x: np.asarray(x) * 2)
+
+    res = post(app, to_npy(np.ones((2, 2), dtype=np.float32)), NPY)
+    assert res.content_type == NPY
+    np.testing.assert_array_equal(np.load(io.BytesIO(res.body)), np.full((2, 2), 2, dtype=np.float32))
+
+    res = post(app, b'[1, 2]', 'application/json')
+    assert (res.status, res.content_type, json.loads(res.body)) == (200, 'application/json', [2, 4])
+
+    res = post(app, b'[1, 2]', 'application/json', accept=NPY)
+    np.testing.assert_array_equal(np.load(io.BytesIO(res.body)), [2, 4])
+
+    assert post(app, b'[1, 2]', 'application/json', accept='text/csv').status == 406
+    assert post(app, b'a,b', 'text/csv').status == 415
+    assert post(app, b'{not json', 'application/json').status == 400
+
+
+def test_batched_payloads_keep_their_format():
+    app = ServingApp(lambda batch: [np.asarray(x).sum() for x in batch], max_batch_size=4, max_latency_ms=1)
+    res = post(app, to_npy(np.arange(4)), NPY, accept='application/json')
+    assert json.loads(res.body) == 6
+    res = post(app, b'[1, 2]', 'application/json')
+    assert json.loads(res.body) == 3
+
+
+def test_msgpack():
+    msgpack = pytest.importorskip('msgpack')
+    app = ServingApp(lambda x: {'doubled': np.asarray(x['values']) * 2})
+    res = post(app, msgpack.packb({'values': [1, 2]}), 'application/msgpack')
+    assert res.content_type == 'application/msgpack'
+    assert msgpack.unpackb(res.body, raw=False) == {'doubled': [2, 4]}
+
+
+def test_arrow():
+    pa = pytest.importorskip('pyarrow')
+    table = pa.table({'x': np.arange(3, dtype=np.float64)})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write(table)
+
+    app = ServingApp(lambda columns: {'y': columns['x'] + 1})
+    res = post(app, sink.getvalue().to_pybytes(), ARROW)
+    assert res.content_type == ARROW
+    result = pa.ipc.open_stream(res.body).read_all()
+    assert result.column('y').to_pylist() == [1.0, 2.0, 3.0]
@@ -0,0 +1,110 @@
+import json
+import threading
+import time
+from unittest.mock import Mock
+
+from fairing.deployers import KubernetesDeployer
+from fairing.serve import Serve
+from fairing.serving.app import ServingApp, Request
+
+
+class Model(object):
+    loads = 0
+
+    def __init__(self):
+        self.model = None
+        self.batches = []
+
+    def load(self):
+        Model.loads += 1
+        self.model = lambda x: x * 2
+
+    def warmup(self):
+        return [{'x': 0}, {'x': 1}]
+
+    def predict(self, batch):
+        self.batches.append(batch)
+        return [self.model(p['x']) for p in batch]
+
+
+def post(app, payload, path='/predict'):
+    res = app.handle(Request('POST', path, body=bytes(json.dumps(payload), 'utf8')))
+    return res.status, res.body
+
+
+def test_model_is_loaded_and_warmed_up_before_ready():
+    model = Model()
+    app = ServingApp(model.predict, model=model)
+    assert app.handle(Request('GET', '/ready')).status == 503
+    assert post(app, {'x': 1})[0] == 503
+
+    app.start()
+    assert model.batches == [[{'x': 0}, {'x': 1}]]
+    assert app.handle(Request('GET', '/ready')).status == 200
+    assert post(app, {'x': 21}) == (200, b'42')
+    # Without batching, each request is a batch of one
+    assert model.batches[-1] == [{'x': 21}]
+
+    app.drain()
+    assert app.handle(Request('GET', '/ready')).status == 503
+    # Requests still routed to the replica are answered
+    assert post(app, {'x': 1}) == (200, b'2')
+
+
+def test_functions_are_ready_right_away():
+    app = ServingApp(lambda: 'ok')
+    assert app.handle(Request('GET', '/ready')).status == 200
+
+
+def test_serve_class():
+    Model.loads = 0
+    serve = Serve({'repository': 'repo', 'name': 'model'}, max_batch_size=4, workers=4)
+    server = serve.get_server(Model)
+    thread = threading.Thread(target=server.run)
+    thread.start()
+    serve.start(server)
+    assert Model.loads == 1
+
+    results = {}
+    clients = [threading.Thread(target=lambda x=x: results.update({x: post(server.app, {'x': x})}))
+               for x in range(4)]
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join(10)
+    server.drain()
+    thread.join(10)
+
+    assert results == {x: (200, bytes(str(x * 2), 'utf8')) for x in range(4)}
+    assert Model.loads == 1
+
+
+def test_failed_load_drains_the_server():
+    class Broken(Model):
+        def load(self):
+            raise IOError('no model')
+
+    server = Mock()
+    server.app = ServingApp(Broken().predict, model=Broken())
+    Serve({'repository': 'repo', 'name': 'model'}).start(server)
+    server.drain.assert_called_once_with()
+    assert not server.app.ready
+
+
+def test_serve_deploys_readiness_probe(monkeypatch):
+    monkeypatch.delenv('FAIRING_RUNTIME', raising=False)
+    monkeypatch.setattr('fairing.serve.signal.signal', Mock())
+    serve = Serve({'repository': 'repo', 'name': 'model'}, port=9000, deployer='kubernetes')
+    serve.builder = Mock()
+    deployer = serve.get_metaparticle_client()
+    assert isinstance(deployer, KubernetesDeployer)
+    deployer._call = Mock()
+    deployer.logs = Mock()
+    serve.get_metaparticle_client = Mock(return_value=deployer)
+
+    serve(Model)()
+    serve.builder.build.assert_called_once_with('repo/model:latest')
+    created = {c[0][1]['kind']: c[0][1] for c in deployer._call.call_args_list if c[0][0] == 'create'}
+    container = created['Deployment']['spec']['template']['spec']['containers'][0]
+    assert container['readinessProbe'] == {'httpGet': {'path': '/ready', 'port': 9000}}
+    deployer.logs.assert_called_once_with('model')
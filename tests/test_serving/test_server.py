@@ -0,0 +1,162 @@
+import http.client
+import socket
+import threading
+import time
+import pytest
+
+from fairing.serving.app import ServingApp
+from fairing.serving.server import get_server, ThreadedServer, AsyncioServer
+
+ENGINES = ['threaded', 'asyncio']
+
+
+def start_server(engine, func, **kwargs):
+    server = get_server(engine, ServingApp(func), host='127.0.0.1', port=0, **kwargs)
+    thread = threading.Thread(target=server.run)
+    thread.start()
+    return server, thread
+
+
+def stop_server(server, thread):
+    server.drain()
+    thread.join(10)
+    assert not thread.is_alive()
+
+
+def get(server, path='/predict'):
+    conn = http.client.HTTPConnection('127.0.0.1', server.port, timeout=10)
+    conn.request('GET', path)
+    res = conn.getresponse()
+    return res.status, res.read()
+
+
+def send_raw(server):
+    sock = socket.create_connection(('127.0.0.1', server.port), timeout=10)
+    sock.sendall(b'GET /predict HTTP/1.1\r\nHost: localhost\r\n\r\n')
+    return sock
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline
+        time.sleep(0.01)
+
+
+def test_get_server():
+    server = get_server(None, ServingApp(str), host='127.0.0.1', port=0)
+    assert isinstance(server, ThreadedServer)
+    server.server_close()
+    server = get_server('asyncio', ServingApp(str), host='127.0.0.1', port=0)
+    assert isinstance(server, AsyncioServer)
+    server.drain()
+    server.run()
+    with pytest.raises(ValueError):
+        get_server('gevent', ServingApp(str))
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_requests_are_served_concurrently(engine):
+    def predict():
+        time.sleep(0.3)
+        return 'ok'
+
+    server, thread = start_server(engine, predict, workers=4)
+    results = []
+    clients = [threading.Thread(target=lambda: results.append(get(server))) for _ in range(4)]
+    start = time.time()
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join(10)
+    elapsed = time.time() - start
+    stop_server(server, thread)
+
+    assert results == [(200, b'ok')] * 4
+    assert elapsed < 0.9
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_connections_are_kept_alive(engine):
+    server, thread = start_server(engine, lambda: 'ok', workers=1)
+    conn = http.client.HTTPConnection('127.0.0.1', server.port, timeout=10)
+    for _ in range(3):
+        conn.request('GET', '/predict')
+        res = conn.getresponse()
+        assert (res.status, res.read()) == (200, b'ok')
+        assert res.getheader('Connection') is None
+    sock = conn.sock
+    conn.request('GET', '/missing')
+    assert conn.getresponse().status == 404
+    # Same socket for every request
+    assert conn.sock is sock
+    conn.close()
+    stop_server(server, thread)
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_requests_over_the_queue_are_shed(engine):
+    started = threading.Event()
+    release = threading.Event()
+
+    def predict():
+        started.set()
+        release.wait(10)
+        return 'ok'
+
+    server, thread = start_server(engine, predict, workers=1, max_queue=1)
+    first = send_raw(server)
+    assert started.wait(5)
+    second = send_raw(server)
+    wait_until(lambda: 'fairing_serving_queued 1' in server.app.metrics.render())
+
+    third = send_raw(server)
+    assert third.recv(1024).startswith(b'HTTP/1.1 503 Service Unavailable')
+    release.set()
+    assert first.recv(1024).startswith(b'HTTP/1.1 200 OK')
+    assert second.recv(1024).startswith(b'HTTP/1.1 200 OK')
+    for sock in [first, second, third]:
+        sock.close()
+
+    status, metrics = get(server, '/metrics')
+    stop_server(server, thread)
+    assert status == 200
+    assert b'fairing_serving_rejected_total 1' in metrics
+    assert b'fairing_serving_requests_total{code="200"} 2' in metrics
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_drain_answers_pending_requests(engine):
+    started = threading.Event()
+
+    def predict():
+        started.set()
+        time.sleep(0.3)
+        return 'ok'
+
+    server, thread = start_server(engine, predict, workers=2)
+    pending = send_raw(server)
+    assert started.wait(5)
+    server.drain()
+
+    response = pending.recv(1024)
+    assert response.startswith(b'HTTP/1.1 200 OK')
+    assert b'Connection: close' in response
+    pending.close()
+    thread.join(10)
+    assert not thread.is_alive()
+    with pytest.raises(OSError):
+        get(server)
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_drain_closes_idle_connections(engine):
+    server, thread = start_server(engine, lambda: 'ok', keep_alive=30)
+    conn = http.client.HTTPConnection('127.0.0.1', server.port, timeout=10)
+    conn.request('GET', '/predict')
+    assert conn.getresponse().read() == b'ok'
+
+    start = time.time()
+    stop_server(server, thread)
+    assert time.time() - start < 5
+    conn.close()
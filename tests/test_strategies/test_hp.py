@@ -0,0 +1,150 @@
+import pytest
+import numpy as np
+
+from fairing.strategies.hp import HyperparameterTuning
+from fairing.strategies.pruners import MedianStoppingPruner, SuccessiveHalvingPruner
+from fairing.strategies.search import GridSearch, QuasiRandomSearch, TPESearch, halton
+from fairing.strategies.space import SearchSpace, Continuous, Integer, Categorical
+from fairing.strategies.trials import MemoryTrialStore, FileTrialStore, COMPLETED, FAILED, PRUNED
+
+
+@pytest.fixture
+def space():
+    return SearchSpace({
+        'lr': Continuous(1e-4, 1e-1, log=True),
+        'dropout': Continuous(0.0, 0.5),
+        'layers': Integer(1, 4),
+        'optimizer': Categorical(['sgd', 'adam']),
+    })
+
+
+class QuadraticModel(object):
+    def build(self, hp):
+        pass
+
+    def train(self, hp):
+        return (hp['x'] - 0.3) ** 2 + (hp['y'] - 0.7) ** 2
+
+
+def run_search(search, runs, trials=None):
+    trials = trials or MemoryTrialStore()
+    strategy = HyperparameterTuning(runs=runs, space={'x': Continuous(0, 1), 'y': Continuous(0, 1)},
+                                    search=search, trials=trials)
+    for _ in range(runs):
+        strategy.exec_user_code(QuadraticModel())
+    return trials
+
+
+def test_space_round_trip(space):
+    hp = {'lr': 0.01, 'dropout': 0.2, 'layers': 3, 'optimizer': 'adam'}
+    assert space.from_unit(space.to_unit(hp)) == pytest.approx(hp)
+    sample = space.sample(np.random.RandomState(0))
+    assert 1e-4 <= sample['lr'] <= 1e-1
+    assert type(sample['layers']) is int
+    assert sample['optimizer'] in ['sgd', 'adam']
+
+
+def test_grid(space):
+    grid = space.grid(2)
+    assert len(grid) == 2 * 2 * 2 * 2
+    assert {'lr': 1e-4, 'dropout': 0.5, 'layers': 4, 'optimizer': 'sgd'} in grid
+
+
+def test_grid_search_is_exhausted():
+    trials = run_search(GridSearch(points=2), runs=5)
+    assert [t['hp'] for t in trials.get_trials()] == [
+        {'x': 0, 'y': 0}, {'x': 0, 'y': 1}, {'x': 1, 'y': 0}, {'x': 1, 'y': 1}]
+
+
+def test_halton_sequence():
+    assert halton(1, 2) == pytest.approx([0.5, 1.0 / 3])
+    assert halton(2, 2) == pytest.approx([0.25, 2.0 / 3])
+    assert halton(3, 2) == pytest.approx([0.75, 1.0 / 9])
+
+
+def test_quasi_random_search():
+    trials = run_search(QuasiRandomSearch(), runs=8)
+    points = [(t['hp']['x'], t['hp']['y']) for t in trials.get_trials()]
+    assert len(set(points)) == 8
+    assert all(t['state'] == COMPLETED for t in trials.get_trials())
+
+
+def test_tpe_search_beats_quasi_random():
+    tpe = run_search(TPESearch(startup_trials=10), runs=40).get_best_trial()
+    quasi_random = run_search(QuasiRandomSearch(), runs=40).get_best_trial()
+    assert tpe['metric'] < quasi_random['metric']
+    assert tpe['metric'] < 0.005
+
+
+def test_failed_trials_are_recorded():
+    class FailingModel(QuadraticModel):
+        def train(self, hp):
+            raise ValueError('diverged')
+
+    trials = MemoryTrialStore()
+    strategy = HyperparameterTuning(runs=1, space={'x': Continuous(0, 1)},
+                                    search=QuasiRandomSearch(), trials=trials)
+    with pytest.raises(ValueError):
+        strategy.exec_user_code(FailingModel())
+    assert trials.get_trials()[0]['state'] == FAILED
+
+
+def test_file_trial_store(tmpdir):
+    trials = FileTrialStore(str(tmpdir.join('trials.json')))
+    run_search(QuasiRandomSearch(), runs=3, trials=trials)
+    assert [t['id'] for t in trials.get_trials()] == [0, 1, 2]
+    assert trials.claim_trial_id() == 3
+
+
+def test_search_deploys_redis_without_store():
+    from fairing.architectures.native.basic import BasicArchitecture
+    strategy = HyperparameterTuning(runs=2, space={'x': Continuous(0, 1)}, search=GridSearch())
+    strategy.set_architecture(BasicArchitecture())
+    svc, env = strategy.add_training({}, 'test', 'testimage', '1.0', [], [])
+    assert env == [{'name': 'REDIS_HOSTNAME', 'value': 'testimage-redis'}]
+    assert svc['services'][0]['name'] == 'testimage-redis'
+
+
+class CurveModel(object):
+    """Reports quality / step for 8 steps, stops when told to"""
+
+    def __init__(self, quality):
+        self.quality = quality
+        self.steps = 0
+
+    def build(self, hp):
+        pass
+
+    def train(self, hp, reporter):
+        for step in range(1, 9):
+            self.steps = step
+            if reporter(self.quality / float(step)):
+                return
+        return self.quality / 8.0
+
+
+def run_curves(pruner, qualities):
+    trials = MemoryTrialStore()
+    strategy = HyperparameterTuning(runs=len(qualities), pruner=pruner, trials=trials)
+    models = [CurveModel(q) for q in qualities]
+    for model in models:
+        strategy.exec_user_code(model)
+    return trials.get_trials(), [m.steps for m in models]
+
+
+def test_median_stopping():
+    trials, steps = run_curves(MedianStoppingPruner(warmup_steps=2, min_trials=3), [1, 2, 3, 10, 0.5])
+    assert steps == [8, 8, 8, 2, 8]
+    assert [t['state'] for t in trials] == [COMPLETED] * 3 + [PRUNED, COMPLETED]
+    assert trials[3]['metric'] == 5
+    assert trials[4]['metric'] == 0.5 / 8
+
+
+def test_successive_halving():
+    pruner = SuccessiveHalvingPruner(min_resource=1, reduction_factor=2)
+    assert [pruner.get_rung(s) for s in [0, 1, 2, 3, 4, 8]] == [-1, 0, 1, 1, 2, 3]
+
+    trials, steps = run_curves(pruner, [4, 2, 3, 1])
+    # Each trial competes with the ones that reached the same rung before it
+    assert steps == [8, 8, 1, 8]
+    assert trials[2]['state'] == PRUNED
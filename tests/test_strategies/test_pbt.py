@@ -0,0 +1,513 @@
+import json
+import os
+import threading
+import pytest
+import numpy as np
+from unittest.mock import Mock
+
+from fairing.strategies.pbt.pbt import PopulationBasedTraining
+from fairing.strategies.pbt.exploit import Truncation, BinaryTournament, RankedScoreboard
+from fairing.strategies.pbt.explore import Perturb, Resample, member_rng
+from fairing.strategies.pbt.checkpoint import CheckpointStore
+from fairing.strategies.pbt.controller import PopulationController
+from fairing.strategies.pbt.lineage import get_hp_schedule, new_lineage_record
+from fairing.strategies.space import SearchSpace, Continuous, Integer, Categorical
+from fairing.strategies.pbt.scoreboard import RedisScoreboard, FileScoreboard, MemoryScoreboard
+from fairing.strategies.pbt.scoreboard import SCORES_KEY, MEMBERS_KEY, STEPS_KEY, DEFAULT_ASSIGNMENT
+
+
+def make_info(member_id, metric):
+    return {'id': member_id, 'metric': metric, 'step': 10, 'hp': '{}', 'model_path': '/ckpt'}
+
+
+@pytest.fixture
+def redis_client():
+    client = Mock()
+    client.register_script.return_value = Mock()
+    return client
+
+
+def test_commit_is_a_single_transaction(redis_client):
+    scoreboard = RedisScoreboard(client=redis_client)
+    info = make_info('member-1', 0.5)
+    scoreboard.commit(info)
+
+    pipe = redis_client.pipeline.return_value
+    pipe.execute_command.assert_any_call('ZADD', SCORES_KEY, 0.5, 'member-1')
+    pipe.execute_command.assert_any_call('ZADD', STEPS_KEY, 10, 'member-1')
+    pipe.hset.assert_called_once_with(MEMBERS_KEY, 'member-1', json.dumps(info))
+    pipe.publish.assert_called_once()
+    pipe.execute.assert_called_once()
+
+
+def test_nan_metrics_are_ranked_last(redis_client):
+    RedisScoreboard(client=redis_client).commit(make_info('member-1', float('nan')))
+    pipe = redis_client.pipeline.return_value
+    pipe.execute_command.assert_any_call('ZADD', SCORES_KEY, float('inf'), 'member-1')
+
+    scoreboard = MemoryScoreboard()
+    scoreboard.commit(make_info('member-1', float('nan')))
+    scoreboard.commit(make_info('member-2', 0.5))
+    scoreboard.commit(make_info('member-3', float('inf')))
+    ranked, rank = scoreboard.get_scoreboard('member-2')
+    assert [i['id'] for i in ranked][0] == 'member-2'
+    assert rank == 0
+
+
+def test_get_scoreboard_in_one_round_trip(redis_client):
+    script = redis_client.register_script.return_value
+    infos = [make_info('member-2', 0.1), make_info('member-1', 0.5)]
+    script.return_value = [[b'member-2', b'member-1'],
+                           [json.dumps(i).encode('utf8') for i in infos],
+                           1]
+
+    scoreboard, rank = RedisScoreboard(client=redis_client).get_scoreboard('member-1')
+    script.assert_called_once_with(keys=[SCORES_KEY, MEMBERS_KEY], args=['member-1'])
+    assert scoreboard == infos
+    assert rank == 1
+    redis_client.keys.assert_not_called()
+
+
+def test_truncation_uses_given_rank():
+    scoreboard = [make_info('member-{}'.format(i), i) for i in range(10)]
+    model_path, hp = Truncation().exploit('member-0', scoreboard, rank=9)
+    assert model_path == '/ckpt'
+    assert hp == {}
+
+    model_path, hp = Truncation().exploit('member-9', scoreboard, rank=0)
+    assert model_path is None
+
+
+def test_wait_for_wakes_up_on_commits(redis_client):
+    redis_client.zcount.side_effect = [2, 3, 4]
+    pubsub = redis_client.pubsub.return_value
+
+    count = RedisScoreboard(client=redis_client).wait_for(4, min_step=20)
+    assert count == 4
+    redis_client.zcount.assert_called_with(STEPS_KEY, 20, '+inf')
+    assert pubsub.get_message.call_count == 2
+    pubsub.close.assert_called_once()
+
+
+def test_wait_for_times_out(redis_client):
+    redis_client.zcount.return_value = 2
+    count = RedisScoreboard(client=redis_client).wait_for(4, min_step=20, timeout=0)
+    assert count == 2
+
+
+def test_barrier_falls_back_to_quorum():
+    pbt = PopulationBasedTraining('/ckpt/model', 4, 2, 10, 'pvc',
+                                  barrier_timeout=30, quorum=3)
+    pbt.step_count = 20
+    pbt.scoreboard = Mock()
+    pbt.scoreboard.wait_for.side_effect = [2, 3]
+
+    assert pbt.wait_for_population() == 3
+    pbt.scoreboard.wait_for.assert_any_call(4, 20, 30)
+    pbt.scoreboard.wait_for.assert_called_with(3, 20)
+
+
+def test_asynchronous_mode_ignores_stale_members():
+    pbt = PopulationBasedTraining('/ckpt/model', 4, 2, 10, 'pvc',
+                                  synchronous=False, max_staleness=10)
+    pbt.hostname = 'member-2'
+    pbt.step_count = 30
+    pbt.scoreboard = Mock()
+    infos = [make_info('member-{}'.format(i), i) for i in range(4)]
+    for info, step in zip(infos, [10, 30, 40, 20]):
+        info['step'] = step
+    pbt.scoreboard.get_scoreboard.return_value = (infos, 2)
+
+    scoreboard, rank = pbt.get_scoreboard()
+    pbt.scoreboard.wait_for.assert_not_called()
+    assert [info['id'] for info in scoreboard] == ['member-1', 'member-2', 'member-3']
+    assert rank == 1
+
+
+def test_file_scoreboard(tmpdir):
+    scoreboard = FileScoreboard(str(tmpdir.join('scoreboard.json')))
+    scoreboard.commit(make_info('member-1', 0.5))
+    scoreboard.commit(make_info('member-2', 0.1))
+    scoreboard.commit(make_info('member-1', 0.05))
+
+    infos, rank = scoreboard.get_scoreboard('member-2')
+    assert [(i['id'], i['metric']) for i in infos] == [('member-1', 0.05), ('member-2', 0.1)]
+    assert rank == 1
+    assert scoreboard.count(min_step=10) == 2
+    assert scoreboard.wait_for(3, timeout=0) == 2
+
+
+def test_file_scoreboard_lineage(tmpdir):
+    scoreboard = FileScoreboard(str(tmpdir.join('scoreboard.json')))
+    assert scoreboard.get_lineage('member-1') == []
+    scoreboard.append_lineage(new_lineage_record('member-1', 10, 0.5, {'lr': 0.1}))
+    scoreboard.append_lineage(new_lineage_record('member-1', 20, 0.4, {'lr': 0.2}, 'member-2', 10))
+    # A record being written
+    with open(tmpdir.join('scoreboard.json.lineage', 'member-1.jsonl'), 'a') as f:
+        f.write('{"id": "mem')
+
+    lineage = scoreboard.get_lineage('member-1')
+    assert [(r['step'], r['hp'], r['parent']) for r in lineage] == [
+        (10, {'lr': 0.1}, None), (20, {'lr': 0.2}, 'member-2')]
+
+
+def test_redis_lineage(redis_client):
+    scoreboard = RedisScoreboard(client=redis_client)
+    record = new_lineage_record('member-1', 10, 0.5, {'lr': 0.1})
+    scoreboard.append_lineage(record)
+    redis_client.rpush.assert_called_once_with('fairing:pbt:lineage:member-1', json.dumps(record))
+
+    redis_client.lrange.return_value = [json.dumps(record).encode('utf8')]
+    assert scoreboard.get_lineage('member-1') == [record]
+
+
+def test_hp_schedule_follows_parents():
+    scoreboard = MemoryScoreboard()
+    for record in [
+            new_lineage_record('a', 10, 0.3, {'lr': 1}),
+            new_lineage_record('b', 10, 0.2, {'lr': 2}),
+            new_lineage_record('a', 20, 0.1, {'lr': 3}, parent='b', parent_step=10),
+            new_lineage_record('b', 20, 0.5, {'lr': 2}),
+            new_lineage_record('a', 30, 0.05, {'lr': 3}),
+            new_lineage_record('b', 30, 0.4, {'lr': 4}, parent='a', parent_step=20)]:
+        scoreboard.append_lineage(record)
+    scoreboard.commit(make_info('a', 0.05))
+    scoreboard.commit(make_info('b', 0.4))
+
+    schedule = get_hp_schedule(scoreboard)
+    assert [(s['member'], s['start'], s['steps'], s['hp']) for s in schedule] == [
+        ('b', 0, 10, {'lr': 2}), ('a', 10, 10, {'lr': 3}), ('a', 20, 10, {'lr': 3})]
+    schedule = get_hp_schedule(scoreboard, 'b')
+    assert [(s['member'], s['hp']) for s in schedule] == [('b', {'lr': 2}), ('a', {'lr': 3}), ('b', {'lr': 4})]
+    assert get_hp_schedule(MemoryScoreboard()) == []
+
+
+class DummyMember(object):
+    def __init__(self, metric, model_path):
+        self.metric = metric
+        self.model_path = model_path
+        self.restored = None
+        self.built = []
+        self.saves = 0
+
+    def build(self, hp):
+        self.built.append(hp)
+
+    def train(self, steps, reporter, hp):
+        reporter(self.metric)
+
+    def save(self):
+        self.saves += 1
+        write_checkpoint(self.model_path, '{} {}'.format(self.metric, self.saves))
+
+    def restore(self, path):
+        with open(path + '.index') as f:
+            self.restored = (path, f.read())
+
+
+def test_population_without_services(tmpdir):
+    scoreboard = MemoryScoreboard()
+    model_dir = str(tmpdir)
+    members = {m: DummyMember(metric, os.path.join(model_dir, m, 'model'))
+               for m, metric in [('good', 0.1), ('bad', 0.9)]}
+    for member in members.values():
+        os.makedirs(os.path.dirname(member.model_path))
+
+    def run(member_id):
+        pbt = PopulationBasedTraining(members[member_id].model_path, 2, 2, 10, 'pvc',
+                                      barrier_timeout=10, scoreboard=scoreboard)
+        pbt.hostname = member_id
+        pbt.user_object = members[member_id]
+        pbt.training_loop({'lr': 0.1})
+
+    threads = [threading.Thread(target=run, args=(m,)) for m in members]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+
+    infos, _ = scoreboard.get_scoreboard()
+    assert [(i['id'], i['step']) for i in infos] == [('good', 30), ('bad', 30)]
+    assert members['good'].restored is None
+    # The snapshot of the good member is restored, not its live checkpoint
+    path, content = members['bad'].restored
+    assert path == os.path.join(model_dir, 'good', '.snapshots', 'good', '20', 'model')
+    assert content == '0.1 2'
+    assert len(members['bad'].built) == 2
+
+
+@pytest.fixture
+def space():
+    return SearchSpace({
+        'lr': Continuous(1e-4, 1e-1, log=True),
+        'layers': Integer(1, 4),
+        'optimizer': Categorical(['sgd', 'adam']),
+    })
+
+
+def test_perturb_batch_stays_in_bounds(space):
+    population = space.sample_batch(200, np.random.RandomState(0))
+    explored = Perturb(0.5, 2.0, space=space).explore_batch(population, np.random.RandomState(1))
+    assert all(1e-4 <= hp['lr'] <= 1e-1 for hp in explored)
+    assert any(hp['lr'] == 1e-1 for hp in explored)
+    # Discrete hyperparameters are left untouched, the model couldn't be restored
+    assert [(hp['layers'], hp['optimizer']) for hp in explored] == \
+        [(hp['layers'], hp['optimizer']) for hp in population]
+
+
+def test_perturb_without_space():
+    hp = Perturb().explore({'lr': 0.1, 'batch_size': 32}, np.random.RandomState(0))
+    assert 0.08 <= hp['lr'] <= 0.12
+    assert hp['batch_size'] == 32
+
+
+def test_resample(space):
+    population = space.sample_batch(100, np.random.RandomState(0))
+    resampled = Resample(space).explore_batch(population, np.random.RandomState(1))
+    assert all(space.parameters['optimizer'].choices.count(hp['optimizer']) for hp in resampled)
+    assert sum(a['lr'] != b['lr'] for a, b in zip(population, resampled)) == 100
+
+    kept = Resample(space, probability=0).explore_batch(population)
+    assert kept == population
+
+    with pytest.raises(ValueError):
+        Resample().explore({'lr': 0.1})
+
+
+def test_member_streams_are_reproducible():
+    a = member_rng(42, 'member-1').uniform(size=3)
+    assert np.array_equal(a, member_rng(42, 'member-1').uniform(size=3))
+    assert not np.array_equal(a, member_rng(42, 'member-2').uniform(size=3))
+    assert not np.array_equal(a, member_rng(43, 'member-1').uniform(size=3))
+
+
+def test_pbt_samples_initial_hp_from_space(space):
+    pbt = PopulationBasedTraining('/ckpt/model', 4, 2, 10, 'pvc', explorer=Resample(), space=space, seed=1)
+    assert pbt.explorer.space is space
+    pbt.user_object = object()
+    pbt.rng = member_rng(1, 'member-1')
+    assert set(pbt.get_params()) == {'lr', 'layers', 'optimizer'}
+
+
+def test_pbt_requires_space_to_resample(space):
+    with pytest.raises(ValueError):
+        PopulationBasedTraining('/ckpt/model', 4, 2, 10, 'pvc', explorer=Resample())
+    pbt = PopulationBasedTraining('/ckpt/model', 4, 2, 10, 'pvc', explorer=Resample(space))
+    assert pbt.explorer.space is space
+
+
+def test_ranked_scoreboard():
+    scoreboard = RankedScoreboard([make_info('member-{}'.format(i), i) for i in range(5)])
+    assert scoreboard.rank('member-3') == 3
+    assert scoreboard.rank('unknown') is None
+    assert scoreboard[0]['id'] == 'member-0'
+
+
+@pytest.mark.parametrize('bottom, top, copying, donors', [
+    (0.2, 0.2, range(8, 10), range(0, 2)),
+    (0.5, 0.1, range(5, 10), range(0, 1)),
+    (0.3, 0.4, range(7, 10), range(0, 4)),
+])
+def test_truncation_fractions(bottom, top, copying, donors):
+    scoreboard = RankedScoreboard([make_info('member-{}'.format(i), i) for i in range(10)])
+    truncation = Truncation(bottom_fraction=bottom, top_fraction=top)
+    rng = np.random.RandomState(0)
+    for rank in range(10):
+        picked = set(truncation.select_donor(rank, scoreboard, rng)['id']
+                     if rank in copying else None for _ in range(50))
+        if rank in copying:
+            assert picked == {'member-{}'.format(i) for i in donors}
+        else:
+            assert truncation.select_donor(rank, scoreboard, rng) is None
+
+
+def test_binary_tournament():
+    scoreboard = RankedScoreboard([make_info('member-{}'.format(i), i) for i in range(10)])
+    tournament = BinaryTournament()
+    rng = np.random.RandomState(0)
+    assert all(tournament.select_donor(0, scoreboard, rng) is None for _ in range(50))
+
+    donors = [tournament.select_donor(9, scoreboard, rng) for _ in range(200)]
+    assert None not in donors
+    assert {d['id'] for d in donors} == {'member-{}'.format(i) for i in range(9)}
+
+    copies = [tournament.select_donor(5, scoreboard, rng) for _ in range(200)]
+    assert all(d is None or scoreboard.rank(d['id']) < 5 for d in copies)
+    assert 0 < copies.count(None) < 200
+
+
+def write_checkpoint(model_path, content):
+    for suffix in ['.index', '.data-00000-of-00001']:
+        # Written to a new file then renamed, like TensorFlow does
+        with open(model_path + suffix + '.tmp', 'w') as f:
+            f.write(content)
+        os.rename(model_path + suffix + '.tmp', model_path + suffix)
+
+
+def test_snapshots_are_immutable(tmpdir):
+    model_path = str(tmpdir.join('member-1', 'model.ckpt'))
+    os.makedirs(os.path.dirname(model_path))
+    store = CheckpointStore(str(tmpdir.join('snapshots')), keep_last=2)
+
+    write_checkpoint(model_path, 'step 10')
+    snapshot = store.snapshot('member-1', 10, model_path)
+    write_checkpoint(model_path, 'step 20')
+
+    assert sorted(os.listdir(os.path.dirname(snapshot))) == ['model.ckpt.data-00000-of-00001', 'model.ckpt.index']
+    with open(snapshot + '.index') as f:
+        assert f.read() == 'step 10'
+
+
+def test_snapshots_of_directories(tmpdir):
+    # i.e. a SavedModel, with its variables in a sub-directory
+    model_path = str(tmpdir.join('member-1', 'model'))
+    os.makedirs(os.path.join(model_path, 'variables'))
+    store = CheckpointStore(os.path.join(os.path.dirname(model_path), '.snapshots'), keep_last=2)
+
+    def write_model(content):
+        for name in ['saved_model.pb', os.path.join('variables', 'variables.index')]:
+            path = os.path.join(model_path, name)
+            # Replaced, like TensorFlow does, rather than modified in place
+            with open(path + '.tmp', 'w') as f:
+                f.write(content)
+            os.replace(path + '.tmp', path)
+
+    write_model('step 10')
+    snapshot = store.snapshot('member-1', 10, model_path + '/')
+    write_model('step 20')
+
+    assert os.path.basename(snapshot) == 'model'
+    assert sorted(os.listdir(os.path.dirname(snapshot))) == ['model']
+    with open(os.path.join(snapshot, 'variables', 'variables.index')) as f:
+        assert f.read() == 'step 10'
+    with open(os.path.join(snapshot, 'saved_model.pb')) as f:
+        assert f.read() == 'step 10'
+
+
+def test_snapshots_garbage_collection(tmpdir):
+    model_path = str(tmpdir.join('member-1', 'model.ckpt'))
+    os.makedirs(os.path.dirname(model_path))
+    store = CheckpointStore(str(tmpdir.join('snapshots')), keep_last=2)
+
+    snapshots = {}
+    for step in [10, 20]:
+        write_checkpoint(model_path, 'step {}'.format(step))
+        snapshots[step] = store.snapshot('member-1', step, model_path)
+
+    with store.acquire(snapshots[10], 'member-2') as acquired:
+        assert acquired
+        assert store.get_refcount(os.path.dirname(snapshots[10])) == 1
+        write_checkpoint(model_path, 'step 30')
+        snapshots[30] = store.snapshot('member-1', 30, model_path)
+        # Still being read
+        assert os.path.exists(snapshots[10] + '.index')
+
+    write_checkpoint(model_path, 'step 40')
+    store.snapshot('member-1', 40, model_path)
+    assert [os.path.basename(d) for d in store.list_snapshots('member-1')] == ['30', '40']
+
+    with store.acquire(snapshots[10], 'member-2') as acquired:
+        assert not acquired
+    assert not os.path.exists(os.path.dirname(snapshots[10]))
+
+
+def test_population_with_controller(tmpdir, monkeypatch):
+    scoreboard = MemoryScoreboard()
+    model_dir = str(tmpdir)
+    metrics = {'member-{}'.format(i): metric for i, metric in enumerate([0.1, 0.2, 0.3, 0.4, 0.9])}
+    members = {m: DummyMember(metric, os.path.join(model_dir, m, 'model')) for m, metric in metrics.items()}
+    for member in members.values():
+        os.makedirs(os.path.dirname(member.model_path))
+
+    def make_pbt(model_path):
+        return PopulationBasedTraining(model_path, 5, 2, 10, 'pvc', scoreboard=scoreboard,
+                                       snapshots=False, controller=True, seed=1)
+
+    def run(member_id):
+        pbt = make_pbt(members[member_id].model_path)
+        pbt.hostname = member_id
+        pbt.user_object = members[member_id]
+        pbt.training_loop({'lr': 0.1})
+
+    controller = PopulationController(make_pbt(os.path.join(model_dir, 'model')))
+    threads = [threading.Thread(target=run, args=(m,)) for m in members]
+    threads.append(threading.Thread(target=controller.run))
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+
+    for step in [10, 20]:
+        assignments = scoreboard.assignments[step]
+        assert sorted(assignments) == sorted(list(members) + [DEFAULT_ASSIGNMENT])
+        assert [m for m, a in assignments.items() if a['donor']] == ['member-4']
+        assert assignments['member-4']['donor'] == 'member-0'
+    assert members['member-4'].restored[0] == members['member-0'].model_path
+    schedule = get_hp_schedule(scoreboard, 'member-4')
+    assert [(s['member'], s['start']) for s in schedule] == [
+        ('member-0', 0), ('member-0', 10), ('member-4', 20)]
+    assert schedule[-1]['hp'] == members['member-4'].built[-1]
+    assert all(members[m].restored is None for m in members if m != 'member-4')
+    assert len(members['member-4'].built) == 2
+
+
+def test_controller_assigns_late_members(tmpdir):
+    scoreboard = MemoryScoreboard()
+    members = {'member-{}'.format(i): DummyMember(0.1 * (i + 1), str(tmpdir.join('member-{}'.format(i), 'model')))
+               for i in range(4)}
+    for member in members.values():
+        os.makedirs(os.path.dirname(member.model_path))
+
+    def make_pbt(model_path):
+        return PopulationBasedTraining(model_path, 4, 1, 10, 'pvc', scoreboard=scoreboard, snapshots=False,
+                                       controller=True, seed=1, barrier_timeout=0.1, quorum=3)
+
+    def run(member_id):
+        if member_id == 'member-3':
+            # Reports after the controller took its decisions
+            with scoreboard.condition:
+                scoreboard.condition.wait_for(lambda: 10 in scoreboard.assignments, 10)
+        pbt = make_pbt(members[member_id].model_path)
+        pbt.hostname = member_id
+        pbt.user_object = members[member_id]
+        pbt.training_loop({'lr': 0.1})
+
+    controller = PopulationController(make_pbt(str(tmpdir.join('model'))))
+    threads = [threading.Thread(target=run, args=(m,)) for m in members]
+    threads.append(threading.Thread(target=controller.run))
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+
+    assert not any(t.is_alive() for t in threads)
+    assert 'member-3' not in scoreboard.assignments[10]
+    assert scoreboard.get_assignment('member-3', 10)['donor'] is None
+    assert members['member-3'].restored is None
+
+
+def test_redis_default_assignment(redis_client):
+    keep = {'model_path': None, 'hp': None, 'donor': None, 'donor_step': None}
+    redis_client.hmget.return_value = [None, json.dumps(keep).encode('utf8')]
+    assert RedisScoreboard(client=redis_client).get_assignment('member-1', 10) == keep
+    redis_client.hmget.assert_called_once_with('fairing:pbt:assignments:10', 'member-1', DEFAULT_ASSIGNMENT)
+
+def test_members_keep_their_model_without_controller():
+    scoreboard = MemoryScoreboard()
+    pbt = PopulationBasedTraining('/ckpt/model', 2, 1, 10, 'pvc', scoreboard=scoreboard, snapshots=False,
+                                  controller=True, assignment_timeout=0.01)
+    pbt.hostname = 'member-1'
+    pbt.step_count = 10
+    assert pbt.get_assignment() == (None, None)
+
+
+def test_controller_is_deployed():
+    from fairing.architectures.native.basic import BasicArchitecture
+    pbt = PopulationBasedTraining('/ckpt/model', 4, 2, 10, 'pvc', controller=True)
+    pbt.set_architecture(BasicArchitecture())
+    svc, env = pbt.add_training({}, 'repo', 'pbt', 'tag', None, None)
+    assert [job['name'] for job in svc['jobs']] == ['pbt', 'pbt-pbt-controller']
+    container = svc['jobs'][1]['containers'][0]
+    assert container['image'] == 'repo/pbt:tag'
+    assert container['env'] == [{'name': 'FAIRING_PBT_CONTROLLER', 'value': '1'}]
+    assert env == [{'name': 'REDIS_HOSTNAME', 'value': 'pbt-redis'}]
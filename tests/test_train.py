@@ -104,3 +104,21 @@ def test_train(is_runtime_phase, mock_trainer, monkeypatch):
         mock_inst.start_training.assert_called_once()
     else:
         mock_inst.deploy_training.assert_called_once()
+
+
+@pytest.mark.parametrize("image_exists", [True, False])
+def test_deploy_training_content_addressed_tag(image_exists, mock_builder, mock_mp_client, monkeypatch):
+    monkeypatch.setattr(
+        'fairing.train.MetaparticleClient', mock_mp_client)
+    monkeypatch.setattr(
+        'fairing.train.get_container_builder', lambda x: mock_builder)
+    monkeypatch.setattr(
+        'fairing.train.get_content_tag', lambda content, env: 'content-tag')
+    mock_builder.image_exists.return_value = image_exists
+
+    trainer = Trainer(repository=REPO_NAME, content_addressed_tag=True)
+    trainer.deploy_training(stream_logs=False)
+
+    assert trainer.image_tag == 'content-tag'
+    # The build should be skipped entirely when the image already exists
+    assert mock_builder.execute.called != image_exists
@@ -1,6 +1,6 @@
 import pytest
 
-from fairing.utils import is_runtime_phase, get_image_full, get_image
+from fairing.utils import is_runtime_phase, get_image_full, get_image, read_json, update_json
 
 REPO_NAME = 'testrepo'
 IMAGE_NAME = 'fairing-test'
@@ -19,3 +19,14 @@ def test_get_image_full():
 def test_get_image():
     img = get_image(REPO_NAME, IMAGE_NAME)
     assert img == '{}/{}'.format(REPO_NAME, IMAGE_NAME)
+
+
+@pytest.mark.parametrize("fcntl_available", [True, False])
+def test_update_json(fcntl_available, tmpdir, monkeypatch):
+    if not fcntl_available:
+        # i.e. on Windows
+        monkeypatch.setattr('fairing.utils.fcntl', None)
+    path = str(tmpdir.join('state.json'))
+    assert update_json(path, lambda content: content.setdefault('count', 1)) == 1
+    update_json(path, lambda content: content.update(count=content['count'] + 1))
+    assert read_json(path, {}) == {'count': 2}